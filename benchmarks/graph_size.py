@@ -0,0 +1,142 @@
+# graph_size.py
+# Serialized size of the buildCcdImage and classifySegments graphs with band
+# names computed server-side (the previous implementation, kept below for
+# comparison) and planned client-side with coded_python.ccdc.schema.
+# Runs offline from the cached ee algorithm catalogue (see utils/session.py).
+#
+# python benchmarks/graph_size.py [--segments 5] [--algorithms path] [--json out.json]
+import argparse
+import json
+import os
+import sys
+from dataclasses import asdict
+
+import ee
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+from coded_python.ccdc import ccdc
+from coded_python.ccdc import classification
+from coded_python.utils.graph_profile import graph_stats
+from coded_python.utils.session import session
+
+CLASS_BANDS = ['NDFI', 'GV', 'Shade', 'NPV', 'Soil']
+COEFS = ['INTP', 'SIN', 'COS', 'RMSE']
+
+
+# -- server-side band naming, as before the schema planner
+def legacy_buildCcdImage(fit, nSegments, bandList):
+    segmentTag = ccdc.buildSegmentTag(nSegments)
+
+    def flat(suffix, tag):
+        zeros = ee.Image(ee.Array(ee.List.repeat(0, nSegments)))
+
+        def retrieve(band):
+            img = fit.select(band + suffix).arrayCat(zeros, 0).float().arraySlice(0, 0, nSegments)
+            tags = segmentTag.map(lambda x: ee.String(x).cat('_').cat(band).cat(tag))
+            return img.arrayFlatten([tags])
+        return ee.Image(list(map(retrieve, bandList)))
+
+    harmonicTag = ['INTP', 'SLP', 'COS', 'SIN', 'COS2', 'SIN2', 'COS3', 'SIN3']
+    zeros = ee.Image(ee.Array([ee.List.repeat(0, len(harmonicTag))])).arrayRepeat(0, nSegments)
+
+    def retrieveCoefs(band):
+        img = fit.select(band + '_coefs').arrayCat(zeros, 0).float().arraySlice(0, 0, nSegments)
+        tags = segmentTag.map(lambda x: ee.String(x).cat('_').cat(band).cat('_coef'))
+        return img.arrayFlatten([tags, harmonicTag])
+
+    def segmentBands(tag):
+        tags = segmentTag.map(lambda s: ee.String(s).cat('_' + tag))
+        img = fit.select(tag).arrayCat(ee.Array(0).repeat(0, nSegments), 0).float().arraySlice(0, 0, nSegments)
+        return img.arrayFlatten([tags])
+
+    coef = ee.Image(list(map(retrieveCoefs, bandList)))
+    return ee.Image.cat(coef, flat('_rmse', '_RMSE'), flat('_magnitude', '_MAG'),
+                        *[segmentBands(tag) for tag in ['tStart', 'tEnd', 'tBreak', 'changeProb', 'numObs']])
+
+
+def legacy_getInputFeatures(seg, imageToClassify, predictors):
+    _str = ee.String('S').cat(ee.String(str(int(seg)))).cat('_.*')
+    _str2 = ee.String('S').cat(ee.String(str(int(seg)))).cat('_')
+    bands = imageToClassify.select([_str])
+    renamedBands = bands.bandNames().map(lambda bn: ee.String(
+        ee.String(bn).replace('_coef_', '_').replace('_COEF_', '_').split(_str2).get(1)))
+    bands = bands.rename(renamedBands)
+    bands = bands.updateMask(bands.select('tStart').gt(0))
+    bands = ccdc.applyNorm(bands, bands.select('.*tStart'), bands.select('.*tEnd'))
+    sin = bands.select('.*SIN.*')
+    cos = bands.select('.*COS.*')
+    phase = sin.atan2(cos).unitScale(-3.141592653589793, 3.141592653589793).multiply(365)
+    amplitude = sin.hypot(cos)
+    phaseAmp = phase.rename(phase.bandNames().map(lambda x: ee.String(x).replace('_SIN', '_PHASE'))) \
+        .addBands(amplitude.rename(amplitude.bandNames().map(lambda x: ee.String(x).replace('_SIN', '_AMPLITUDE'))))
+    bands = bands.addBands([phaseAmp]).select(predictors)
+    inputFeatures = bands.bandNames().removeAll(['tStart', 'tEnd', 'tBreak', 'changeProb',
+        'BLUE_MAG', 'GREEN_MAG', 'RED_MAG', 'NIR_MAG', 'SWIR1_MAG', 'SWIR2_MAG', 'TEMP_MAG', 'NDFI_MAG'])
+    return [inputFeatures, bands]
+
+
+def legacy_classifySegments(imageToClassify, numberOfSegments, bandNames, trainingData, classifier, coefs):
+    predictors = ee.List(bandNames).map(
+        lambda b: ee.List(coefs).map(lambda i: ee.String(b).cat('_').cat(i))).flatten().cat([])
+    trained = classifier.train(features=trainingData, classProperty='landcover',
+                               inputProperties=legacy_getInputFeatures(1, imageToClassify, predictors)[0])
+
+    def seg_bands(seg):
+        inputFeatures, bands = legacy_getInputFeatures(seg, imageToClassify, predictors)
+        segStr = ee.String('S').cat(ee.String(str(int(seg))))
+        return bands.select(inputFeatures).classify(trained) \
+            .updateMask(imageToClassify.select(segStr.cat('_tStart')).neq(0)) \
+            .rename([segStr.cat('_classification')]).int()
+
+    classified = ee.ImageCollection([seg_bands(i) for i in range(1, numberOfSegments + 1)])
+    bns = ee.List(classified.map(lambda i: i.set('bn', i.bandNames())).aggregate_array('bn')).flatten()
+    return classified.toBands().rename(bns)
+
+
+# -- measurement
+def stats(obj, stage: str) -> dict:
+    return asdict(graph_stats(obj, stage))
+
+
+def measure(nSegments: int) -> dict:
+    fit = ee.Algorithms.TemporalSegmentation.Ccdc(collection=ee.ImageCollection('LANDSAT/LC08/C02/T1_L2'))
+    training = ee.FeatureCollection('projects/python-coded/assets/tests/test_training')
+    classifier = ee.Classifier.smileRandomForest(150)
+
+    legacyImage = legacy_buildCcdImage(fit, nSegments, CLASS_BANDS)
+    plannedImage = ccdc.buildCcdImage(fit, nSegments, CLASS_BANDS)
+    legacyClassified = legacy_classifySegments(legacyImage, nSegments, CLASS_BANDS, training, classifier, COEFS)
+    plannedClassified = classification.classifySegments(
+        plannedImage, nSegments, CLASS_BANDS, ancillary=None, ancillaryFeatures=None, trainingData=training,
+        classifier=classifier, classProperty='landcover', coefs=COEFS, seed=None, subsetTraining=False)
+    return {
+        'buildCcdImage': {'legacy': stats(legacyImage, 'buildCcdImage'),
+                          'planned': stats(plannedImage, 'buildCcdImage')},
+        'classifySegments': {'legacy': stats(legacyClassified, 'classifySegments'),
+                             'planned': stats(plannedClassified, 'classifySegments')},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--segments', type=int, default=5)
+    parser.add_argument('--algorithms', default=None, help='cached ee algorithm catalogue')
+    parser.add_argument('--json', default=None, help='write results to this file')
+    args = parser.parse_args()
+
+    session.initialize_offline(args.algorithms)
+    results = measure(args.segments)
+    print(f'{"graph":<18}{"version":<9}{"nodes":>8}{"bytes":>10}')
+    for name, versions in results.items():
+        for version, stats in versions.items():
+            print(f'{name:<18}{version:<9}{stats["nodes"]:>8}{stats["bytes"]:>10}')
+        print(f'{"":<18}{"ratio":<9}{versions["planned"]["nodes"] / versions["legacy"]["nodes"]:>8.2f}'
+              f'{versions["planned"]["bytes"] / versions["legacy"]["bytes"]:>10.2f}')
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'segments': args.segments, 'results': results}, f, indent=1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+# hot_paths.py
+# Offline timings of the local engines behind every CODED stage at several
+# data scales: unmixing (calcNDFI), QA masking (prepareL*), the CCDC fit,
+# buildCcdImage packing, getMultiCoefs lookups, classifySegments prediction
+# and post_process. Inputs are synthetic, no Earth Engine access is needed.
+#
+# python benchmarks/hot_paths.py [--scales small medium] [--repeat 3] [--json out.json]
+# python benchmarks/hot_paths.py --compare baseline.json [--threshold 0.25]
+#
+# With --compare every case whose median time grew by more than threshold
+# (a fraction) over the baseline is reported and the exit status is 1.
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+from coded_python.ccdc import schema
+from coded_python.ccdc.ccd_image_local import build_ccd_image, get_multi_coefs
+from coded_python.ccdc.ccdc_local import SEGMENT_TAGS, run_ccdc_local, to_ccdc_dates
+from coded_python.ccdc.classification_local import NearestCentroidClassifier, predict_segments, segment_features
+from coded_python.image_collections.simple_cols_local import (NDFI_BANDS, REFLECTANCE_BANDS, calc_ndfi_stack,
+                                                              prepare_landsat_stack)
+from coded_python.post_process_local import post_process_local
+
+# (y, x, scenes)
+SCALES = {
+    'small': (32, 32, 100),
+    'medium': (96, 96, 200),
+    'large': (256, 256, 400),
+}
+CASES = ['calcNDFI', 'prepareL5', 'prepareL7', 'prepareL8', 'ccdc', 'buildCcdImage', 'getMultiCoefs',
+         'classifySegments', 'post_process']
+# same values as simple_cols.NDFIParams defaults
+NDFI_PARAMS = SimpleNamespace(
+    bands=['BLUE', 'GREEN', 'RED', 'NIR', 'SWIR1', 'SWIR2'],
+    gv=[.0500, .0900, .0400, .6100, .3000, .1000],
+    shade=[0, 0, 0, 0, 0, 0],
+    npv=[.1400, .1700, .2200, .3000, .5500, .3000],
+    soil=[.2000, .3000, .3400, .5800, .6000, .5800],
+    cloud=[.9000, .9600, .8000, .7800, .7200, .6500],
+)
+CHANGE = {'lambda': 20 / 10000, 'minObservations': 6, 'chiSquareProbability': .99}
+N_SEGMENTS = 4
+COEFS = ['INTP', 'SIN', 'COS', 'RMSE']
+
+
+def make_inputs(ny, nx, nt, seed=0):
+    rng = np.random.default_rng(seed)
+    days = np.sort(rng.choice(np.arange(20 * 365), nt, replace=False))
+    dates = np.datetime64('2000-01-01') + days.astype('timedelta64[D]')
+    t = to_ccdc_dates(dates)
+    # reflectance mixed from the endmembers, a quarter of the pixels lose forest in 2010
+    gv = 0.6 + 0.1 * np.cos(2 * np.pi * t)[:, None, None] + rng.normal(0, 0.02, (nt, ny, nx))
+    gv[:, :ny // 4][t > 2010] -= 0.4
+    gv = np.clip(gv, 0, 1)
+    endmembers = np.array([NDFI_PARAMS.gv, NDFI_PARAMS.soil])
+    reflectance = np.einsum('kb,tkyx->tbyx', endmembers, np.stack([gv, 1 - gv], axis=1))
+    raw = np.empty((nt, 7, ny, nx), dtype=np.int16)
+    raw[:, :6] = np.rint(reflectance * 10000)
+    raw[:, 6] = 3000
+    cloudy = rng.random((nt, ny, nx)) < 0.2
+    return {
+        'dates': dates,
+        'raw': raw,
+        'pixel_qa': np.where(cloudy, 72, 66).astype(np.uint16),
+        'pixel_qa_l8': np.where(cloudy, 328, 322).astype(np.uint16),
+        'radsat_qa': np.zeros((nt, ny, nx), dtype=np.uint16),
+        'opacity': rng.integers(-1, 350, (nt, ny, nx)).astype(np.int16),
+        'aerosol': rng.choice(np.array([66, 68, 96, 194], dtype=np.uint8), (nt, ny, nx)),
+    }
+
+
+def timed(func, repeat):
+    seconds, result = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        seconds.append(time.perf_counter() - start)
+    return {'seconds': statistics.median(seconds), 'min': min(seconds), 'runs': seconds}, result
+
+
+def measure(scale, repeat=3, cases=CASES):
+    ny, nx, nt = SCALES[scale]
+    data = make_inputs(ny, nx, nt)
+    results = {}
+
+    def run(name, func, times=repeat, needed=True):
+        # cases left out still run once (untimed) when later stages need their output
+        if name not in cases:
+            return func() if needed else None
+        results[name], out = timed(func, times)
+        print(f'{scale:<8}{name:<18}{results[name]["seconds"]:>10.4f} s', flush=True)
+        return out
+
+    raw, qa, radsat = data['raw'], data['pixel_qa'], data['radsat_qa']
+    prepared = run('prepareL5', lambda: prepare_landsat_stack('L5', raw, qa, radsat, data['opacity']))
+    run('prepareL7', lambda: prepare_landsat_stack('L7', raw, qa, radsat, data['opacity']), needed=False)
+    run('prepareL8', lambda: prepare_landsat_stack('L8', raw, data['pixel_qa_l8'], radsat,
+                                                   sr_aerosol=data['aerosol']), needed=False)
+    ndfi = run('calcNDFI', lambda: calc_ndfi_stack(prepared, NDFI_PARAMS, bands=REFLECTANCE_BANDS))
+
+    # the fit is the slowest stage by far, once is enough
+    bands = ['NDFI', 'GV']
+    cube = ndfi[:, [NDFI_BANDS.index(b) for b in bands]]
+    fit = run('ccdc', lambda: run_ccdc_local(cube, data['dates'], bands, CHANGE), times=1)
+    image = run('buildCcdImage', lambda: build_ccd_image(fit, N_SEGMENTS, bands))
+
+    pixels = np.arange(ny * nx)
+    years = 2001 + pixels % 19
+    run('getMultiCoefs', lambda: get_multi_coefs(image, pixels, years, bands, COEFS), needed=False)
+
+    def classify():
+        features, valid, _ = segment_features(image, schema.predictor_bands(bands, COEFS))
+        labels = np.where(features[:, 0] > 0.3, 1, 2)
+        trained = NearestCentroidClassifier().fit(features[::97], labels[::97])
+        return predict_segments(trained, features, valid, image.shape)
+    classification = run('classifySegments', classify)
+
+    tBreak = image.segment[:, :, SEGMENT_TAGS.index('tBreak')].T.reshape((N_SEGMENTS,) + image.shape)
+    mask = np.ones(image.shape, dtype=np.int8)
+    run('post_process', lambda: post_process_local(classification, tBreak, mask, 2005, 2019), needed=False)
+    return {'shape': {'y': ny, 'x': nx, 'scenes': nt}, 'segments': int(fit.offsets[-1]), 'cases': results}
+
+
+def compare(results, baseline, threshold, minSeconds=0.005):
+    '''Cases of results whose median time grew by more than threshold over baseline.
+
+    Cases that stay under minSeconds are timer noise and never flagged.
+    '''
+    regressions = []
+    for scale, measured in results['scales'].items():
+        before = baseline.get('scales', {}).get(scale)
+        if before is None:
+            continue
+        for name, timing in measured['cases'].items():
+            if name not in before['cases']:
+                continue
+            ratio = timing['seconds'] / before['cases'][name]['seconds']
+            if ratio > 1 + threshold and timing['seconds'] >= minSeconds:
+                regressions.append({'scale': scale, 'case': name, 'ratio': ratio,
+                                    'seconds': timing['seconds'], 'baseline': before['cases'][name]['seconds']})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local engine benchmarks')
+    parser.add_argument('--scales', nargs='+', default=['small', 'medium'], choices=list(SCALES))
+    parser.add_argument('--cases', nargs='+', default=CASES, choices=CASES)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--compare', help='baseline results to check for regressions')
+    parser.add_argument('--threshold', type=float, default=0.25, help='allowed slowdown, as a fraction')
+    parser.add_argument('--min-seconds', type=float, default=0.005, help='ignore cases faster than this')
+    args = parser.parse_args()
+
+    results = {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'scales': {scale: measure(scale, args.repeat, args.cases) for scale in args.scales},
+    }
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=1)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold, args.min_seconds)
+        for r in regressions:
+            print(f'REGRESSION {r["scale"]:<8}{r["case"]:<18}{r["seconds"]:.4f} s vs {r["baseline"]:.4f} s '
+                  f'({r["ratio"]:.2f}x)')
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
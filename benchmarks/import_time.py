@@ -0,0 +1,65 @@
+# import_time.py
+# Measure how long importing the package takes in a fresh interpreter and check
+# that importing does not initialize Earth Engine.
+#
+# python benchmarks/import_time.py [--repeat 5] [--json out.json]
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+MODULES = [
+    'coded_python.api',
+    'coded_python.api_v2',
+    'coded_python.params',
+    'coded_python.ccdc.ccdc',
+    'coded_python.ccdc.classification',
+    'coded_python.image_collections.simple_cols',
+    'coded_python.utils.exporting',
+]
+
+PROBE = '''
+import time
+start = time.perf_counter()
+import ee
+ee_done = time.perf_counter()
+for name in {modules!r}:
+    __import__(name)
+done = time.perf_counter()
+print(ee_done - start, done - ee_done, ee.data.is_initialized())
+'''
+
+
+def measure(modules, repeat):
+    runs = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, '-c', PROBE.format(modules=modules)],
+                             cwd=ROOT, capture_output=True, text=True, check=True)
+        ee_seconds, package_seconds, initialized = out.stdout.split()
+        runs.append((float(ee_seconds), float(package_seconds), initialized == 'True'))
+    return {
+        'modules': modules,
+        'repeat': repeat,
+        'eeImportSeconds': statistics.median(r[0] for r in runs),
+        'packageImportSeconds': statistics.median(r[1] for r in runs),
+        'initializedAtImport': any(r[2] for r in runs),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Package import time benchmark')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--json', help='write the result to this file')
+    args = parser.parse_args()
+
+    result = measure(MODULES, args.repeat)
+    print(f"import ee              {result['eeImportSeconds']:.3f} s")
+    print(f"import coded_python.*  {result['packageImportSeconds']:.3f} s")
+    print(f"ee initialized         {result['initializedAtImport']}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(result, f, indent=2)
+    sys.exit(1 if result['initializedAtImport'] else 0)
@@ -2,19 +2,13 @@
 
 # todo: convert dependicies
 # utils = require('projects/GLANCE:ccdcUtilities/api')
-import sys
-import os
-
-container_folder = os.path.abspath(os.path.join(
-    os.path.dirname(__file__), '..'
-))
-sys.path.insert(0, container_folder)
 import ee
 from coded_python.ccdc import ccdc
 from coded_python.ccdc import classification
 from coded_python.image_collections import simple_cols as cs
-
-ee.Initialize()
+from coded_python.utils.graph_profile import GraphProfiler
+from coded_python.utils.session import requires_session
+from coded_python.utils.tracing import Tracer, span
 
 # todo: implement custom ndfi 
 class parameters:
@@ -33,7 +27,7 @@ PARAMTERS = parameters()
 
 # deprecated probally wont need...
 
-
+@requires_session
 def unmix(image: ee.Image, endmembers: dict = None, cloudThreshold: float = None) -> ee.Image:
     '''
     * Spectral unmixing using endmembers from Souza et al., 2005
@@ -69,6 +63,7 @@ def unmix(image: ee.Image, endmembers: dict = None, cloudThreshold: float = None
         .rename(['GV', 'Shade', 'NPV', 'Soil', 'NDFI']) \
         .updateMask(cloudMask)
 
+@requires_session
 def make_class_params(generalParams):
     # // Classification Parameter
     # TODO: clean this and ccdc.classifySegments up so None properties can be removed from dict.
@@ -105,6 +100,7 @@ def make_general_params(params: dict):
     }
     return generalParams
 
+@requires_session
 def make_change_detection_params(params: dict, **kwargs):
     # // CODED Change Detection Parameters
     changeDetectionParams = {
@@ -148,8 +144,12 @@ def build_ccdc_image(output: dict, generalParams: dict):
     output['Layers']['formattedChangeOutput'] = ccdc.buildCcdImage(output['Layers']['rawChangeOutput'],
                                                                    len(generalParams['segs']), generalParams['classBands'])
 
-def prep_samples(samples:ee.FeatureCollection, output:dict, generalParams:dict)-> ee.FeatureCollection:
+def prep_samples(samples:ee.FeatureCollection, output:dict, generalParams:dict, bulk:bool=True)-> ee.FeatureCollection:
     """ prepares sample collection by adding ccdc coefs from the formatted change output"""
+    if bulk:
+        # one coefficient image and reduceRegions per sample year
+        return ccdc.sampleMultiCoefs(output['Layers']['formattedChangeOutput'], samples, generalParams['classBands'],
+                                     generalParams['coefs'], True, generalParams['segs'], 'before')
     # // Get training data coefficients
     def prep_sample(feat: ee.Feature) -> ee.Feature:
         coefsForTraining = ccdc.getMultiCoefs(output['Layers']['formattedChangeOutput'], ee.Image.constant(feat.getNumber('year')),
@@ -234,7 +234,8 @@ def make_stratification(output):
     output['Layers']['Stratification'] = stratification.rename('stratification').int8()
 
 
-def coded(params: dict):
+@requires_session
+def coded(params: dict, profiler: GraphProfiler = None, tracer: Tracer = None):
     '''CODED algorithm
 
     Args:
@@ -249,6 +250,8 @@ def coded(params: dict):
             breakpointBands (list): ????
             startYear (int): CODED start year
             endYear (int): CODED end year
+        profiler (GraphProfiler): optional, records the ee graph size after each stage
+        tracer (Tracer): optional, records the run time and memory of each stage
     Returns:
         [type]: [description]
     '''
@@ -273,7 +276,10 @@ def coded(params: dict):
     # # dev delete later
     # else:
     #     output.Layers['mask'] = ee.Image(1)
-    prep_collection(changeDetectionParams, generalParams)
+    with span(tracer, 'prep_collection'):
+        prep_collection(changeDetectionParams, generalParams)
+    if profiler is not None:
+        profiler.record('prep_collection', changeDetectionParams['collection'])
 
     #
     if generalParams['startYear'] is None:
@@ -283,13 +289,22 @@ def coded(params: dict):
         generalParams['endYear'] = changeDetectionParams['collection'].aggregate_max(
             'year')
     #   // ----------------- Run Analysis
-    run_ccdc(output, changeDetectionParams)
-    build_ccdc_image(output, generalParams)
+    with span(tracer, 'Ccdc'):
+        run_ccdc(output, changeDetectionParams)
+    if profiler is not None:
+        profiler.record('Ccdc', output['Layers']['rawChangeOutput'])
+    with span(tracer, 'buildCcdImage'):
+        build_ccdc_image(output, generalParams)
+    if profiler is not None:
+        profiler.record('buildCcdImage', output['Layers']['formattedChangeOutput'])
     #  Format classification parameters and extract values
     prep = params.get('prepTraining', False)
 
     if prep:
-        classParams['trainingData'] = prep_samples(params.get('training'), output, generalParams)
+        with span(tracer, 'prep_samples'):
+            classParams['trainingData'] = prep_samples(params.get('training'), output, generalParams)
+        if profiler is not None:
+            profiler.record('prep_samples', classParams['trainingData'])
         # TODO how to handel exporting table? do we even want prep training in sepal? prob
         return classParams['trainingData']
     else:
@@ -297,10 +312,20 @@ def coded(params: dict):
     # TODO: note, should prep exit or try to continue?
     classParams['imageToClassify'] = output['Layers']['formattedChangeOutput']
 
-    run_classification(output,generalParams,classParams)
+    with span(tracer, 'run_classification'):
+        run_classification(output,generalParams,classParams)
+    if profiler is not None:
+        profiler.record('run_classification', [output['Layers'][k] for k in ('classificationRaw', 'classification')])
     # // ----------------- Post-process
-    make_degradation_and_deforestation(output, generalParams)
-    make_stratification(output)
+    with span(tracer, 'make_degradation_and_deforestation'):
+        make_degradation_and_deforestation(output, generalParams)
+    if profiler is not None:
+        profiler.record('make_degradation_and_deforestation',
+                        [output['Layers'][k] for k in ('Degradation', 'Deforestation', 'Both')])
+    with span(tracer, 'make_stratification'):
+        make_stratification(output)
+    if profiler is not None:
+        profiler.record('make_stratification', output['Layers']['Stratification'])
 
     return   output
 
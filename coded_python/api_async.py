@@ -0,0 +1,195 @@
+# api_async.py
+# asyncio front end for services that run CODED for many AOIs at once.
+# Building the coded_v2/post_process graphs is local and quick; the time goes
+# into waiting on the server: getInfo, computePixels downloads, starting exports
+# and polling them. The ee client blocks on every one of those, so AsyncRunner
+# hands them to a thread pool and a single event loop keeps dozens of AOI runs
+# in flight, with at most maxConcurrent server calls out at a time.
+#
+#   async def run(name, aoi, runner):
+#       outputs = await coded_v2_async(dict(gen, studyArea=aoi), change, cls, runner)
+#       post = await post_process_async(outputs, runner)
+#       return await runner.export(name, lambda: ee.batch.Export.image.toAsset(post.Stratification, ...))
+#
+#   async with AsyncRunner(maxConcurrent=20) as runner:
+#       statuses = await asyncio.gather(*(run(name, aoi, runner) for name, aoi in aois.items()))
+import asyncio
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List
+
+import ee
+import numpy as np
+
+from coded_python.api_v2 import coded_v2, post_process, split_pixels, tile_request
+from coded_python.params import Output, PostProcess
+from coded_python.utils.exporting import ACTIVE_STATES, EarthEngineExportBackend, LocalExportBackend
+from coded_python.utils.graph_profile import GraphProfiler
+from coded_python.utils.session import requires_session
+from coded_python.utils.tiling import Grid, Tile
+from coded_python.utils.tracing import Tracer
+
+
+class EarthEngineClient:
+    '''The blocking server calls of the ee client.'''
+
+    def __init__(self):
+        self.exports = EarthEngineExportBackend()
+
+    @requires_session
+    def get_info(self, obj):
+        return obj.getInfo()
+
+    @requires_session
+    def compute_pixels(self, request: dict) -> np.ndarray:
+        return ee.data.computePixels(request)
+
+    @requires_session
+    def start_export(self, task, description: str) -> str:
+        return self.exports.start(task, description)
+
+    @requires_session
+    def task_status(self, taskIds: List[str]) -> Dict[str, dict]:
+        return self.exports.status(taskIds)
+
+
+class LocalServer:
+    '''Local stand-in for the ee server used in tests.
+
+    Every call blocks its thread for latency seconds, as the ee client does while
+    it waits on a response. get_info returns evaluate(obj) (obj itself by default),
+    compute_pixels returns pixels(request) and exports go through a
+    LocalExportBackend. maxInFlight is the most calls that were served at once.
+    '''
+
+    def __init__(self, latency: float = .05, evaluate: Callable[[Any], Any] = None,
+                 pixels: Callable[[dict], np.ndarray] = None, exports: LocalExportBackend = None):
+        self.latency = latency
+        self.evaluate = evaluate or (lambda obj: obj)
+        self.pixels = pixels
+        self.exports = exports or LocalExportBackend()
+        self.requests = 0
+        self.inFlight = 0
+        self.maxInFlight = 0
+        self._lock = threading.Lock()
+
+    def _serve(self, func: Callable, *args):
+        with self._lock:
+            self.requests += 1
+            self.inFlight += 1
+            self.maxInFlight = max(self.maxInFlight, self.inFlight)
+        try:
+            time.sleep(self.latency)
+            with self._lock:
+                return func(*args)
+        finally:
+            with self._lock:
+                self.inFlight -= 1
+
+    def get_info(self, obj):
+        return self._serve(self.evaluate, obj)
+
+    def compute_pixels(self, request: dict) -> np.ndarray:
+        return self._serve(self.pixels, request)
+
+    def start_export(self, task, description: str) -> str:
+        return self._serve(self.exports.start, task, description)
+
+    def task_status(self, taskIds: List[str]) -> Dict[str, dict]:
+        return self._serve(self.exports.status, taskIds)
+
+
+class AsyncRunner:
+    '''Awaitable server calls, at most maxConcurrent of them running at once.
+
+    The blocking calls of client run on a thread pool, so the event loop keeps
+    serving other coroutines while they wait. The cap is shared by every
+    coroutine using the runner.
+
+    Args:
+        maxConcurrent (int): most server calls in flight at once
+        client: object with get_info, compute_pixels, start_export and task_status,
+            default EarthEngineClient
+        pollInterval (float): first wait between export status polls, in seconds
+        maxPollInterval (float): polls back off up to this interval while a task does not change
+    '''
+
+    def __init__(self, maxConcurrent: int = 16, client=None, pollInterval: float = 10,
+                 maxPollInterval: float = 300):
+        self.maxConcurrent = maxConcurrent
+        self.client = client or EarthEngineClient()
+        self.pollInterval = pollInterval
+        self.maxPollInterval = maxPollInterval
+        self._executor = ThreadPoolExecutor(max_workers=maxConcurrent, thread_name_prefix='coded')
+        # created on first use, inside the running loop
+        self._slots = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close()
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+
+    async def call(self, func: Callable, *args, **kwargs):
+        '''func(*args, **kwargs) on the thread pool, once one of the maxConcurrent slots is free.'''
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.maxConcurrent)
+        async with self._slots:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    async def get_info(self, obj):
+        return await self.call(self.client.get_info, obj)
+
+    async def compute_pixels(self, request: dict) -> np.ndarray:
+        return await self.call(self.client.compute_pixels, request)
+
+    async def download_tile(self, outputs: Output, grid: Grid, tile: Tile, layers: list,
+                            post: PostProcess = None) -> dict:
+        '''{layer: (bandNames, (band, y, x) array)} of one tile, as coded_v2_tiled downloads it.'''
+        return split_pixels(await self.compute_pixels(tile_request(outputs, post, layers, grid, tile)))
+
+    async def start_export(self, task, description: str) -> str:
+        return await self.call(self.client.start_export, task, description)
+
+    async def wait_export(self, taskId: str) -> dict:
+        '''Poll a task until it leaves the active states, returns its last status.'''
+        interval, state = self.pollInterval, None
+        while True:
+            await asyncio.sleep(interval)
+            status = (await self.call(self.client.task_status, [taskId])).get(taskId, {})
+            if status.get('state') not in ACTIVE_STATES:
+                return status
+            interval = self.pollInterval if status['state'] != state else min(interval * 2, self.maxPollInterval)
+            state = status['state']
+
+    async def export(self, description: str, makeTask: Callable[[], 'ee.batch.Task']) -> dict:
+        '''Start the task makeTask builds and wait for it, returns its final status.
+
+        Failed exports are not resubmitted, see ExportTaskManager for retries.
+        '''
+        taskId = await self.start_export(makeTask(), description)
+        return await self.wait_export(taskId)
+
+
+async def coded_v2_async(input_gen_params: dict, input_change_params: dict, input_class_params: dict,
+                         runner: AsyncRunner, profiler: GraphProfiler = None, tracer: Tracer = None) -> Output:
+    '''coded_v2 on the runner's thread pool.
+
+    With prepTraining coded_v2 waits on the server while the samples are
+    prepped (and the first call waits for the session to connect), so it
+    takes a slot like any other server call.
+    '''
+    return await runner.call(coded_v2, input_gen_params, input_change_params, input_class_params,
+                             profiler=profiler, tracer=tracer)
+
+
+async def post_process_async(outputs: Output, runner: AsyncRunner, profiler: GraphProfiler = None,
+                             tracer: Tracer = None) -> PostProcess:
+    '''post_process on the runner's thread pool.'''
+    return await runner.call(post_process, outputs, profiler=profiler, tracer=tracer)
@@ -1,25 +1,27 @@
+import dataclasses
 from collections import namedtuple
-import sys
-import os
-
-container_folder = os.path.abspath(os.path.join(
-    os.path.dirname(__file__), '..'
-))
-sys.path.insert(0, container_folder)
- 
+
 import ee 
+import numpy as np
 from coded_python.ccdc import ccdc
 from coded_python.ccdc import classification as rf
 from coded_python.image_collections import simple_cols as cs
 from coded_python.params import ClassParams, ChangeDetectionParams, GeneralParams, Output, OutputLayers, PostProcess
+from coded_python.post_process_local import post_process_local
+from coded_python.utils.batching import Batch, Deferred
+from coded_python.utils.cache import ResultCache, cached_getinfo, fingerprint
+from coded_python.utils.graph_profile import GraphProfiler
+from coded_python.utils.session import requires_session, restore_session, session
+from coded_python.utils.tiling import Grid, TiledOutput, run_tiles, stitch
+from coded_python.utils.tracing import Tracer, span
 
-ee.Initialize()
-
+@requires_session
 def prep_collection_v2(change: ChangeDetectionParams, general: GeneralParams):
     change.collection = change.collection \
         .filterBounds(general.studyArea).select(general.classBands) \
         .map(lambda i: i.set('year', i.date().get('year')))
 
+@requires_session
 def run_classification_v2(general: GeneralParams,
         classp :ClassParams):
     #TODO : anywhere NDFI is string maybe replace w breakpoint_bands?
@@ -58,45 +60,62 @@ def run_classification_v2(general: GeneralParams,
     Out = namedtuple('Out',"classificationRaw mask classification magnitude")
     return Out(classificationRaw, mask, classification, magnitude)
 
-def coded_v2(input_gen_params: dict, input_change_params:dict, input_class_params:dict):
+@requires_session
+def coded_v2(input_gen_params: dict, input_change_params:dict, input_class_params:dict,
+             profiler: GraphProfiler = None, tracer: Tracer = None):
     change_params = ChangeDetectionParams(**input_change_params)
     general_params = GeneralParams(**input_gen_params)
 
-    prep_collection_v2(change_params, general_params)    
+    with span(tracer, 'prep_collection_v2'):
+        prep_collection_v2(change_params, general_params)
+    if profiler is not None:
+        profiler.record('prep_collection_v2', change_params.collection)
     # check if start and end year are input
     if general_params.startYear is None:
         general_params.startYear = change_params.get_start_end_from_col('start')
     if general_params.endYear is None:
         general_params.endYear = change_params.get_start_end_from_col('end')
 
-    raw_change = ee.Algorithms.TemporalSegmentation.Ccdc(
-        **{'collection': change_params.collection,
-        'minNumOfYearsScaler' : change_params.minNumOfYearsScaler, 
-        'dateFormat' : change_params.dateFormat,
-        'minObservations' : change_params.minObservations,
-        'chiSquareProbability' : change_params.chiSquareProbability,
-        'lambda' : change_params._lambda}
-        )
+    with span(tracer, 'Ccdc'):
+        raw_change = ee.Algorithms.TemporalSegmentation.Ccdc(
+            **{'collection': change_params.collection,
+            'minNumOfYearsScaler' : change_params.minNumOfYearsScaler, 
+            'dateFormat' : change_params.dateFormat,
+            'minObservations' : change_params.minObservations,
+            'chiSquareProbability' : change_params.chiSquareProbability,
+            'lambda' : change_params._lambda}
+            )
+    if profiler is not None:
+        profiler.record('Ccdc', raw_change)
 
-    formated_change = ccdc.buildCcdImage(
-        raw_change,
-        len(general_params.segs),
-        general_params.classBands,
-        )
+    with span(tracer, 'buildCcdImage'):
+        formated_change = ccdc.buildCcdImage(
+            raw_change,
+            len(general_params.segs),
+            general_params.classBands,
+            )
+    if profiler is not None:
+        profiler.record('buildCcdImage', formated_change)
 
-    # make classification params
+    # make classification params, training is subset to the study area unless
+    # another one is given (tiled mode passes the full study area)
     class_params = ClassParams(
-        **input_class_params,
+        **dict({'studyArea': general_params.studyArea}, **input_class_params),
         imageToClassify=formated_change,
         bandNames=general_params.classBands,
-        studyArea=general_params.studyArea,
         numberOfSegments=len(general_params.segs)
         )
     
     if class_params.prepTraining:
-        class_params.trainingData = class_params.prep_samples(general_params)
+        with span(tracer, 'prep_samples'):
+            class_params.trainingData = class_params.prep_samples(general_params)
+        if profiler is not None:
+            profiler.record('prep_samples', class_params.trainingData)
 
-    out_classification = run_classification_v2(general_params,class_params)
+    with span(tracer, 'run_classification_v2'):
+        out_classification = run_classification_v2(general_params,class_params)
+    if profiler is not None:
+        profiler.record('run_classification_v2', list(out_classification))
 
     output_layers = OutputLayers(
         rawChangeOutput= raw_change,
@@ -167,13 +186,20 @@ def make_stratification(mask:ee.Image,degradation:ee.Image, deforestation:ee.Ima
 
     return stratification.rename('stratification').int8()
 
-def post_process(outputs :Output):
-    DegDefor = make_degradation_and_deforestation(outputs)
+@requires_session
+def post_process(outputs :Output, profiler: GraphProfiler = None, tracer: Tracer = None):
+    with span(tracer, 'make_degradation_and_deforestation'):
+        DegDefor = make_degradation_and_deforestation(outputs)
+    if profiler is not None:
+        profiler.record('make_degradation_and_deforestation', list(DegDefor))
 
-    stratification = make_stratification(mask=outputs.Layers.mask,
-        degradation=DegDefor.Degradation,
-        deforestation= DegDefor.Deforestation,
-        both=DegDefor.Both)
+    with span(tracer, 'make_stratification'):
+        stratification = make_stratification(mask=outputs.Layers.mask,
+            degradation=DegDefor.Degradation,
+            deforestation= DegDefor.Deforestation,
+            both=DegDefor.Both)
+    if profiler is not None:
+        profiler.record('make_stratification', stratification)
     
     return PostProcess(Stratification=stratification,
         Degradation=DegDefor.Degradation,
@@ -184,3 +210,221 @@ def post_process(outputs :Output):
         classificationStudyPeriod = DegDefor.classificationStudyPeriod,
         )
 
+
+# tiled mode
+TILED_LAYERS = ['Stratification', 'Degradation', 'Deforestation', 'Both',
+    'dateOfDeforestation', 'dateOfDegradation']
+# year independent layers post-processing is computed from when caching
+STAGE_LAYERS = ['classification', 'mask', 'tBreak']
+POST_LAYERS = [f.name for f in dataclasses.fields(PostProcess)]
+
+def _encode_params(params: dict) -> dict:
+    # ee objects are sent to workers as serialized graphs
+    encoded = {}
+    for key, value in params.items():
+        if isinstance(value, ee.ComputedObject):
+            value = ('ee', type(value).__name__, ee.serializer.toJSON(value))
+        encoded[key] = value
+    return encoded
+
+def _decode_params(params: dict) -> dict:
+    decoded = {}
+    for key, value in params.items():
+        if isinstance(value, tuple) and len(value) == 3 and value[0] == 'ee':
+            value = getattr(ee, value[1])(ee.deserializer.fromJSON(value[2]))
+        decoded[key] = value
+    return decoded
+
+def _bounds_ring(studyArea, crs: str) -> ee.List:
+    if isinstance(studyArea, ee.FeatureCollection):
+        studyArea = studyArea.geometry()
+    return ee.Geometry(studyArea).transform(crs, 1).bounds(1, crs).coordinates().get(0)
+
+def _ring_bounds(ring: list) -> list:
+    xs = [p[0] for p in ring]
+    ys = [p[1] for p in ring]
+    return [min(xs), min(ys), max(xs), max(ys)]
+
+@requires_session
+def study_area_bounds(studyArea, crs: str, cache: ResultCache = None) -> list:
+    """[xmin, ymin, xmax, ymax] of the study area in crs units (one getInfo)"""
+    return _ring_bounds(cached_getinfo(_bounds_ring(studyArea, crs), cache))
+
+def _tile_layer(name: str, outputs: Output, post):
+    if name == 'tBreak':
+        return outputs.Layers.formattedChangeOutput.select('.*tBreak') \
+            .select(ee.List.sequence(0, len(outputs.General_Parameters.segs) - 2))
+    if name in POST_LAYERS:
+        return getattr(post, name)
+    return getattr(outputs.Layers, name)
+
+def _run_tile(job, tracer: Tracer = None):
+    tile, grid, input_gen_params, input_change_params, input_class_params, layers = job
+    with span(tracer, 'tile', row=tile.row, col=tile.col):
+        general = _decode_params(input_gen_params)
+        # subsetTraining keeps the samples of the full study area, so every tile trains the same classifier
+        classes = dict({'studyArea': general['studyArea']}, **_decode_params(input_class_params))
+        general['studyArea'] = ee.Geometry.Rectangle(grid.tile_bounds(tile), grid.crs, False)
+
+        outputs = coded_v2(general, _decode_params(input_change_params), classes, tracer=tracer)
+        post = post_process(outputs, tracer=tracer) if any(name in POST_LAYERS for name in layers) else None
+
+        with span(tracer, 'computePixels', row=tile.row, col=tile.col) as download:
+            pixels = ee.data.computePixels(tile_request(outputs, post, layers, grid, tile))
+            download.add_bytes(pixels.nbytes)
+    return tile, split_pixels(pixels)
+
+def tile_request(outputs: Output, post, layers: list, grid: Grid, tile) -> dict:
+    """computePixels request for layers of one tile, bands named {layer}__{band}"""
+    images = []
+    for name in layers:
+        image = ee.Image(_tile_layer(name, outputs, post)).toFloat()
+        if name == 'mask':
+            # keep masked pixels apart from a 0 mask value
+            image = image.unmask(-1)
+        images.append(image.regexpRename('^(.*)$', f'{name}__$1'))
+    return {
+        'expression': ee.Image.cat(images).unmask(0),
+        'fileFormat': 'NUMPY_NDARRAY',
+        'grid': grid.pixel_grid(tile),
+    }
+
+def split_pixels(pixels: np.ndarray) -> dict:
+    """{layer: (bandNames, (band, y, x) array)} from a tile_request download"""
+    result = {}
+    for field_name in pixels.dtype.names:
+        name, band = field_name.split('__', 1)
+        result.setdefault(name, ([], []))
+        result[name][0].append(band)
+        result[name][1].append(pixels[field_name])
+    return {name: (bands, np.stack(values)) for name, (bands, values) in result.items()}
+
+def _traced_tile(job):
+    # workers trace into their own Tracer, the events travel back with the tile
+    tracer = Tracer()
+    tile, layers = _run_tile(job, tracer)
+    return tile, layers, tracer.events
+
+def _tile_results(jobs: list, workers: int, tracer: Tracer = None):
+    # workers connect to ee the way this process did (project, credentials or offline)
+    init = {'initializer': restore_session, 'initargs': (session.settings(),)}
+    if tracer is None:
+        yield from run_tiles(_run_tile, jobs, workers, **init)
+        return
+    for tile, layers, events in run_tiles(_traced_tile, jobs, workers, **init):
+        tracer.merge(events)
+        yield tile, layers
+
+def post_process_arrays(stage: dict, startYear: int, endYear: int, forestValue: int = 1) -> dict:
+    """post_process on downloaded STAGE_LAYERS arrays of one tile (see post_process_local).
+
+    Args:
+        stage (dict): {layer: (bandNames, (band, y, x) array)} for STAGE_LAYERS, 0 where masked
+            (-1 for mask)
+        startYear (int): first year of the study period
+        endYear (int): last year of the study period
+        forestValue (int): forest class value
+    Returns:
+        dict: {layer: (bandNames, (band, y, x) float32 array)} for every PostProcess field
+    """
+    classBands, classification = stage['classification']
+    _, tBreak = stage['tBreak']
+    mask = stage['mask'][1][0]
+    post = post_process_local(classification, tBreak, mask, startYear, endYear, forestValue)
+
+    bandNames = {'Stratification': ['stratification'], 'Degradation': ['Degradation'],
+                 'Deforestation': ['Deforestation'], 'Both': ['Degradation']}
+    result = {}
+    for name, values in post.items():
+        bands = bandNames.get(name, classBands)
+        result[name] = (list(bands), values.astype(np.float32).reshape((len(bands),) + mask.shape))
+    return result
+
+def _cached_tiles(cache: ResultCache, key: str, jobs: list, workers: int, tracer: Tracer = None):
+    # serve tiles from the cache and compute the rest on the pool
+    keys = {job[0]: fingerprint(key, job[0]) for job in jobs}
+    missing = []
+    for job in jobs:
+        layers = cache.get(keys[job[0]])
+        if layers is None:
+            missing.append(job)
+        else:
+            yield job[0], layers
+    for tile, layers in _tile_results(missing, workers, tracer):
+        cache.put(keys[tile], layers)
+        yield tile, layers
+
+def coded_v2_tiled(input_gen_params: dict, input_change_params: dict, input_class_params: dict,
+        tileSize: int = 512, workers: int = None, scale: float = 30, crs: str = 'EPSG:3857',
+        layers: list = None, cache: ResultCache = None, tracer: Tracer = None) -> TiledOutput:
+    """Run coded_v2 and post_process tile by tile on a process pool.
+
+    The study area is cut into a grid of tileSize x tileSize pixels. Every tile
+    runs the full chain (prep_collection_v2, Ccdc, buildCcdImage,
+    run_classification_v2, post_process) restricted to its extent, downloads
+    the requested layers and is stitched into full-extent arrays. With
+    subsetTraining the training data is still subset to the full study area.
+
+    With a cache, tiles download the year independent STAGE_LAYERS (plus any
+    requested OutputLayers) and store them under a fingerprint of the
+    parameters without startYear/endYear. PostProcess layers are then computed
+    locally with post_process_arrays, so a new study period reuses every tile.
+
+    Args:
+        input_gen_params (dict): GeneralParams keyword arguments
+        input_change_params (dict): ChangeDetectionParams keyword arguments
+        input_class_params (dict): ClassParams keyword arguments, training data must already be prepped
+        tileSize (int): tile width and height in pixels
+        workers (int): number of worker processes, defaults to the cpu count
+        scale (float): pixel size in crs units
+        crs (str): crs of the output grid
+        layers (list): PostProcess or OutputLayers fields to download, default TILED_LAYERS
+        cache (ResultCache): on-disk cache for tile stages and getInfo values
+        tracer (Tracer): optional, records the stage spans of every tile (from the worker
+            processes) plus the grid and post_process_arrays spans of this one
+    Returns:
+        TiledOutput: stitched float32 (band, y, x) arrays per layer and their grid, 0 where
+            masked (-1 for mask)
+    """
+    if input_class_params.get('prepTraining'):
+        raise ValueError('Tiled mode needs prepped training data, run prep_samples once first')
+    layers = layers or TILED_LAYERS
+
+    general = GeneralParams(**input_gen_params)
+    change = ChangeDetectionParams(**input_change_params)
+    stageKey = fingerprint('coded_v2_tiled', dataclasses.replace(general, startYear=None, endYear=None),
+                           change, input_class_params)
+    # resolve the study period on the full study area so every tile uses the same window,
+    # in the same request as the study area bounds
+    with span(tracer, 'grid'):
+        batch = Batch(cache=cache)
+        ring = batch.defer(_bounds_ring(general.studyArea, crs))
+        if general.startYear is None or general.endYear is None:
+            prep_collection_v2(change, general)
+        years = {}
+        for key in ('startYear', 'endYear'):
+            year = getattr(general, key)
+            if year is None:
+                year = change.get_start_end_from_col(key[:-4])
+            years[key] = batch.defer(year) if isinstance(year, ee.ComputedObject) else year
+        input_gen_params = dict(input_gen_params, **{key: year.get() if isinstance(year, Deferred) else year
+                                                     for key, year in years.items()})
+        grid = Grid.from_bounds(_ring_bounds(ring.get()), crs, scale, tileSize)
+    gen, chg, cls = (_encode_params(p) for p in (input_gen_params, input_change_params, input_class_params))
+    if cache is None:
+        jobs = [(tile, grid, gen, chg, cls, layers) for tile in grid.tiles()]
+        return stitch(grid, _tile_results(jobs, workers, tracer))
+
+    stageLayers = STAGE_LAYERS + [name for name in layers if name not in POST_LAYERS + STAGE_LAYERS]
+    jobs = [(tile, grid, gen, chg, cls, stageLayers) for tile in grid.tiles()]
+    tiles = _cached_tiles(cache, fingerprint(stageKey, grid, stageLayers), jobs, workers, tracer)
+    if not any(name in POST_LAYERS for name in layers):
+        return stitch(grid, ((tile, {name: stage[name] for name in layers}) for tile, stage in tiles))
+
+    def select(tile, stage):
+        with span(tracer, 'post_process_arrays', row=tile.row, col=tile.col):
+            post = post_process_arrays(stage, input_gen_params['startYear'], input_gen_params['endYear'],
+                                       general.forestValue)
+        return tile, {name: post[name] if name in POST_LAYERS else stage[name] for name in layers}
+
+    return stitch(grid, (select(tile, stage) for tile, stage in tiles))
@@ -0,0 +1,205 @@
+# ccd_image_local.py
+# Local counterpart of ccdc.buildCcdImage. Packs ragged CCDC results into one
+# contiguous float32 tensor instead of hundreds of separate named bands.
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from coded_python.ccdc import schema
+from coded_python.ccdc.ccdc_local import CcdcFit, HARMONIC_TAGS, SEGMENT_TAGS
+
+# Last axis of the coefficient tensor: the 8 harmonic coefs, then RMSE and magnitude
+LAYER_TAGS = HARMONIC_TAGS + ['RMSE', 'MAG']
+RMSE = len(HARMONIC_TAGS)
+MAG = RMSE + 1
+
+
+@dataclass
+class CcdImage:
+    '''Dense "long" CCDC image for a (y, x) grid.
+
+    tensor is (pixel, segment, band, LAYER_TAGS) and segment is
+    (pixel, segment, SEGMENT_TAGS). Segments a pixel does not have are zero,
+    as with the arrayCat(zeros) padding of buildCcdImage. Flat band names such as
+    'S1_GV_coef_INTP', 'S2_NDFI_MAG' or 'S1_tStart' resolve to zero-copy (y, x) views.
+    '''
+    shape: Tuple[int, int]
+    segs: List[str]
+    bandList: List[str]
+    tensor: np.ndarray
+    segment: np.ndarray
+
+    @property
+    def nbytes(self) -> int:
+        return self.tensor.nbytes + self.segment.nbytes
+
+    def bandNames(self) -> List[str]:
+        '''Band names in the same order as ccdc.buildCcdImage.'''
+        return schema.ccd_image_bands(len(self.segs), self.bandList)
+
+    def index(self, name: str) -> tuple:
+        '''Array and index of a flat band name, e.g. 'S1_GV_coef_INTP' -> ('tensor', 0, <GV>, 0).'''
+        seg, rest = name.split('_', 1)
+        s = self.segs.index(seg)
+        if rest in SEGMENT_TAGS:
+            return ('segment', s, SEGMENT_TAGS.index(rest))
+        band, tag = rest.rsplit('_', 1)
+        if band.endswith('_coef'):
+            band = band[:-len('_coef')]
+        return ('tensor', s, self.bandList.index(band), LAYER_TAGS.index(tag))
+
+    def band(self, name: str) -> np.ndarray:
+        '''Zero-copy (y, x) view of a single flat band.'''
+        where, *idx = self.index(name)
+        source = self.tensor if where == 'tensor' else self.segment
+        return source[(slice(None), *idx)].reshape(self.shape)
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.band(name)
+
+    def select(self, pattern: str) -> Dict[str, np.ndarray]:
+        '''Views of every band whose name matches the regex, like ee.Image.select.'''
+        regex = re.compile(pattern)
+        return {name: self.band(name) for name in self.bandNames() if regex.fullmatch(name)}
+
+
+def segment_index(offsets: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    '''Pixel and within-pixel segment number for every row of a ragged result.'''
+    counts = np.diff(offsets)
+    pixel = np.repeat(np.arange(len(counts)), counts)
+    seg = np.arange(offsets[-1]) - np.repeat(offsets[:-1], counts)
+    return pixel, seg
+
+
+def build_ccd_image(fit: CcdcFit, nSegments: int, bandList: List[str]) -> CcdImage:
+    '''Transform local CCDC results into the dense "long" format.
+
+    Args:
+        fit (CcdcFit): ragged results from ccdc_local.run_ccdc_local
+        nSegments (int): number of segments to keep (later segments are dropped)
+        bandList (list): bands to include, e.g. general.classBands
+    Returns:
+        CcdImage: float32 tensor holding every band of ccdc.buildCcdImage
+    '''
+    npix = fit.shape[0] * fit.shape[1]
+    pixel, seg = segment_index(fit.offsets)
+    keep = seg < nSegments
+    pixel, seg = pixel[keep], seg[keep]
+
+    tensor = np.zeros((npix, nSegments, len(bandList), len(LAYER_TAGS)), dtype=np.float32)
+    for b, band in enumerate(bandList):
+        tensor[pixel, seg, b, :RMSE] = fit[f'{band}_coefs'][keep]
+        tensor[pixel, seg, b, RMSE] = fit[f'{band}_rmse'][keep]
+        tensor[pixel, seg, b, MAG] = fit[f'{band}_magnitude'][keep]
+
+    segment = np.zeros((npix, nSegments, len(SEGMENT_TAGS)), dtype=np.float32)
+    for k, tag in enumerate(SEGMENT_TAGS):
+        segment[pixel, seg, k] = fit[tag][keep]
+
+    segs = schema.segment_tags(nSegments)
+    return CcdImage(shape=fit.shape, segs=segs, bandList=list(bandList), tensor=tensor, segment=segment)
+
+
+def _flat_pixels(image: CcdImage, pixels) -> np.ndarray:
+    # Accept flat pixel indices or a (rows, cols) pair
+    if isinstance(pixels, tuple):
+        return np.ravel_multi_index(tuple(np.asarray(p) for p in pixels), image.shape)
+    return np.asarray(pixels, dtype=np.int64)
+
+
+def find_segments(image: CcdImage, pixels, dates, behavior: str = 'normal') -> np.ndarray:
+    '''Segment index for each (pixel, date) query, -1 where no segment matches.
+
+    Same rules as ccdc.filterCoefs: 'normal' picks the segment containing the
+    date, 'after' the first segment ending after it, 'before' the last segment
+    starting before it, and 'auto' uses 'after' and falls back to 'before'.
+    Segments are sorted in time, so counting the boundaries on either side of the
+    date is a batched searchsorted over all queries at once.
+    '''
+    pixels = _flat_pixels(image, pixels)
+    dates = np.broadcast_to(np.asarray(dates, dtype=np.float32), pixels.shape)[:, None]
+    tStart = image.segment[pixels, :, SEGMENT_TAGS.index('tStart')]
+    tEnd = image.segment[pixels, :, SEGMENT_TAGS.index('tEnd')]
+    real = tStart != 0
+    nReal = real.sum(axis=1)
+
+    if behavior == 'normal':
+        seg = (real & (tStart <= dates)).sum(axis=1) - 1
+        inside = np.take_along_axis(tEnd, np.maximum(seg, 0)[:, None], axis=1)[:, 0] >= dates[:, 0]
+        return np.where((seg >= 0) & inside, seg, -1)
+    if behavior == 'after':
+        seg = (real & (tEnd <= dates)).sum(axis=1)
+        return np.where(seg < nReal, seg, -1)
+    if behavior == 'before':
+        return (real & (tStart < dates)).sum(axis=1) - 1
+    if behavior == 'auto':
+        after = find_segments(image, pixels, dates[:, 0], 'after')
+        return np.where(after >= 0, after, find_segments(image, pixels, dates[:, 0], 'before'))
+    raise ValueError(f'Unknown behavior: {behavior}')
+
+
+def coef_names(bandList: List[str], coef_list: List[str]) -> List[str]:
+    '''Output names of get_multi_coefs, in the order ccdc.getMultiCoefs returns them.'''
+    return [f'{band}_{coef}' for coef in coef_list for band in bandList]
+
+
+def get_multi_coefs(image: CcdImage, pixels, dates, bandList: List[str], coef_list: List[str],
+                    cond: bool = True, behavior: str = 'auto') -> Tuple[np.ndarray, List[str]]:
+    '''Batched local counterpart of ccdc.getMultiCoefs.
+
+    Args:
+        image (CcdImage): dense CCDC results
+        pixels: flat pixel indices (q,) or a (rows, cols) pair
+        dates: query dates (q,) or a scalar, in the dateFormat CCDC was run with
+        bandList (list): bands to include
+        coef_list (list): coefs to select from "INTP", "SLP", "COS", "SIN", "COS2",
+            "SIN2", "COS3", "SIN3", "RMSE", "MAG"
+        cond (bool): normalize intercepts to the middle of the segment ('auto' always does)
+        behavior (str): 'normal', 'before', 'after' or 'auto', see find_segments
+    Returns:
+        tuple: float32 values (q, len(coef_list) * len(bandList)), NaN where no segment
+            matches, and their names from coef_names
+    '''
+    pixels = _flat_pixels(image, pixels)
+    seg = find_segments(image, pixels, dates, behavior)
+    found = seg >= 0
+    seg = np.maximum(seg, 0)
+
+    bands = np.array([image.bandList.index(b) for b in bandList])
+    coefs = np.array([LAYER_TAGS.index(c) for c in coef_list])
+    # One indexed read for every band x coef of every query: (q, coef, band)
+    values = image.tensor[pixels[:, None, None], seg[:, None, None], bands[None, None, :], coefs[None, :, None]]
+
+    if (cond or behavior == 'auto') and 'INTP' in coef_list:
+        dates_ = image.segment[pixels, seg]
+        middle = (dates_[:, SEGMENT_TAGS.index('tStart')] + dates_[:, SEGMENT_TAGS.index('tEnd')]) / 2
+        slope = image.tensor[pixels[:, None], seg[:, None], bands[None, :], LAYER_TAGS.index('SLP')]
+        values[:, coef_list.index('INTP')] += slope * middle[:, None]
+
+    values = values.reshape(len(pixels), -1)
+    values[~found] = np.nan
+    return values, coef_names(bandList, coef_list)
+
+
+def sample_multi_coefs(image: CcdImage, rows, cols, dates, bandList: List[str], coef_list: List[str],
+                       cond: bool = True, behavior: str = 'before') -> Dict[str, np.ndarray]:
+    '''Local counterpart of ccdc.sampleMultiCoefs for point samples.
+
+    Samples of every date are read together with one indexed gather, rows and
+    cols index the image grid (see tiling.Grid.pixel_index).
+
+    Returns:
+        dict: {name: (q,) values} for every coef_names column, NaN for samples
+            outside the grid or without a matching segment
+    '''
+    rows, cols = np.asarray(rows), np.asarray(cols)
+    dates = np.broadcast_to(np.asarray(dates, dtype=np.float32), rows.shape)
+    inside = (rows >= 0) & (rows < image.shape[0]) & (cols >= 0) & (cols < image.shape[1])
+    names = coef_names(bandList, coef_list)
+    values = np.full((len(rows), len(names)), np.nan, dtype=np.float32)
+    if inside.any():
+        values[inside], _ = get_multi_coefs(image, (rows[inside], cols[inside]), dates[inside],
+                                            bandList, coef_list, cond, behavior)
+    return {name: values[:, k] for k, name in enumerate(names)}
@@ -0,0 +1,195 @@
+# ccd_store.py
+# Compact on-disk archive of CCDC results. The dense buildCcdImage layout pads
+# every pixel to nSegments, so a country-scale archive is mostly zeros. Here
+# each spatial tile keeps the ragged layout of the ee algorithm (offsets plus
+# one row per real segment), values are quantized to int16 and the tile is
+# written as one compressed .npz. Tiles expand back to CcdcFit or the dense
+# CcdImage on demand.
+#
+# <path>/index.json      band names, shape, tile size and dateFormat
+# <path>/y{i}_x{j}.npz   tile (i, j): local offsets, int16 fields and their scales
+#
+# Quantization, per field:
+#   tStart, tEnd, tBreak   one day per step around 2000-01-01 (about 1910-2090)
+#   numObs                 stored as is
+#   everything else        per tile and column, max |value| / 32767 per step
+# Intercepts are stored at the middle of the segment (as ccdc.applyNorm), so
+# the normalized intercepts the classifier uses do not pick up the slope's
+# rounding error times the date.
+import json
+import os
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Tuple
+
+import numpy as np
+
+from coded_python.ccdc.ccd_image_local import CcdImage, build_ccd_image
+from coded_python.ccdc.ccdc_local import UNITS_PER_YEAR, CcdcFit, to_ccdc_dates
+from coded_python.ccdc.schema import HARMONIC_TAGS, SEGMENT_TAGS
+from coded_python.utils.tiling import tile_counts, tile_shape, tile_slices
+
+INDEX = 'index.json'
+INT16_MAX = 32767
+# exact zero, e.g. the tBreak of a last segment that never broke
+ZERO = -32768
+DATE_TAGS = ('tStart', 'tEnd', 'tBreak')
+INTP, SLP = HARMONIC_TAGS.index('INTP'), HARMONIC_TAGS.index('SLP')
+
+
+def _quantize(values: np.ndarray, scale, offset) -> np.ndarray:
+    q = np.rint((values - offset) / scale)
+    np.clip(q, -INT16_MAX, INT16_MAX, out=q)
+    q = q.astype(np.int16)
+    q[values == 0] = ZERO
+    return q
+
+
+def _dequantize(q: np.ndarray, scale, offset, dtype) -> np.ndarray:
+    values = (q * np.asarray(scale, dtype=np.float64) + offset).astype(dtype)
+    values[q == ZERO] = 0
+    return values
+
+
+def _column_scale(values: np.ndarray) -> np.ndarray:
+    scale = np.abs(values).max(axis=0, initial=0) / INT16_MAX
+    return np.where(scale > 0, scale, 1).astype(np.float64)
+
+
+def _gather(fit: CcdcFit, pixels: np.ndarray) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+    # ragged rows of the given flat pixels, in that order
+    counts = np.diff(fit.offsets)[pixels]
+    offsets = np.zeros(len(pixels) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    rows = np.repeat(fit.offsets[pixels] - offsets[:-1], counts) + np.arange(offsets[-1])
+    return offsets, {name: values[rows] for name, values in fit.bands.items()}
+
+
+@dataclass
+class CcdStore:
+    path: str
+    bandNames: List[str]
+    shape: Tuple[int, int]
+    tileSize: Tuple[int, int]
+    dateFormat: int = 1
+
+    # -- creation and writing
+    @classmethod
+    def create(cls, path: str, bandNames: List[str], shape: Tuple[int, int],
+               tileSize: Tuple[int, int] = (256, 256), dateFormat: int = 1) -> 'CcdStore':
+        '''Create an empty store for CCDC results on a (y, x) grid.'''
+        os.makedirs(path, exist_ok=True)
+        if os.path.exists(os.path.join(path, INDEX)):
+            raise FileExistsError(f'A CCDC store already exists at {path}')
+        store = cls(path=path, bandNames=list(bandNames), shape=tuple(shape), tileSize=tuple(tileSize),
+                    dateFormat=dateFormat)
+        index = {'bandNames': store.bandNames, 'shape': list(store.shape), 'tileSize': list(store.tileSize),
+                 'dateFormat': dateFormat}
+        with open(os.path.join(path, INDEX), 'w') as f:
+            json.dump(index, f)
+        return store
+
+    @classmethod
+    def open(cls, path: str) -> 'CcdStore':
+        with open(os.path.join(path, INDEX)) as f:
+            index = json.load(f)
+        return cls(path=path, bandNames=index['bandNames'], shape=tuple(index['shape']),
+                   tileSize=tuple(index['tileSize']), dateFormat=index['dateFormat'])
+
+    def write(self, fit: CcdcFit) -> None:
+        '''Split CCDC results for the full grid into tiles and write them.'''
+        if tuple(fit.shape) != self.shape:
+            raise ValueError(f'Expected results for a {self.shape} grid, got {fit.shape}')
+        grid = np.arange(self.shape[0] * self.shape[1]).reshape(self.shape)
+        for i, j, ys, xs in self.tiles():
+            offsets, bands = _gather(fit, grid[ys, xs].reshape(-1))
+            self._write_tile(i, j, offsets, bands)
+
+    def write_tile(self, i: int, j: int, fit: CcdcFit) -> None:
+        '''Write CCDC results computed for tile (i, j) alone.'''
+        if tuple(fit.shape) != self.tile_shape(i, j):
+            raise ValueError(f'Expected results for a {self.tile_shape(i, j)} tile, got {fit.shape}')
+        self._write_tile(i, j, fit.offsets, fit.bands)
+
+    def _write_tile(self, i: int, j: int, offsets: np.ndarray, bands: Dict[str, np.ndarray]) -> None:
+        epoch, day = self._date_codec()
+        dates = {tag: np.asarray(bands[tag], dtype=np.float64) for tag in DATE_TAGS}
+        middle = (dates['tStart'] + dates['tEnd']) / 2
+        arrays = {'offsets': np.asarray(offsets, dtype=np.int64)}
+        for tag in DATE_TAGS:
+            arrays[tag] = _quantize(dates[tag], day, epoch)
+        arrays['numObs'] = np.clip(bands['numObs'], 0, INT16_MAX).astype(np.int16)
+        for name, values in bands.items():
+            if name in DATE_TAGS or name == 'numObs':
+                continue
+            values = np.array(values, dtype=np.float64)
+            if name.endswith('_coefs'):
+                values[:, INTP] += values[:, SLP] * middle
+            scale = _column_scale(values)
+            arrays[name] = _quantize(values, scale, 0)
+            arrays[name + '__scale'] = scale
+
+        tmp = self._tile_path(i, j) + '.tmp'
+        with open(tmp, 'wb') as f:
+            np.savez_compressed(f, **arrays)
+        os.replace(tmp, self._tile_path(i, j))
+
+    # -- layout
+    @property
+    def nTiles(self) -> Tuple[int, int]:
+        return tile_counts(self.shape, self.tileSize)
+
+    def tiles(self) -> Iterator[Tuple[int, int, slice, slice]]:
+        '''Tile indices and the (y, x) slices they cover.'''
+        return tile_slices(self.shape, self.tileSize)
+
+    def tile_shape(self, i: int, j: int) -> Tuple[int, int]:
+        return tile_shape(self.shape, self.tileSize, i, j)
+
+    def _tile_path(self, i: int, j: int) -> str:
+        return os.path.join(self.path, f'y{i}_x{j}.npz')
+
+    def _date_codec(self) -> Tuple[float, float]:
+        # offset and step of the date fields: 2000-01-01 and one day in dateFormat units
+        epoch = float(to_ccdc_dates(np.array(['2000-01-01'], dtype='datetime64[D]'), self.dateFormat)[0])
+        return epoch, UNITS_PER_YEAR[self.dateFormat] / 365.25
+
+    def nbytes(self) -> int:
+        '''Size of the store on disk.'''
+        return sum(os.path.getsize(os.path.join(self.path, name)) for name in os.listdir(self.path))
+
+    # -- reading
+    def read_tile(self, i: int, j: int) -> CcdcFit:
+        '''Ragged CCDC results of tile (i, j), no segments if it was never written.'''
+        shape = self.tile_shape(i, j)
+        if not os.path.exists(self._tile_path(i, j)):
+            return CcdcFit(shape=shape, offsets=np.zeros(shape[0] * shape[1] + 1, dtype=np.int64),
+                           bands=self._empty_bands(), bandNames=list(self.bandNames), dateFormat=self.dateFormat)
+
+        epoch, day = self._date_codec()
+        with np.load(self._tile_path(i, j)) as chunk:
+            bands = {tag: _dequantize(chunk[tag], day, epoch, np.float64) for tag in DATE_TAGS}
+            bands['numObs'] = chunk['numObs'].astype(np.float64)
+            for name in chunk.files:
+                if name in bands or name == 'offsets' or name.endswith('__scale'):
+                    continue
+                bands[name] = _dequantize(chunk[name], chunk[name + '__scale'], 0, np.float32)
+            offsets = chunk['offsets']
+
+        middle = (bands['tStart'] + bands['tEnd']) / 2
+        for band in self.bandNames:
+            coefs = bands[f'{band}_coefs']
+            coefs[:, INTP] -= coefs[:, SLP] * middle
+        return CcdcFit(shape=shape, offsets=offsets, bands=bands, bandNames=list(self.bandNames),
+                       dateFormat=self.dateFormat)
+
+    def _empty_bands(self) -> Dict[str, np.ndarray]:
+        bands = {tag: np.zeros(0) for tag in SEGMENT_TAGS}
+        for band in self.bandNames:
+            bands[f'{band}_coefs'] = np.zeros((0, len(HARMONIC_TAGS)), dtype=np.float32)
+            bands[f'{band}_rmse'] = np.zeros(0, dtype=np.float32)
+            bands[f'{band}_magnitude'] = np.zeros(0, dtype=np.float32)
+        return bands
+
+    def read_ccd_image(self, i: int, j: int, nSegments: int, bandList: List[str] = None) -> CcdImage:
+        '''Tile (i, j) expanded to the dense buildCcdImage layout.'''
+        return build_ccd_image(self.read_tile(i, j), nSegments, bandList or self.bandNames)
@@ -11,7 +11,8 @@
 #         buildSegmentTag
 import math
 import ee
-ee.Initialize()
+from coded_python.ccdc import schema
+from coded_python.utils.session import requires_session
 
 # /**
 #  * Normalize the intercept to the middle of the segment time period, instead
@@ -145,16 +146,14 @@ def buildBandTag(tag, bandList):
 
 
 def buildMagnitude(fit, nSegments, bandList):
-    segmentTag = buildSegmentTag(nSegments)
-    zeros = ee.Image(ee.Array(ee.List.repeat(0, nSegments)))
+    zeros = ee.Image(ee.Array([0] * nSegments))
     # // Pad zeroes for pixels that have less than nSegments and then slice the first nSegment values
 
     def retrieveMags(band):
         magImg = fit.select(band + '_magnitude').arrayCat(zeros,
                                                           0).float().arraySlice(0, 0, nSegments)
-        tags = segmentTag.map(lambda x: ee.String(
-            x).cat('_').cat(band).cat('_MAG'))
-        return magImg.arrayFlatten([tags])
+        # band names are planned client-side
+        return magImg.arrayFlatten([schema.magnitude_bands(nSegments, [band])])
 
     return ee.Image(list(map(retrieveMags, bandList)))
 
@@ -168,16 +167,13 @@ def buildMagnitude(fit, nSegments, bandList):
 
 
 def buildRMSE(fit, nSegments, bandList):
-    segmentTag = buildSegmentTag(nSegments)
-    zeros = ee.Image(ee.Array(ee.List.repeat(0, nSegments)))
+    zeros = ee.Image(ee.Array([0] * nSegments))
     # // Pad zeroes for pixels that have less than 6 segments and then slice the first 6 values
 
     def retrieveMags(band):
         magImg = fit.select(band + '_rmse').arrayCat(zeros,
                                                      0).float().arraySlice(0, 0, nSegments)
-        tags = segmentTag.map(lambda x: ee.String(
-            x).cat('_').cat(band).cat('_RMSE'))
-        return magImg.arrayFlatten([tags])
+        return magImg.arrayFlatten([schema.rmse_bands(nSegments, [band])])
 
     return ee.Image(list(map(retrieveMags, bandList)))
 
@@ -191,19 +187,14 @@ def buildRMSE(fit, nSegments, bandList):
 
 
 def buildCoefs(fit, nSegments, bandList):
-    # nBands = len(bandList)
-    segmentTag = buildSegmentTag(nSegments)
-    # bandTag = buildBandTag('coef', bandList)
-    harmonicTag = ['INTP', 'SLP', 'COS', 'SIN', 'COS2', 'SIN2', 'COS3', 'SIN3']
+    harmonicTag = schema.HARMONIC_TAGS
 
-    zeros = ee.Image(
-        ee.Array([ee.List.repeat(0, len(harmonicTag))])).arrayRepeat(0, nSegments)
+    zeros = ee.Image(ee.Array([[0] * len(harmonicTag)] * nSegments))
 
     def retrieveCoefs(band):
         coefImg = fit.select(band + '_coefs').arrayCat(zeros,
                                                        0).float().arraySlice(0, 0, nSegments)
-        tags = segmentTag.map(lambda x: ee.String(
-            x).cat('_').cat(band).cat('_coef'))
+        tags = [f'{s}_{band}_coef' for s in schema.segment_tags(nSegments)]
         return coefImg.arrayFlatten([tags, harmonicTag])
 
     return ee.Image(list(map(retrieveCoefs, bandList)))
@@ -218,14 +209,11 @@ def buildCoefs(fit, nSegments, bandList):
 
 
 def buildStartEndBreakProb(fit, nSegments, tag):
-    segmentTag = buildSegmentTag(nSegments).map(
-        lambda s: ee.String(s).cat('_'+tag))
-
-    zeros = ee.Array(0).repeat(0, nSegments)
+    zeros = ee.Array([0] * nSegments)
     magImg = fit.select(tag).arrayCat(
         zeros, 0).float().arraySlice(0, 0, nSegments)
 
-    return magImg.arrayFlatten([segmentTag])
+    return magImg.arrayFlatten([schema.segment_bands(nSegments, tag)])
 
 # /**
 # * Transform ccd results from array image to "long" multiband format
@@ -236,6 +224,7 @@ def buildStartEndBreakProb(fit, nSegments, tag):
 # */
 
 
+@requires_session
 def buildCcdImage(fit, nSegments, bandList):
     magnitude = buildMagnitude(fit, nSegments, bandList)
     rmse = buildRMSE(fit, nSegments, bandList)
@@ -266,6 +255,7 @@ def buildCcdImage(fit, nSegments, bandList):
 #  */
 
 
+@requires_session
 def getMultiCoefs(ccdResults, date, bandList, coef_list, cond, segNames, behavior):
     # js todo   // TODO: can be rewritten to avoid redundant code, welcome :)
     def inner(coef, behavior):
@@ -330,6 +320,35 @@ def getMultiCoefs(ccdResults, date, bandList, coef_list, cond, segNames, behavio
 
     return ee.Image(outCoefs)
 
+# /**
+#  * Get coefficients at the date of every sample. Samples are grouped by date
+#  * and each group is reduced over a single getMultiCoefs image in one
+#  * reduceRegions call, instead of one image and reduceRegion per sample.
+#  * @param {ee.Image} ccdResults CCD results in long multi-band format
+#  * @param {ee.FeatureCollection} samples Features with a date property
+#  * @param {list} bandList, coef_list, cond, segNames, behavior See getMultiCoefs
+#  * @param {string} [dateProperty='year'] Sample property with the date, in the CCDC date format
+#  * @param {number} [scale=90] Scale of the reduction in meters
+#  * @param {number} [tileScale=1] reduceRegions tileScale, raise for large groups
+#  * @returns {ee.FeatureCollection} samples with the mean coefficient values over their geometry
+#  */
+@requires_session
+def sampleMultiCoefs(ccdResults, samples, bandList, coef_list, cond, segNames, behavior,
+                     dateProperty='year', scale=90, tileScale=1):
+    samples = ee.FeatureCollection(samples)
+
+    def sampleDate(date):
+        coefs = getMultiCoefs(ccdResults, ee.Image.constant(date), bandList, coef_list, cond, segNames, behavior)
+        return coefs.reduceRegions(**{
+            'collection': samples.filter(ee.Filter.eq(dateProperty, date)),
+            'reducer': ee.Reducer.mean(),
+            'scale': scale,
+            'tileScale': tileScale
+        })
+
+    dates = samples.aggregate_array(dateProperty).distinct()
+    return ee.FeatureCollection(dates.map(sampleDate)).flatten()
+
 # /**
 #  * Get phase and amplitude. Replace old function with this.
 #  * 
@@ -340,17 +359,25 @@ def getMultiCoefs(ccdResults, date, bandList, coef_list, cond, segNames, behavio
 #  * @returns{ee.Image} Image with two bands representing phase and amplitude of
 #  *                    the desired harmonic
 # **/
-def newPhaseAmplitude(img, sinExpr, cosExpr):
-    sin = img.select(sinExpr)
-    cos = img.select(cosExpr)
+def newPhaseAmplitude(img, sinExpr, cosExpr, bandNames=None):
+    # bandNames: client-side band names of img, lets the output names be planned client-side
+    if bandNames is not None:
+        sin = img.select(schema.select_bands(bandNames, sinExpr))
+        cos = img.select(schema.select_bands(bandNames, cosExpr))
+    else:
+        sin = img.select(sinExpr)
+        cos = img.select(cosExpr)
     #   // Scale to [0, 1] from radians. 
     # // mult 365 To get phase in days!
     phase = sin.atan2(cos).unitScale(-math.pi, math.pi).multiply(365) 
     
     amplitude = sin.hypot(cos) #// Order doesn't matter
     
-    phaseNames = phase.bandNames().map(lambda x : ee.String(x).replace('_SIN', '_PHASE'))
-    amplitudeNames = amplitude.bandNames().map(lambda x : ee.String(x).replace('_SIN', '_AMPLITUDE'))
+    if bandNames is not None:
+        phaseNames, amplitudeNames = schema.phase_amplitude_bands(bandNames, sinExpr)
+    else:
+        phaseNames = phase.bandNames().map(lambda x : ee.String(x).replace('_SIN', '_PHASE'))
+        amplitudeNames = amplitude.bandNames().map(lambda x : ee.String(x).replace('_SIN', '_AMPLITUDE'))
     
     return phase.rename(phaseNames).addBands(amplitude.rename(amplitudeNames))
 
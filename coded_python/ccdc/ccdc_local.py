@@ -0,0 +1,714 @@
+# ccdc_local.py
+# Local NumPy counterpart of ee.Algorithms.TemporalSegmentation.Ccdc.
+# Fits a (time, band, y, x) cube in pixel chunks and returns the same ragged
+# array-band layout as the Earth Engine algorithm (`*_coefs`, `*_rmse`,
+# `*_magnitude`, tStart, tEnd, tBreak, changeProb, numObs).
+import json
+import math
+import time
+import warnings
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from coded_python.ccdc.schema import HARMONIC_TAGS, SEGMENT_TAGS
+
+# Coefficients per band and segment in `*_coefs`, one per harmonic model term
+N_COEFS = len(HARMONIC_TAGS)
+
+# Date units per year for each CCDC dateFormat (0 = jDays, 1 = fractional years, 2 = unix ms)
+UNITS_PER_YEAR = {0: 365.25, 1: 1.0, 2: 365.25 * 86400000}
+
+# Observations needed per model coefficient before the model is trusted (Zhu & Woodcock 2014)
+_N_TIMES = 3
+# Refit an open segment once it has grown by a third since the last fit
+_REFIT_FACTOR = 4 / 3
+_LASSO_SWEEPS = 10
+
+
+@dataclass
+class CcdcFit:
+    '''Ragged CCDC result for a (y, x) grid.
+
+    Segments of pixel i live in rows offsets[i]:offsets[i + 1] of every band,
+    the same layout as the array bands of ee.Algorithms.TemporalSegmentation.Ccdc.
+    '''
+    shape: Tuple[int, int]
+    offsets: np.ndarray
+    bands: Dict[str, np.ndarray]
+    bandNames: List[str]
+    dateFormat: int = 1
+    stats: dict = field(default_factory=dict)
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.bands[name]
+
+    def keys(self):
+        return self.bands.keys()
+
+    def nSegments(self) -> np.ndarray:
+        '''Number of segments per pixel as a (y, x) array.'''
+        return np.diff(self.offsets).reshape(self.shape)
+
+    def pixel(self, y: int, x: int) -> Dict[str, np.ndarray]:
+        '''Array values of a single pixel, like sampling the ee array image.'''
+        i = y * self.shape[1] + x
+        lo, hi = self.offsets[i], self.offsets[i + 1]
+        return {name: values[lo:hi] for name, values in self.bands.items()}
+
+
+def to_ccdc_dates(dates, dateFormat: int = 1) -> np.ndarray:
+    '''Convert datetime64 acquisition dates to the CCDC dateFormat units.'''
+    dates = np.asarray(dates)
+    if not np.issubdtype(dates.dtype, np.datetime64):
+        return dates.astype(np.float64)
+    days = dates.astype('datetime64[D]')
+    if dateFormat == 0:
+        return (days - np.datetime64('0000-01-01', 'D')).astype(np.float64)
+    if dateFormat == 1:
+        years = days.astype('datetime64[Y]')
+        start = years.astype('datetime64[D]')
+        length = ((years + 1).astype('datetime64[D]') - start).astype(np.float64)
+        return years.astype(np.float64) + 1970 + (days - start).astype(np.float64) / length
+    if dateFormat == 2:
+        return dates.astype('datetime64[ms]').astype(np.float64)
+    raise ValueError(f'Unsupported dateFormat: {dateFormat}')
+
+
+def _gammainc(a: float, x: float) -> float:
+    # Regularized lower incomplete gamma function by its power series
+    if x <= 0:
+        return 0.0
+    term = 1.0 / a
+    total = term
+    n = 0
+    while abs(term) > abs(total) * 1e-15 and n < 10000:
+        n += 1
+        term *= x / (a + n)
+        total += term
+    return total * math.exp(-x + a * math.log(x) - math.lgamma(a))
+
+
+def chi_square_ppf(probability: float, df: int) -> float:
+    '''Inverse chi-square CDF, used for the change threshold.'''
+    lo, hi = 0.0, max(1.0, float(df))
+    while _gammainc(df / 2, hi / 2) < probability:
+        hi *= 2
+    for _ in range(100):
+        mid = (lo + hi) / 2
+        if _gammainc(df / 2, mid / 2) < probability:
+            lo = mid
+        else:
+            hi = mid
+    return (lo + hi) / 2
+
+
+def _change_params(change) -> dict:
+    # Accept ChangeDetectionParams or the dict form passed to ee (with 'lambda')
+    if isinstance(change, dict):
+        get = change.get
+        lam = change.get('lambda', change.get('_lambda', 20 / 10000))
+    else:
+        def get(key, default):
+            return getattr(change, key, default)
+        lam = get('_lambda', 20 / 10000)
+    return {
+        'lambda': float(lam),
+        'minNumOfYearsScaler': float(get('minNumOfYearsScaler', 1.33)),
+        'dateFormat': int(get('dateFormat', 1)),
+        'minObservations': int(get('minObservations', 3)),
+        'chiSquareProbability': float(get('chiSquareProbability', .9)),
+    }
+
+
+def design_matrix(t: np.ndarray, tRef: np.ndarray, unitsPerYear: float) -> np.ndarray:
+    '''Harmonic design matrix [1, t, cos, sin, cos2, sin2, cos3, sin3] (..., 8).
+
+    The slope column is centred on tRef for conditioning; use `uncenter_intercept`
+    to move the intercept back to t = 0 as Earth Engine reports it.
+    '''
+    w = 2 * math.pi / unitsPerYear
+    out = np.empty(t.shape + (N_COEFS,), dtype=np.float64)
+    out[..., 0] = 1
+    out[..., 1] = t - tRef
+    for h in range(1, 4):
+        out[..., 2 * h] = np.cos(h * w * t)
+        out[..., 2 * h + 1] = np.sin(h * w * t)
+    return out
+
+
+def uncenter_intercept(coefs: np.ndarray, tRef: np.ndarray) -> np.ndarray:
+    out = coefs.copy()
+    out[..., 0] -= coefs[..., 1] * tRef[..., None]
+    return out
+
+
+def lasso_fit(gram: np.ndarray, xty: np.ndarray, n: np.ndarray, lam: float,
+              nCoefs: np.ndarray, sweeps: int = _LASSO_SWEEPS) -> np.ndarray:
+    '''Batched lasso on sufficient statistics.
+
+    Solves min (1/2n)||y - Xb||^2 + lam * ||b[1:]||_1 for every pixel and band at
+    once by coordinate descent, warm started from least squares.
+
+    Args:
+        gram (np.ndarray): X'X per pixel (q, 8, 8)
+        xty (np.ndarray): X'y per pixel and band (q, b, 8)
+        n (np.ndarray): observations per pixel (q,)
+        lam (float): lasso penalty
+        nCoefs (np.ndarray): number of model terms used per pixel (4, 6 or 8)
+    Returns:
+        np.ndarray: coefficients (q, b, 8), zero for unused harmonics
+    '''
+    a = gram / n[:, None, None]
+    c = xty / n[:, None, None]
+    active = np.arange(N_COEFS)[None, :] < nCoefs[:, None]
+    outer = active[:, :, None] & active[:, None, :]
+    masked = np.where(outer, a, 0) + np.eye(N_COEFS) * (~active)[:, None, :]
+    masked += np.eye(N_COEFS) * 1e-10
+    beta = np.linalg.solve(masked[:, None], (c * active[:, None, :])[..., None])[..., 0]
+    diag = np.maximum(np.diagonal(a, axis1=1, axis2=2), 1e-12)
+    for _ in range(sweeps):
+        for j in range(N_COEFS):
+            rho = c[:, :, j] - np.einsum('qk,qbk->qb', a[:, j, :], beta) + a[:, j, j][:, None] * beta[:, :, j]
+            if j > 0:
+                rho = np.sign(rho) * np.maximum(np.abs(rho) - lam, 0)
+            beta[:, :, j] = np.where(active[:, j, None], rho / diag[:, j, None], 0)
+    return beta
+
+
+def _rmse(gram, xty, yy, n, beta):
+    sse = yy - 2 * np.einsum('qbk,qbk->qb', beta, xty) + np.einsum('qbj,qjk,qbk->qb', beta, gram, beta)
+    return np.sqrt(np.maximum(sse, 0) / n[:, None])
+
+
+def _n_coefs(n):
+    return np.where(n < 6 * _N_TIMES, 4, np.where(n < 8 * _N_TIMES, 6, 8))
+
+
+class _ChunkState:
+    '''Per-pixel segment state for one chunk of compacted observations.
+
+    t (p, k) and y (p, k, b) hold the valid observations of each pixel packed
+    to the front; nValid gives how many there are. With keepState the state of
+    every pixel is snapshotted when its series ends, see CcdcState.
+    '''
+    # per-pixel arrays a run can be resumed from
+    STATE = ('initialized', 'tRef', 'tFirst', 'tLast', 'n', 'nFit', 'gram', 'xty', 'yy',
+             'coefs', 'rmse', 'nExceed', 'exceedResid', 'floor')
+
+    def __init__(self, t, y, nValid, floor, params, breakIdx, keepState=False):
+        p, _, b = y.shape
+        self.t, self.y, self.nValid = t, y, nValid
+        self.floor = floor
+        self.params = params
+        self.breakIdx = breakIdx
+        self.unitsPerYear = UNITS_PER_YEAR[params['dateFormat']]
+        self.threshold = chi_square_ppf(params['chiSquareProbability'], len(breakIdx))
+        self.minObs = params['minObservations']
+        self.minSpan = params['minNumOfYearsScaler'] * self.unitsPerYear
+
+        self.cur = np.zeros(p, dtype=np.int64)
+        self.segStart = np.zeros(p, dtype=np.int64)
+        self.initialized = np.zeros(p, dtype=bool)
+        # Sufficient statistics of the open segment
+        self.tRef = np.zeros(p)
+        self.tFirst = np.zeros(p)
+        self.tLast = np.zeros(p)
+        self.n = np.zeros(p)
+        self.nFit = np.zeros(p)
+        self.gram = np.zeros((p, N_COEFS, N_COEFS))
+        self.xty = np.zeros((p, b, N_COEFS))
+        self.yy = np.zeros((p, b))
+        self.coefs = np.zeros((p, b, N_COEFS))
+        self.rmse = np.zeros((p, b))
+        # Consecutive observations above the change threshold
+        self.nExceed = np.zeros(p, dtype=np.int64)
+        self.exceedFirst = np.zeros(p, dtype=np.int64)
+        self.exceedResid = np.zeros((p, self.minObs, b))
+        self.segments = []
+        self.saved = None
+        if keepState:
+            self.saved = {name: np.zeros_like(getattr(self, name)) for name in self.STATE}
+            self.saved['start'] = np.zeros(p, dtype=np.int64)
+            self.saved['cur'] = np.zeros(p, dtype=np.int64)
+
+    def restore(self, saved: dict):
+        '''Continue from a snapshot, the pending observations are at the front of t and y.'''
+        for name in self.STATE:
+            getattr(self, name)[:] = saved[name]
+        self.cur[:] = saved['cur']
+        self.segStart[:] = 0
+        self.exceedFirst[:] = 0
+
+    def _snapshot(self, idx):
+        # Observations not yet absorbed by a segment start at `start`: the
+        # exceedances of an open segment, or the window still trying to initialize
+        saved = self.saved
+        for name in self.STATE:
+            saved[name][idx] = getattr(self, name)[idx]
+        start = np.where(self.initialized[idx], self.nValid[idx] - self.nExceed[idx], self.segStart[idx])
+        saved['start'][idx] = start
+        saved['cur'][idx] = self.cur[idx] - start
+
+    def pending(self):
+        '''Snapshot of every pixel and its pending observations as ragged (t, y).'''
+        saved = self.saved
+        counts = self.nValid - saved['start']
+        rows = np.repeat(saved['start'] - np.concatenate([[0], np.cumsum(counts)[:-1]]), counts) \
+            + np.arange(counts.sum())
+        pixel = np.repeat(np.arange(len(counts)), counts)
+        state = {name: values for name, values in saved.items() if name != 'start'}
+        return state, counts, self.t[pixel, rows], self.y[pixel, rows]
+
+    # -- model helpers
+    def _refit(self, idx):
+        n = self.n[idx]
+        beta = lasso_fit(self.gram[idx], self.xty[idx], n, self.params['lambda'], _n_coefs(n))
+        self.coefs[idx] = beta
+        self.rmse[idx] = _rmse(self.gram[idx], self.xty[idx], self.yy[idx], n, beta)
+        self.nFit[idx] = n
+
+    def _residual(self, idx, k):
+        x = design_matrix(self.t[idx, k], self.tRef[idx], self.unitsPerYear)
+        return self.y[idx, k] - np.einsum('qbk,qk->qb', self.coefs[idx], x)
+
+    def _emit(self, idx, tBreak, changeProb, magnitude):
+        self.segments.append({
+            'pixel': idx,
+            'tStart': self.tFirst[idx],
+            'tEnd': self.tLast[idx],
+            'tBreak': tBreak,
+            'changeProb': changeProb,
+            'numObs': self.n[idx],
+            'coefs': uncenter_intercept(self.coefs[idx], self.tRef[idx]),
+            'rmse': self.rmse[idx],
+            'magnitude': magnitude,
+        })
+
+    # -- state machine steps
+    def _try_initialize(self, idx):
+        cur, start = self.cur[idx], self.segStart[idx]
+        count = cur - start + 1
+        ready = (count >= 4 * _N_TIMES) & (self.t[idx, cur] - self.t[idx, start] >= self.minSpan)
+        self.cur[idx[~ready]] += 1
+        idx, cur, start, count = idx[ready], cur[ready], start[ready], count[ready]
+        if not len(idx):
+            return
+        # Gather the (short) initialization window of every ready pixel
+        window = start[:, None] + np.arange(count.max())[None, :]
+        inWindow = window <= cur[:, None]
+        window = np.minimum(window, cur[:, None])
+        t = np.take_along_axis(self.t[idx], window, axis=1)
+        y = np.take_along_axis(self.y[idx], window[:, :, None], axis=1)
+        tRef = t[:, 0]
+        x = design_matrix(t, tRef[:, None], self.unitsPerYear) * inWindow[:, :, None]
+        y = y * inWindow[:, :, None]
+        gram = np.einsum('qkj,qki->qji', x, x)
+        xty = np.einsum('qkj,qkb->qbj', x, y)
+        yy = np.einsum('qkb,qkb->qb', y, y)
+        n = count.astype(np.float64)
+        beta = lasso_fit(gram, xty, n, self.params['lambda'], _n_coefs(n))
+        rmse = _rmse(gram, xty, yy, n, beta)
+
+        # Stability test on the breakpoint bands (Zhu & Woodcock 2014)
+        resid = y - np.einsum('qbj,qkj->qkb', beta, x)
+        last = (count - 1)[:, None, None]
+        bi = self.breakIdx
+        scale = 3 * np.maximum(rmse, self.floor[idx])[:, bi]
+        drift = np.abs(beta[:, bi, 1] * (t[np.arange(len(idx)), count - 1] - tRef)[:, None])
+        first = np.abs(resid[:, 0, bi])
+        final = np.abs(np.take_along_axis(resid, last, axis=1)[:, 0, bi])
+        stable = ((drift + first + final) / scale).mean(axis=1) <= 1
+
+        ok = idx[stable]
+        self.initialized[ok] = True
+        self.tRef[ok] = tRef[stable]
+        self.tFirst[ok] = tRef[stable]
+        self.tLast[ok] = self.t[ok, cur[stable]]
+        self.n[ok] = n[stable]
+        self.nFit[ok] = n[stable]
+        self.gram[ok] = gram[stable]
+        self.xty[ok] = xty[stable]
+        self.yy[ok] = yy[stable]
+        self.coefs[ok] = beta[stable]
+        self.rmse[ok] = rmse[stable]
+        self.nExceed[ok] = 0
+        self.cur[ok] += 1
+        # Unstable windows drop their first observation and try again
+        self.segStart[idx[~stable]] += 1
+
+    def _monitor(self, idx):
+        cur = self.cur[idx]
+        resid = self._residual(idx, cur)
+        scaled = resid[:, self.breakIdx] / np.maximum(self.rmse[idx], self.floor[idx])[:, self.breakIdx]
+        exceed = (scaled ** 2).sum(axis=1) > self.threshold
+
+        # Observation exceeds the threshold: count it towards a break
+        ex = idx[exceed]
+        self.exceedFirst[ex] = np.where(self.nExceed[ex] == 0, cur[exceed], self.exceedFirst[ex])
+        self.exceedResid[ex, self.nExceed[ex]] = resid[exceed]
+        self.nExceed[ex] += 1
+        self.cur[ex] += 1
+        broke = ex[self.nExceed[ex] >= self.minObs]
+        if len(broke):
+            magnitude = np.median(self.exceedResid[broke], axis=1)
+            self._emit(broke, self.t[broke, self.exceedFirst[broke]], np.ones(len(broke)), magnitude)
+            self.initialized[broke] = False
+            self.segStart[broke] = self.exceedFirst[broke]
+            self.cur[broke] = self.exceedFirst[broke]
+            self.nExceed[broke] = 0
+
+        # Observation fits the model: earlier exceedances were outliers, add it to the segment
+        ok = idx[~exceed]
+        k = cur[~exceed]
+        x = design_matrix(self.t[ok, k], self.tRef[ok], self.unitsPerYear)
+        y = self.y[ok, k]
+        self.gram[ok] += x[:, :, None] * x[:, None, :]
+        self.xty[ok] += y[:, :, None] * x[:, None, :]
+        self.yy[ok] += y * y
+        self.n[ok] += 1
+        self.tLast[ok] = self.t[ok, k]
+        self.nExceed[ok] = 0
+        self.cur[ok] += 1
+        refit = ok[self.n[ok] >= self.nFit[ok] * _REFIT_FACTOR]
+        if len(refit):
+            self._refit(refit)
+
+    def _finish(self, idx):
+        # Close the open segment at the end of the series
+        if self.saved is not None:
+            self._snapshot(idx)
+        open_ = idx[self.initialized[idx]]
+        if len(open_):
+            stale = open_[self.n[open_] > self.nFit[open_]]
+            if len(stale):
+                self._refit(stale)
+            prob = self.nExceed[open_] / self.minObs
+            self._emit(open_, np.zeros(len(open_)), prob, np.zeros((len(open_), self.y.shape[2])))
+
+    def run(self):
+        active = np.arange(len(self.nValid))
+        while len(active):
+            done = self.cur[active] >= self.nValid[active]
+            if done.any():
+                self._finish(active[done])
+                active = active[~done]
+                if not len(active):
+                    break
+            init = self.initialized[active]
+            self._try_initialize(active[~init])
+            self._monitor(active[init])
+        return self.segments
+
+
+def _compact(block: np.ndarray, t: np.ndarray):
+    '''Pack the valid observations of each pixel to the front.
+
+    Args:
+        block (np.ndarray): observations (p, time, band), NaN where masked
+        t (np.ndarray): dates (time,)
+    '''
+    valid = np.isfinite(block).all(axis=2)
+    order = np.argsort(~valid, axis=1, kind='stable')
+    nValid = valid.sum(axis=1)
+    tc = t[order]
+    yc = np.take_along_axis(block, order[:, :, None], axis=1).astype(np.float64)
+    pad = np.arange(block.shape[1])[None, :] >= nValid[:, None]
+    yc[pad] = 0
+    tc[pad] = np.inf
+    return tc, yc, nValid
+
+
+def _noise_floor(y, nValid):
+    # Median absolute difference between consecutive clear observations (CCDC's variogram)
+    diffs = np.abs(np.diff(y, axis=1))
+    pad = np.arange(1, y.shape[1])[None, :] >= nValid[:, None]
+    diffs[pad] = np.nan
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        floor = np.nanmedian(diffs, axis=1)
+    return np.nan_to_num(floor, nan=1e-6) + 1e-6
+
+
+def _ragged_floor(counts, diffs):
+    # _noise_floor from the ragged differences of each pixel
+    width = max(counts.max(initial=0), 1)
+    padded = np.full((len(counts), width, diffs.shape[1]), np.nan)
+    pixel = np.repeat(np.arange(len(counts)), counts)
+    col = np.arange(len(diffs)) - np.repeat(np.cumsum(counts) - counts, counts)
+    padded[pixel, col] = diffs
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        floor = np.nanmedian(padded, axis=1)
+    return np.nan_to_num(floor, nan=1e-6) + 1e-6
+
+
+def _variogram(y, nValid, seen=None, last=None):
+    '''Differences between consecutive clear observations, to keep the floor current.
+
+    y (p, k, b) holds the compacted new observations of each pixel. seen counts
+    the clear observations of earlier runs and last (p, b) is the latest of them.
+    Returns the differences of every pixel as ragged (counts, (n, b)) and the
+    updated seen and last.
+    '''
+    p, _, b = y.shape
+    if seen is None:
+        seen, last = np.zeros(p, dtype=np.int64), np.zeros((p, b))
+    series = np.concatenate([last[:, None], y], axis=1)
+    col = np.arange(y.shape[1])[None, :]
+    keep = (col < nValid[:, None]) & ((col > 0) | (seen > 0)[:, None])
+    diffs = np.abs(np.diff(series, axis=1))[keep]
+    newest = series[np.arange(p), nValid]
+    return keep.sum(axis=1), diffs, seen + nValid, np.where((nValid > 0)[:, None], newest, last)
+
+
+def _assemble(segments: List[dict], npix: int, bandNames: List[str]):
+    nb = len(bandNames)
+    if segments:
+        cat = {key: np.concatenate([s[key] for s in segments]) for key in segments[0]}
+    else:
+        cat = {'pixel': np.zeros(0, dtype=np.int64), 'coefs': np.zeros((0, nb, N_COEFS)),
+               'rmse': np.zeros((0, nb)), 'magnitude': np.zeros((0, nb))}
+        cat.update({tag: np.zeros(0) for tag in SEGMENT_TAGS})
+    order = np.lexsort((cat['tStart'], cat['pixel']))
+    offsets = np.zeros(npix + 1, dtype=np.int64)
+    np.cumsum(np.bincount(cat['pixel'], minlength=npix), out=offsets[1:])
+    bands = {tag: cat[tag][order] for tag in SEGMENT_TAGS}
+    for i, band in enumerate(bandNames):
+        bands[f'{band}_coefs'] = np.ascontiguousarray(cat['coefs'][order, i])
+        bands[f'{band}_rmse'] = cat['rmse'][order, i]
+        bands[f'{band}_magnitude'] = cat['magnitude'][order, i]
+    return offsets, bands
+
+
+def _fit_segments(fit: CcdcFit, rows: np.ndarray) -> dict:
+    # rows of a fit in the segment form _assemble takes
+    pixel = np.repeat(np.arange(len(fit.offsets) - 1), np.diff(fit.offsets))[rows]
+    segment = {'pixel': pixel}
+    segment.update({tag: fit[tag][rows] for tag in SEGMENT_TAGS})
+    for key, suffix in (('coefs', '_coefs'), ('rmse', '_rmse'), ('magnitude', '_magnitude')):
+        segment[key] = np.stack([fit[band + suffix][rows] for band in fit.bandNames], axis=1)
+    return segment
+
+
+def _stats(npix: int, nt: int, wall: float, cpu: float) -> dict:
+    return {
+        'pixels': npix,
+        'observations': nt,
+        'seconds': wall,
+        'cpuSeconds': cpu,
+        'pixelsPerSecond': npix / wall if wall else float('inf'),
+        'pixelsPerSecondPerCore': npix / cpu if cpu else float('inf'),
+    }
+
+
+def _run_chunks(npix: int, chunkSize: int, load, params: dict, breakIdx: np.ndarray, keepState: bool):
+    # load(lo, hi) -> (t, y, nValid, floor, snapshot or None, variogram or None) of pixels lo:hi
+    segments, pending = [], []
+    for lo in range(0, npix, chunkSize):
+        hi = min(lo + chunkSize, npix)
+        tc, yc, nValid, floor, snapshot, variogram = load(lo, hi)
+        state = _ChunkState(tc, yc, nValid, floor, params, breakIdx, keepState)
+        if snapshot is not None:
+            state.restore(snapshot)
+        for seg in state.run():
+            seg['pixel'] = seg['pixel'] + lo
+            segments.append(seg)
+        if keepState:
+            pending.append(state.pending() + (variogram,))
+    return segments, pending
+
+
+def _prepare(cube: np.ndarray, dates, bandNames: List[str], params: dict):
+    nt, nb, ny, nx = cube.shape
+    if len(bandNames) != nb:
+        raise ValueError(f'Expected {nb} band names, got {len(bandNames)}')
+    t = to_ccdc_dates(dates, params['dateFormat'])
+    order = np.argsort(t, kind='stable')
+    return t[order], cube.reshape(nt, nb, ny * nx)[order]
+
+
+@dataclass
+class CcdcState:
+    '''A local CCDC run that can be continued with newer observations.
+
+    fit holds every segment; the last segment of each pixel in
+    pixels['initialized'] is the open one, reported as CCDC reports it at the
+    end of the series. For each pixel the sufficient statistics of the open
+    segment and the observations no segment has absorbed yet (the current
+    exceedances, or the window still waiting to initialize) are kept, so
+    update_ccdc_local only has to test the new observations. The differences
+    between consecutive clear observations (diffs, ragged by diffOffsets) and
+    the last clear observation (pixels['lastY']) keep the noise floor current.
+    '''
+    fit: CcdcFit
+    params: dict
+    breakIdx: np.ndarray
+    lastDate: float
+    pixels: Dict[str, np.ndarray]
+    pendingOffsets: np.ndarray
+    pendingT: np.ndarray
+    pendingY: np.ndarray
+    diffOffsets: np.ndarray
+    diffs: np.ndarray
+
+    def open_rows(self) -> np.ndarray:
+        '''Rows of fit holding an open segment.'''
+        return (self.fit.offsets[1:] - 1)[self.pixels['initialized']]
+
+    def save(self, path: str) -> None:
+        meta = {'shape': list(self.fit.shape), 'bandNames': self.fit.bandNames, 'dateFormat': self.fit.dateFormat,
+                'params': self.params, 'lastDate': self.lastDate}
+        arrays = {f'fit__{name}': values for name, values in self.fit.bands.items()}
+        arrays.update({f'pixel__{name}': values for name, values in self.pixels.items()})
+        with open(path, 'wb') as f:
+            np.savez_compressed(f, meta=np.array(json.dumps(meta)), offsets=self.fit.offsets,
+                                breakIdx=self.breakIdx, pendingOffsets=self.pendingOffsets,
+                                pendingT=self.pendingT, pendingY=self.pendingY, diffOffsets=self.diffOffsets,
+                                diffs=self.diffs, **arrays)
+
+    @classmethod
+    def load(cls, path: str) -> 'CcdcState':
+        with np.load(path) as f:
+            meta = json.loads(str(f['meta']))
+            bands = {name[5:]: f[name] for name in f.files if name.startswith('fit__')}
+            pixels = {name[7:]: f[name] for name in f.files if name.startswith('pixel__')}
+            fit = CcdcFit(shape=tuple(meta['shape']), offsets=f['offsets'], bands=bands,
+                          bandNames=meta['bandNames'], dateFormat=meta['dateFormat'])
+            return cls(fit=fit, params=meta['params'], breakIdx=f['breakIdx'], lastDate=meta['lastDate'],
+                       pixels=pixels, pendingOffsets=f['pendingOffsets'], pendingT=f['pendingT'],
+                       pendingY=f['pendingY'], diffOffsets=f['diffOffsets'], diffs=f['diffs'])
+
+
+def _offsets(counts: np.ndarray) -> np.ndarray:
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    return offsets
+
+
+def _make_state(fit: CcdcFit, params: dict, breakIdx: np.ndarray, lastDate: float, pending: list) -> CcdcState:
+    pixels = {name: np.concatenate([p[0][name] for p in pending]) for name in pending[0][0]}
+    pixels['seen'] = np.concatenate([p[4][0] for p in pending])
+    pixels['lastY'] = np.concatenate([p[4][1] for p in pending])
+    return CcdcState(fit=fit, params=params, breakIdx=breakIdx, lastDate=lastDate, pixels=pixels,
+                     pendingOffsets=_offsets(np.concatenate([p[1] for p in pending])),
+                     pendingT=np.concatenate([p[2] for p in pending]),
+                     pendingY=np.concatenate([p[3] for p in pending]),
+                     diffOffsets=_offsets(np.concatenate([p[4][2] for p in pending])),
+                     diffs=np.concatenate([p[4][3] for p in pending]))
+
+
+def run_ccdc_local(cube: np.ndarray, dates, bandNames: List[str], change,
+                   breakpointBands: Optional[List[str]] = None, chunkSize: int = 4096,
+                   keepState: bool = False):
+    '''Run CCDC locally on a (time, band, y, x) cube.
+
+    Args:
+        cube (np.ndarray): observations (time, band, y, x), NaN where masked
+        dates: acquisition dates (time,) as datetime64 or already in dateFormat units
+        bandNames (list): names of the cube bands, e.g. general.classBands
+        change (ChangeDetectionParams): CCDC parameters (or the dict passed to ee)
+        breakpointBands (list): bands used for the change test, defaults to all bands
+        chunkSize (int): pixels fitted together in one batch
+        keepState (bool): return a CcdcState that update_ccdc_local can continue
+    Returns:
+        CcdcFit: ragged segments in the ee.Algorithms.TemporalSegmentation.Ccdc band layout,
+            or a CcdcState holding it with keepState
+    '''
+    params = _change_params(change)
+    nt, nb, ny, nx = cube.shape
+    breakpointBands = breakpointBands or bandNames
+    breakIdx = np.array([bandNames.index(b) for b in breakpointBands])
+    t, flat = _prepare(cube, dates, bandNames, params)
+
+    def load(lo, hi):
+        block = np.moveaxis(flat[:, :, lo:hi], 2, 0)
+        tc, yc, nValid = _compact(block, t)
+        variogram = None
+        if keepState:
+            counts, diffs, seen, last = _variogram(yc, nValid)
+            variogram = (seen, last, counts, diffs)
+        return tc, yc, nValid, _noise_floor(yc, nValid), None, variogram
+
+    wall, cpu = time.perf_counter(), time.process_time()
+    segments, pending = _run_chunks(ny * nx, chunkSize, load, params, breakIdx, keepState)
+    offsets, bands = _assemble(segments, ny * nx, bandNames)
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+
+    fit = CcdcFit(shape=(ny, nx), offsets=offsets, bands=bands, bandNames=list(bandNames),
+                  dateFormat=params['dateFormat'], stats=_stats(ny * nx, nt, wall, cpu))
+    if not keepState:
+        return fit
+    return _make_state(fit, params, breakIdx, float(t.max(initial=-np.inf)), pending)
+
+
+def update_ccdc_local(state: CcdcState, cube: np.ndarray, dates, chunkSize: int = 4096) -> CcdcState:
+    '''Continue a local CCDC run with observations newer than the last run.
+
+    Closed segments are kept as they are. For every pixel the pending
+    observations and the new ones are tested against the open segment (the
+    chi-square test over minObservations consecutive exceedances), which is
+    refit or closed by a break; pixels without a stable model keep trying to
+    initialize. The noise floor is recomputed over every clear observation so
+    far, so the new observations are tested as a full rerun tests them.
+
+    The result matches a full rerun except where the floor moved enough to
+    change a decision already taken: segments closed by an earlier run, and the
+    stability test that started the open segment, keep the floor known at the
+    time. That can only happen when the earlier run saw little history.
+
+    Args:
+        state (CcdcState): from run_ccdc_local(keepState=True) or an earlier update
+        cube (np.ndarray): new observations (time, band, y, x), NaN where masked
+        dates: their acquisition dates, all after state.lastDate
+        chunkSize (int): pixels fitted together in one batch
+    Returns:
+        CcdcState: the updated results
+    '''
+    fit, params = state.fit, state.params
+    ny, nx = fit.shape
+    t, flat = _prepare(cube, dates, fit.bandNames, params)
+    if len(t) and t[0] <= state.lastDate:
+        raise ValueError(f'New observations must be after the last date of the state ({state.lastDate})')
+
+    def load(lo, hi):
+        block = np.moveaxis(flat[:, :, lo:hi], 2, 0)
+        tNew, yNew, nNew = _compact(block, t)
+        starts = state.pendingOffsets[lo:hi + 1]
+        counts = np.diff(starts)
+        width = counts.max(initial=0) + len(t)
+        tc = np.full((hi - lo, width), np.inf)
+        yc = np.zeros((hi - lo, width, flat.shape[1]))
+        pixel = np.repeat(np.arange(hi - lo), counts)
+        col = np.arange(starts[-1] - starts[0]) - np.repeat(starts[:-1] - starts[0], counts)
+        tc[pixel, col] = state.pendingT[starts[0]:starts[-1]]
+        yc[pixel, col] = state.pendingY[starts[0]:starts[-1]]
+        cols = counts[:, None] + np.arange(len(t))[None, :]
+        np.put_along_axis(tc, cols, tNew, axis=1)
+        np.put_along_axis(yc, cols[:, :, None], yNew, axis=1)
+        snapshot = {name: values[lo:hi] for name, values in state.pixels.items()}
+
+        # the floor over every clear observation so far: earlier differences, then the new ones
+        before = state.diffOffsets[lo:hi + 1]
+        added, diffs, seen, last = _variogram(yNew, nNew, snapshot['seen'], snapshot['lastY'])
+        pixels = np.concatenate([np.repeat(np.arange(hi - lo), np.diff(before)), np.repeat(np.arange(hi - lo), added)])
+        order = np.argsort(pixels, kind='stable')
+        diffs = np.concatenate([state.diffs[before[0]:before[-1]], diffs])[order]
+        diffCounts = np.diff(before) + added
+        snapshot['floor'] = _ragged_floor(diffCounts, diffs)
+        return tc, yc, counts + nNew, snapshot['floor'], snapshot, (seen, last, diffCounts, diffs)
+
+    wall, cpu = time.perf_counter(), time.process_time()
+    segments, pending = _run_chunks(ny * nx, chunkSize, load, params, state.breakIdx, True)
+    # closed segments of the earlier run stay as they were
+    closed = np.ones(len(fit['tStart']), dtype=bool)
+    closed[state.open_rows()] = False
+    segments.append(_fit_segments(fit, np.flatnonzero(closed)))
+    offsets, bands = _assemble(segments, ny * nx, fit.bandNames)
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+
+    updated = CcdcFit(shape=fit.shape, offsets=offsets, bands=bands, bandNames=list(fit.bandNames),
+                      dateFormat=fit.dateFormat, stats=_stats(ny * nx, len(t), wall, cpu))
+    return _make_state(updated, params, state.breakIdx, float(max(state.lastDate, t.max(initial=-np.inf))),
+                       pending)
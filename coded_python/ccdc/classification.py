@@ -3,7 +3,8 @@ import math
 import random
 import ee
 from coded_python.ccdc import ccdc
-ee.Initialize()
+from coded_python.ccdc import schema
+from coded_python.utils.session import requires_session
 
 # /**
 # * Function to convert segment band names to universal band names to classify
@@ -12,10 +13,14 @@ ee.Initialize()
 # * @param {array} predictors list of predictor iables
 # * @param {array} bandNames band names of coefficient image
 # * @param {array} ancillary list of ancillary data
+# * @param {array} imageBands client-side band names of imageToClassify, plans every
+# *                          band list client-side instead of on the server
 # * @returns {ee.List} list of input features
 # * @returns {ee.Image} bands of the ccdc stack to classify
 # */ 
-def getInputFeatures(seg, imageToClassify, predictors, bandNames, ancillary):
+def getInputFeatures(seg, imageToClassify, predictors, bandNames, ancillary, imageBands=None):
+    if imageBands is not None and isinstance(predictors, (list, tuple)):
+        return _plannedInputFeatures(seg, imageToClassify, predictors, ancillary, imageBands)
 
     # str = ee.String('S').cat(ee.String(ee.Number(seg).int8())).cat('_.*')
     _str = ee.String('S').cat(ee.String( str(int(seg) ))).cat('_.*')
@@ -45,10 +50,23 @@ def getInputFeatures(seg, imageToClassify, predictors, bandNames, ancillary):
     # // Add phase, amplitude, and ancillary
     bands = bands.addBands([phaseAmp]).select(predictors)
     # // Remove non-inputs
-    inputFeatures = bands.bandNames().removeAll(['tStart','tEnd','tBreak','changeProb',
-      'BLUE_MAG','GREEN_MAG','RED_MAG','NIR_MAG','SWIR1_MAG','SWIR2_MAG','TEMP_MAG','NDFI_MAG'])
+    inputFeatures = bands.bandNames().removeAll(schema.NON_INPUTS)
     return [inputFeatures, bands]
 
+def _plannedInputFeatures(seg, imageToClassify, predictors, ancillary, imageBands):
+    # same as getInputFeatures with all band lists computed client-side
+    # only the bands the predictors depend on are selected
+    selected, renamed = schema.segment_input_bands(seg, imageBands, predictors)
+    bands = imageToClassify.select(selected, renamed)
+    bands = bands.updateMask(bands.select('tStart').gt(0))
+    bands = ccdc.applyNorm(bands, bands.select('.*tStart'), bands.select('.*tEnd'))
+    if schema.needs_phase_amplitude(predictors):
+        bands = bands.addBands(ccdc.newPhaseAmplitude(bands, '.*SIN.*', '.*COS.*', bandNames=renamed))
+    if isinstance(ancillary, ee.Image):
+        bands = bands.addBands(ancillary)
+    bands = bands.select(list(predictors))
+    return [schema.input_features(predictors), bands]
+
 # /**
 #  * Subset training data into random training and testing data
 #  * Data is subset proportionally for each land cover class
@@ -97,6 +115,7 @@ def subsetTraining(trainingData, trainProp, seed, classProperty):
 # * @param {float} [trainProp=.4] proportion of data to use subset for training
 # * @returns {ee.ConfusionMatrix} a confusion matrix as calculated by the train/test subset
 # */
+@requires_session
 def accuracyProcedure(trainingData, imageToClassify, predictors, bandNames, 
     ancillary, classifier, classProperty, seed, trainProp):
     if seed is None:
@@ -138,14 +157,19 @@ def accuracyProcedure(trainingData, imageToClassify, predictors, bandNames,
 # * @param {float} [trainProp=.4] proportion of data to use subset for training
 # * @param {number} [seed='random'] seed to use for the random column generator
 # * @param {boolean} [subsetTraining=true] true to subset training to geometry, false to not
+# * @param {array} [imageBands] client-side band names of imageToClassify, defaults to the
+# *                            ccdc.buildCcdImage layout for numberOfSegments and bandNames
 # * @returns {ee.Image} classified stack of CCDC segments
 # */ 
+@requires_session
 def classifySegments(imageToClassify, numberOfSegments, bandNames,
     ancillary, ancillaryFeatures, trainingData, classifier,  
     classProperty, coefs, seed, subsetTraining, **kwargs):
     trainProp = kwargs.get('trainProp', None)
     studyArea = kwargs.get('studyArea',None)
     ancillaryFeatures = kwargs.get('ancillaryFeatures', [])
+    # client-side band names of imageToClassify, by default the layout of ccdc.buildCcdImage
+    imageBands = kwargs.get('imageBands') or schema.ccd_image_bands(numberOfSegments, bandNames)
     # // subsetTraining = subsetTraining || null
     trainingData = ee.FeatureCollection(trainingData)
     imageToClassify = ee.Image(imageToClassify)
@@ -161,10 +185,8 @@ def classifySegments(imageToClassify, numberOfSegments, bandNames,
 
     #// Input bands. All data will be initially queries and only these bands
     #// will be eventually selected for classification. 
-    predictors = ee.List(bandNames).map(
-        lambda b : ee.List(coefs).map( lambda i : ee.String(b).cat('_').cat(i))
-    ).flatten().cat(ancillaryFeatures)
-    inputList = getInputFeatures(1, imageToClassify, predictors, bandNames, ancillary)
+    predictors = schema.predictor_bands(bandNames, coefs, ancillaryFeatures)
+    inputList = getInputFeatures(1, imageToClassify, predictors, bandNames, ancillary, imageBands)
     inputFeatures = inputList[0]
 
     # // Train the classifier
@@ -177,14 +199,12 @@ def classifySegments(imageToClassify, numberOfSegments, bandNames,
     # // Map over segments
     def seg_bands(seg):
         # // Get inputs bands for this segment 
-        inputList = getInputFeatures(seg, imageToClassify, predictors, bandNames, ancillary)
+        inputList = getInputFeatures(seg, imageToClassify, predictors, bandNames, ancillary, imageBands)
         inputFeatures = inputList[0]
         bands = inputList[1]
-        # segStr = ee.String('S').cat(ee.String(ee.Number(seg).int8()))
-        segStr = ee.String('S').cat(ee.String(str(int(seg))))
-        className = segStr.cat('_classification')
-        startName = segStr.cat('_tStart')
-        tEnd = segStr.cat('_tEnd')
+        segStr = f'S{int(seg)}'
+        className = f'{segStr}_classification'
+        startName = f'{segStr}_tStart'
 
         return bands \
             .select(inputFeatures) \
@@ -200,9 +220,8 @@ def classifySegments(imageToClassify, numberOfSegments, bandNames,
     classified = ee.ImageCollection(segmentsClassified)
 
     # // When reducing to bands the names change and gives an error upon export
-    bns = ee.List(classified.map(lambda i : i.set('bn', i.bandNames())) \
-        .aggregate_array('bn')) \
-        .flatten()
+    # band names are known client-side, no need to aggregate them from the collection
+    bns = schema.classification_bands(numberOfSegments)
 
     # // Reduce to bands and rename to original band names
     classified = classified.toBands().rename(bns)
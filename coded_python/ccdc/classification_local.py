@@ -0,0 +1,152 @@
+# classification_local.py
+# Local counterpart of classification.classifySegments. The classifier is
+# trained once, the inputs of every segment are stacked into one float32
+# matrix and a single predict call labels all segments and pixels at once,
+# instead of one getInputFeatures/classify/toBands chain per segment.
+import math
+from typing import List, Mapping, Sequence, Tuple
+
+import numpy as np
+
+from coded_python.ccdc import schema
+from coded_python.ccdc.ccd_image_local import LAYER_TAGS, CcdImage
+from coded_python.ccdc.ccdc_local import SEGMENT_TAGS
+
+NODATA = 0
+
+
+def default_classifier(seed: int = None):
+    '''scikit-learn random forest with the trees of params.default_classifier.'''
+    try:
+        from sklearn.ensemble import RandomForestClassifier
+    except ImportError as e:
+        raise ImportError('the local classification needs scikit-learn for its default classifier, '
+                          'install it or pass a classifier with fit(X, y) and predict(X)') from e
+    return RandomForestClassifier(n_estimators=150, n_jobs=-1, random_state=seed)
+
+
+class NearestCentroidClassifier:
+    '''Minimal NumPy classifier with the fit/predict interface, used in tests.'''
+
+    def fit(self, X: np.ndarray, y: np.ndarray) -> 'NearestCentroidClassifier':
+        self.classes_ = np.unique(y)
+        self.centroids_ = np.stack([X[y == c].mean(axis=0) for c in self.classes_])
+        return self
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        distance = ((X[:, None, :] - self.centroids_[None]) ** 2).sum(axis=2)
+        return self.classes_[distance.argmin(axis=1)]
+
+
+def _harmonic(tag: str) -> str:
+    # 'PHASE2' -> 'SIN2', the harmonic newPhaseAmplitude derived it from
+    for name in ('PHASE', 'AMPLITUDE'):
+        if tag.startswith(name):
+            return tag[len(name):]
+    return None
+
+
+def _feature(image: CcdImage, seg: int, name: str, ancillary: Mapping[str, np.ndarray]) -> np.ndarray:
+    # (pixel,) values of one predictor of one segment, as getInputFeatures computes them
+    if name in ancillary:
+        return np.asarray(ancillary[name], dtype=np.float32).reshape(-1)
+    band, tag = name.rsplit('_', 1)
+    b = image.bandList.index(band)
+    coefs = image.tensor[:, seg, b]
+    if tag == 'INTP':
+        # ccdc.applyNorm: intercept at the middle of the segment
+        dates = image.segment[:, seg]
+        middle = (dates[:, SEGMENT_TAGS.index('tStart')] + dates[:, SEGMENT_TAGS.index('tEnd')]) / 2
+        return coefs[:, LAYER_TAGS.index('INTP')] + coefs[:, LAYER_TAGS.index('SLP')] * middle
+    suffix = _harmonic(tag)
+    if suffix is not None:
+        sin = coefs[:, LAYER_TAGS.index('SIN' + suffix)]
+        cos = coefs[:, LAYER_TAGS.index('COS' + suffix)]
+        if tag.startswith('AMPLITUDE'):
+            return np.hypot(sin, cos)
+        # ccdc.newPhaseAmplitude: radians scaled to [0, 365] days
+        return (np.arctan2(sin, cos) + math.pi) / (2 * math.pi) * 365
+    return coefs[:, LAYER_TAGS.index(tag)]
+
+
+def segment_features(image: CcdImage, predictors: Sequence[str],
+                     ancillary: Mapping[str, np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray, List[str]]:
+    '''Classifier inputs of every segment stacked into one matrix.
+
+    Args:
+        image (CcdImage): dense CCDC results from ccd_image_local.build_ccd_image
+        predictors (list): predictor names, e.g. schema.predictor_bands(bandNames, coefs)
+        ancillary (dict): optional (y, x) arrays of ancillary predictors, shared by all segments
+    Returns:
+        tuple: float32 features (rows, inputs) of the segments that exist, their
+            (segment, pixel) mask and the input names (predictors minus schema.NON_INPUTS)
+    '''
+    ancillary = ancillary or {}
+    inputs = schema.input_features(predictors)
+    # segments are stacked segment-major so the labels reshape to (segment, y, x)
+    valid = image.segment[:, :, SEGMENT_TAGS.index('tStart')].T != 0
+    features = np.empty((int(valid.sum()), len(inputs)), dtype=np.float32)
+    counts = valid.sum(axis=1)
+    starts = np.concatenate([[0], np.cumsum(counts)])
+    for seg in range(len(image.segs)):
+        rows = slice(starts[seg], starts[seg + 1])
+        for j, name in enumerate(inputs):
+            features[rows, j] = _feature(image, seg, name, ancillary)[valid[seg]]
+    return features, valid, inputs
+
+
+def training_matrix(samples: Mapping[str, Sequence], inputs: Sequence[str],
+                    classProperty: str = 'landcover') -> Tuple[np.ndarray, np.ndarray]:
+    '''Features and labels of prepped samples (ClassParams.prep_samples properties).
+
+    samples maps property names to columns, e.g. a dict of arrays, a pandas
+    DataFrame or the properties of a downloaded FeatureCollection. Samples
+    with missing inputs are dropped, as Earth Engine drops them when training.
+    '''
+    X = np.column_stack([np.asarray(samples[name], dtype=np.float32) for name in inputs])
+    y = np.asarray(samples[classProperty])
+    keep = ~np.isnan(X).any(axis=1)
+    return X[keep], y[keep]
+
+
+def predict_segments(trained, features: np.ndarray, valid: np.ndarray, shape: Tuple[int, int],
+                     chunkSize: int = None) -> np.ndarray:
+    '''Label stacked segment features and scatter them into an int8 (segment, y, x) array.
+
+    chunkSize bounds the rows per predict call, by default all rows go in one call.
+    Segments a pixel does not have are NODATA.
+    '''
+    out = np.full(valid.shape, NODATA, dtype=np.int8)
+    labels = np.empty(len(features), dtype=np.int8)
+    step = chunkSize or max(len(features), 1)
+    for lo in range(0, len(features), step):
+        labels[lo:lo + step] = trained.predict(features[lo:lo + step])
+    out[valid] = labels
+    return out.reshape((valid.shape[0],) + tuple(shape))
+
+
+def classify_segments_local(image: CcdImage, samples: Mapping[str, Sequence], bandNames: Sequence[str],
+                            coefs: Sequence[str] = ('INTP', 'SIN', 'COS', 'RMSE'), classifier=None,
+                            classProperty: str = 'landcover', ancillary: Mapping[str, np.ndarray] = None,
+                            chunkSize: int = None, seed: int = None) -> np.ndarray:
+    '''Train once and classify every segment of a local CCDC image.
+
+    Args:
+        image (CcdImage): dense CCDC results from ccd_image_local.build_ccd_image
+        samples (dict): prepped training samples, see training_matrix
+        bandNames (list): bands to classify, e.g. general.classBands
+        coefs (list): coefficients to classify, e.g. class_params.coefs
+        classifier: object with fit(X, y) and predict(X), default scikit-learn random forest
+        classProperty (str): sample property with the land cover label
+        ancillary (dict): optional (y, x) arrays of ancillary predictors
+        chunkSize (int): rows per predict call, default all at once
+        seed (int): random state of the default classifier
+    Returns:
+        np.ndarray: int8 (segment, y, x) labels, the bands of classifySegments
+            ('S1_classification', ...), NODATA where the segment does not exist
+    '''
+    predictors = schema.predictor_bands(bandNames, coefs, list(ancillary or {}))
+    features, valid, inputs = segment_features(image, predictors, ancillary)
+    X, y = training_matrix(samples, inputs, classProperty)
+    trained = (classifier if classifier is not None else default_classifier(seed)).fit(X, y)
+    return predict_segments(trained, features, valid, image.shape, chunkSize)
@@ -0,0 +1,101 @@
+# schema.py
+# Client-side band schemas of the CCDC images. Every band name the pipeline
+# selects or renames follows from segs, classBands and coefs, so the ee graph
+# gets literal lists instead of ee.String/ee.List expressions evaluated on the
+# server for every request.
+import re
+from typing import List, Sequence, Tuple
+
+HARMONIC_TAGS = ['INTP', 'SLP', 'COS', 'SIN', 'COS2', 'SIN2', 'COS3', 'SIN3']
+SEGMENT_TAGS = ['tStart', 'tEnd', 'tBreak', 'changeProb', 'numObs']
+# per-segment bands that are never classifier inputs (see classification.getInputFeatures)
+NON_INPUTS = ['tStart', 'tEnd', 'tBreak', 'changeProb',
+              'BLUE_MAG', 'GREEN_MAG', 'RED_MAG', 'NIR_MAG', 'SWIR1_MAG', 'SWIR2_MAG', 'TEMP_MAG', 'NDFI_MAG']
+
+
+def segment_tags(nSegments: int) -> List[str]:
+    return [f'S{i + 1}' for i in range(nSegments)]
+
+
+def magnitude_bands(nSegments: int, bandList: Sequence[str]) -> List[str]:
+    '''Band names of ccdc.buildMagnitude.'''
+    return [f'{s}_{b}_MAG' for b in bandList for s in segment_tags(nSegments)]
+
+
+def rmse_bands(nSegments: int, bandList: Sequence[str]) -> List[str]:
+    '''Band names of ccdc.buildRMSE.'''
+    return [f'{s}_{b}_RMSE' for b in bandList for s in segment_tags(nSegments)]
+
+
+def coef_bands(nSegments: int, bandList: Sequence[str]) -> List[str]:
+    '''Band names of ccdc.buildCoefs.'''
+    return [f'{s}_{b}_coef_{h}' for b in bandList for s in segment_tags(nSegments) for h in HARMONIC_TAGS]
+
+
+def segment_bands(nSegments: int, tag: str) -> List[str]:
+    '''Band names of ccdc.buildStartEndBreakProb.'''
+    return [f'{s}_{tag}' for s in segment_tags(nSegments)]
+
+
+def ccd_image_bands(nSegments: int, bandList: Sequence[str]) -> List[str]:
+    '''Band names of ccdc.buildCcdImage, in order.'''
+    names = coef_bands(nSegments, bandList) + rmse_bands(nSegments, bandList) \
+        + magnitude_bands(nSegments, bandList)
+    for tag in SEGMENT_TAGS:
+        names += segment_bands(nSegments, tag)
+    return names
+
+
+def select_bands(names: Sequence[str], regex: str) -> List[str]:
+    '''Names ee.Image.select(regex) keeps, in order.'''
+    pattern = re.compile(regex)
+    return [n for n in names if pattern.fullmatch(n)]
+
+
+def segment_input_bands(seg: int, imageBands: Sequence[str],
+                        predictors: Sequence[str] = None) -> Tuple[List[str], List[str]]:
+    '''Bands of one segment and their names without the segment prefix.
+
+    Mirrors the renaming in classification.getInputFeatures:
+    'S2_GV_coef_INTP' -> 'GV_INTP', 'S2_tStart' -> 'tStart'. With predictors,
+    only the bands needed to compute them are kept: the predictors themselves,
+    tStart/tEnd for masking, every INTP/SLP pair for the intercept normalization
+    and the SIN/COS terms if phase or amplitude are predictors.
+    '''
+    prefix = f'S{int(seg)}_'
+    selected = select_bands(imageBands, prefix + '.*')
+    renamed = [n.replace('_coef_', '_', 1).replace('_COEF_', '_', 1).split(prefix)[1] for n in selected]
+    if predictors is None:
+        return selected, renamed
+
+    harmonics = needs_phase_amplitude(predictors)
+    keep = set(predictors) | {'tStart', 'tEnd'}
+    pairs = [(s, r) for s, r in zip(selected, renamed)
+             if r in keep or r.endswith(('_INTP', '_SLP'))
+             or (harmonics and ('SIN' in r or 'COS' in r))]
+    return [s for s, _ in pairs], [r for _, r in pairs]
+
+
+def needs_phase_amplitude(predictors: Sequence[str]) -> bool:
+    return any('_PHASE' in p or '_AMPLITUDE' in p for p in predictors)
+
+
+def phase_amplitude_bands(names: Sequence[str], sinExpr: str = '.*SIN.*') -> Tuple[List[str], List[str]]:
+    '''Band names of ccdc.newPhaseAmplitude for an image with the given band names.'''
+    sin = select_bands(names, sinExpr)
+    return [n.replace('_SIN', '_PHASE', 1) for n in sin], [n.replace('_SIN', '_AMPLITUDE', 1) for n in sin]
+
+
+def predictor_bands(bandNames: Sequence[str], coefs: Sequence[str], ancillaryFeatures: Sequence[str] = ()) -> List[str]:
+    '''Classifier predictors, e.g. ['NDFI_INTP', 'NDFI_SIN', ...] plus ancillary features.'''
+    return [f'{b}_{c}' for b in bandNames for c in coefs] + list(ancillaryFeatures or [])
+
+
+def input_features(predictors: Sequence[str]) -> List[str]:
+    '''Predictors the classifier is trained on.'''
+    return [p for p in predictors if p not in NON_INPUTS]
+
+
+def classification_bands(nSegments: int) -> List[str]:
+    '''Band names of classification.classifySegments.'''
+    return [f'{s}_classification' for s in segment_tags(nSegments)]
@@ -0,0 +1,243 @@
+# synthetic.py
+# Deterministic synthetic Landsat stacks for load and scaling tests. Tiles are
+# (time, band, y, x) float32 in the getLandsat band layout (BLUE..TEMP, NDFI,
+# GV, NPV, Shade, Soil), NaN where masked, on the real 16-day revisit of every
+# sensor, with the break each pixel went through as ground truth.
+#
+# Every pixel mixes the NDFIParams endmembers with a yearly harmonic. Forest
+# pixels can be degraded (GV drops at the break and recovers exponentially) or
+# deforested (they turn into pasture at the break). Cloud cells and the
+# Landsat 7 SLC-off stripes mask observations.
+#
+# Pixel parameters, break dates, clouds and stripes come from a counter-based
+# hash of (seed, pixel, scene), so they do not depend on how the grid is tiled
+# and any tile can be generated on its own, e.g. in parallel workers. Only
+# the reflectance noise is drawn per window origin.
+#
+#   synth = SyntheticLandsat(shape=(1000, 1000), seed=1)
+#   for i, j, ys, xs in synth.tiles():
+#       stack, truth = synth.tile(i, j)
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, Tuple
+
+import numpy as np
+
+from coded_python.ccdc.ccdc_local import to_ccdc_dates
+from coded_python.image_collections.planner import DEFAULT_TARGET_BANDS
+from coded_python.image_collections.simple_cols_local import NDFI_BANDS, REFLECTANCE_BANDS, calc_ndfi_stack
+from coded_python.utils.tiling import tile_counts, tile_slices
+
+BANDS = DEFAULT_TARGET_BANDS
+# simple_cols.NDFIParams defaults, the endmembers the stacks are mixed from
+ENDMEMBERS = {
+    'gv': [.0500, .0900, .0400, .6100, .3000, .1000],
+    'shade': [0, 0, 0, 0, 0, 0],
+    'npv': [.1400, .1700, .2200, .3000, .5500, .3000],
+    'soil': [.2000, .3000, .3400, .5800, .6000, .5800],
+    'cloud': [.9000, .9600, .8000, .7800, .7200, .6500],
+}
+# (first, last) acquisition and the day of the 16-day cycle relative to
+# Landsat 7; Landsat 5 and 8 flew 8 days apart from Landsat 7, Landsat 4 from 5
+MISSIONS = {
+    'LANDSAT_4': ('1982-08-22', '1993-12-14', 0),
+    'LANDSAT_5': ('1984-03-16', '2011-11-18', 8),
+    'LANDSAT_7': ('1999-07-04', '2024-01-19', 0),
+    'LANDSAT_8': ('2013-04-11', '2100-01-01', 8),
+}
+SLC_OFF = np.datetime64('2003-05-31')
+
+# truth codes
+FOREST, NON_FOREST = 1, 2
+STABLE, DEGRADATION, DEFORESTATION = 0, 1, 2
+
+# endmember fractions (gv, shade, npv, soil) of each cover
+_FOREST = np.array([.75, .15, .05, .05], dtype=np.float32)
+_PASTURE = np.array([.35, .05, .20, .40], dtype=np.float32)
+_CLOUD_CELL = 16
+
+
+def landsat_dates(start: str, end: str, sensors=tuple(MISSIONS), pathOffset: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    '''Acquisition dates of one WRS-2 path/row and their sensors, sorted by date.
+
+    pathOffset (0-15) shifts the 16-day cycle, as different paths do.
+    '''
+    start, end = np.datetime64(start, 'D'), np.datetime64(end, 'D')
+    anchor = np.datetime64(MISSIONS['LANDSAT_7'][0], 'D') + pathOffset
+    dates, names = [], []
+    for sensor in sensors:
+        first, last, phase = MISSIONS[sensor]
+        lo = max(np.datetime64(first, 'D'), start)
+        hi = min(np.datetime64(last, 'D'), end)
+        origin = anchor + phase
+        k0 = -(-(lo - origin).astype(int) // 16)
+        k1 = (hi - origin).astype(int) // 16
+        days = origin + 16 * np.arange(k0, k1 + 1)
+        dates.append(days[days < end])
+        names.append(np.full(len(dates[-1]), sensor, dtype='<U16'))
+    dates, names = np.concatenate(dates), np.concatenate(names)
+    order = np.argsort(dates, kind='stable')
+    return dates[order], names[order]
+
+
+def _mix(z: np.ndarray) -> np.ndarray:
+    # splitmix64 finalizer
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xbf58476d1ce4e5b9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94d049bb133111eb)
+    return z ^ (z >> np.uint64(31))
+
+
+def uniform(seed: int, *keys) -> np.ndarray:
+    '''Uniform [0, 1) values hashed from integer keys, broadcast together.'''
+    with np.errstate(over='ignore'):
+        h = _mix(np.uint64(seed) + np.uint64(0x9e3779b97f4a7c15))
+        for key in keys:
+            h = _mix(h ^ (np.asarray(key).astype(np.uint64) * np.uint64(0xd1b54a32d192ed03)))
+    return (h >> np.uint64(11)).astype(np.float64) * 2.0 ** -53
+
+
+def _noise(rng: np.random.Generator, shape, std: float) -> np.ndarray:
+    # sum of two uniform int8 draws: bell shaped, and several times faster
+    # than float normals at this volume
+    size = int(np.prod(shape))
+    pairs = np.frombuffer(rng.bytes(2 * size), dtype=np.int8).reshape(2, size)
+    noise = pairs[0].astype(np.float32)
+    noise += pairs[1]
+    noise *= np.float32(std / np.sqrt(2 * (256 ** 2 - 1) / 12))
+    return noise.reshape(shape)
+
+
+@dataclass
+class SyntheticLandsat:
+    '''Generator of synthetic getLandsat stacks on a (y, x) grid.
+
+    Fractions of forest pixels that are degraded or deforested (once, between
+    3 years after start and 2 years before end), of non-forest pixels, and the
+    mean cloud cover of a scene are set here; cloud cover varies by scene.
+    '''
+    shape: Tuple[int, int]
+    start: str = '2000-01-01'
+    end: str = '2021-01-01'
+    seed: int = 0
+    tileSize: Tuple[int, int] = (64, 64)
+    sensors: Tuple[str, ...] = tuple(MISSIONS)
+    pathOffset: int = 0
+    nonForest: float = .2
+    degradation: float = .1
+    deforestation: float = .1
+    cloudCover: float = .3
+    noise: float = .01
+    dates: np.ndarray = field(init=False, repr=False)
+    satellites: np.ndarray = field(init=False, repr=False)
+
+    def __post_init__(self):
+        self.shape, self.tileSize = tuple(self.shape), tuple(self.tileSize)
+        self.dates, self.satellites = landsat_dates(self.start, self.end, self.sensors, self.pathOffset)
+
+    @property
+    def nTiles(self) -> Tuple[int, int]:
+        return tile_counts(self.shape, self.tileSize)
+
+    def tiles(self) -> Iterator[Tuple[int, int, slice, slice]]:
+        '''Tile indices and the (y, x) slices they cover.'''
+        return tile_slices(self.shape, self.tileSize)
+
+    def _grid(self, ys: slice, xs: slice) -> Tuple[np.ndarray, np.ndarray]:
+        return np.meshgrid(np.arange(ys.start, ys.stop), np.arange(xs.start, xs.stop), indexing='ij')
+
+    def truth(self, ys: slice, xs: slice) -> Dict[str, np.ndarray]:
+        '''Ground truth of a window: classBefore/classAfter (FOREST or NON_FOREST),
+        breakType (STABLE, DEGRADATION or DEFORESTATION) and breakDate in fractional years, 0 if stable.'''
+        y, x = self._grid(ys, xs)
+        u = uniform(self.seed, 1, y, x)
+        forest = u >= self.nonForest
+        r = uniform(self.seed, 2, y, x)
+        breakType = np.where(forest & (r < self.degradation), DEGRADATION, STABLE)
+        breakType[forest & (r >= self.degradation) & (r < self.degradation + self.deforestation)] = DEFORESTATION
+        t0, t1 = to_ccdc_dates(np.array([self.start, self.end], dtype='datetime64[D]'))
+        breakDate = (t0 + 3) + uniform(self.seed, 3, y, x) * max(t1 - t0 - 5, 0)
+        breakDate = np.where(breakType != STABLE, breakDate, 0).astype(np.float32)
+        classBefore = np.where(forest, FOREST, NON_FOREST).astype(np.int8)
+        classAfter = np.where(breakType == DEFORESTATION, NON_FOREST, classBefore).astype(np.int8)
+        return {'classBefore': classBefore, 'classAfter': classAfter, 'breakType': breakType.astype(np.int8),
+                'breakDate': breakDate}
+
+    def mask(self, ys: slice, xs: slice) -> np.ndarray:
+        '''(time, y, x) True where clouds or SLC-off stripes hide the surface.'''
+        y, x = self._grid(ys, xs)
+        scene = np.arange(len(self.dates))[:, None, None]
+        cover = np.clip(2 * self.cloudCover * uniform(self.seed, 4, scene), 0, 1)
+        # hash the cloud cells the window touches, then expand them to pixels
+        cy, cx = y // _CLOUD_CELL, x // _CLOUD_CELL
+        cells = uniform(self.seed, 5, scene, np.unique(cy)[:, None], np.unique(cx)[None]) < cover
+        masked = cells[:, cy - cy.min(), cx - cx.min()]
+        # SLC-off: about a fifth of every Landsat 7 scene falls in slanted stripes
+        slcOff = (self.satellites == 'LANDSAT_7') & (self.dates > SLC_OFF)
+        if slcOff.any():
+            shift = (uniform(self.seed, 6, scene[slcOff]) * 32).astype(int)
+            masked[slcOff] |= ((x + y // 8 + shift) % 32) < 7
+        return masked
+
+    def tile(self, i: int, j: int) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+        '''Stack (time, BANDS, tileY, tileX) and ground truth of tile (i, j).'''
+        ty, tx = self.tileSize
+        ys = slice(i * ty, min((i + 1) * ty, self.shape[0]))
+        xs = slice(j * tx, min((j + 1) * tx, self.shape[1]))
+        return self.window(ys, xs)
+
+    def window(self, ys: slice, xs: slice) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+        '''Stack and ground truth of any (y, x) window of the grid.'''
+        truth = self.truth(ys, xs)
+        y, x = self._grid(ys, xs)
+        ny, nx = y.shape
+        nt, npix = len(self.dates), ny * nx
+        t = to_ccdc_dates(self.dates).astype(np.float32)[:, None]
+        pixel = lambda key: uniform(self.seed, key, y, x).reshape(-1).astype(np.float32)
+        breakType, tBreak = truth['breakType'].reshape(-1), truth['breakDate'].reshape(-1)
+
+        # (time, endmember, pixel) fractions of the cover before the break, then after it
+        fractions = np.empty((nt, 4, npix), dtype=np.float32)
+        fractions[:] = np.where(truth['classBefore'].reshape(-1) == FOREST, _FOREST[:, None], _PASTURE[:, None])
+        cleared = np.flatnonzero(breakType == DEFORESTATION)
+        after = (t >= tBreak[cleared])[:, None]
+        fractions[:, :, cleared] = np.where(after, _PASTURE[None, :, None], fractions[:, :, cleared])
+        degraded = np.flatnonzero(breakType == DEGRADATION)
+        elapsed = t - tBreak[degraded]
+        depth, recovery = .2 + .15 * pixel(7)[degraded], 1 + 2 * pixel(8)[degraded]
+        loss = np.where(elapsed >= 0, depth * np.exp(-np.maximum(elapsed, 0) / recovery), 0).astype(np.float32)
+        fractions[:, 0, degraded] -= loss
+        fractions[:, 2, degraded] += loss
+
+        # seasonality, larger outside the forest, traded between GV and NPV + soil
+        amplitude = np.where(fractions[:, 3] > .2, np.float32(.08), np.float32(.03)) * (.5 + pixel(9))
+        season = amplitude * np.cos(np.float32(2 * np.pi) * (t - pixel(10)))
+        fractions[:, 0] += season
+        season *= .5
+        fractions[:, 2] -= season
+        fractions[:, 3] -= season
+
+        endmembers = np.array([ENDMEMBERS[name] for name in ('gv', 'shade', 'npv', 'soil')], dtype=np.float32)
+        rng = np.random.default_rng([self.seed, ys.start, xs.start])
+        out = np.empty((nt, len(BANDS), ny, nx), dtype=np.float32)
+        reflectance = out[:, :6].reshape(nt, 6, npix)
+        np.matmul(endmembers.T, fractions, out=reflectance)
+        reflectance += _noise(rng, reflectance.shape, self.noise)
+        out[:, 6] = (2.95 + .02 * np.cos(2 * np.pi * t)).reshape(nt, 1, 1)
+        np.copyto(out, np.nan, where=self.mask(ys, xs)[:, None])
+
+        params = _Endmembers(REFLECTANCE_BANDS[:6])
+        indices = calc_ndfi_stack(out[:, :6], params)
+        for k, name in enumerate(NDFI_BANDS):
+            out[:, BANDS.index(name)] = indices[:, k]
+        return out, truth
+
+    def generate(self) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+        '''The whole grid at once, for small grids.'''
+        return self.window(slice(0, self.shape[0]), slice(0, self.shape[1]))
+
+
+class _Endmembers:
+    # stand-in for simple_cols.NDFIParams without importing ee
+    def __init__(self, bands):
+        self.bands = list(bands)
+        for name, values in ENDMEMBERS.items():
+            setattr(self, name, values)
@@ -1,5 +1,7 @@
 # regions.py
 import ee
-ee.Initialize()
+from coded_python.utils.session import session
+# test assets live on the server
+session.ensure()
 class test_study_area:
     region : ee.FeatureCollection = ee.FeatureCollection('projects/python-coded/assets/tests/regions/test_geometry')
\ No newline at end of file
@@ -1,6 +1,7 @@
-from rich import print
 import ee
-ee.Initialize()
+from coded_python.utils.session import session
+# test assets live on the server
+session.ensure()
 
 class python_coded:
     raw = ee.FeatureCollection("projects/python-coded/assets/tests/test_training")
@@ -11,6 +12,7 @@ class js_coded:
     prepped_samples = ee.FeatureCollection("projects/python-coded/assets/tests/prepped/js_sample_with_pred")
 
 if __name__ == '__main__':
+    from rich import print
     js = js_coded()
     py = python_coded()
 
@@ -0,0 +1,147 @@
+# cube_store.py
+# Local storage for prepared Landsat/Sentinel-2 observations. The
+# (time, band, y, x) cube is split into spatial tiles and time blocks, each one
+# a memory-mapped .npy file, so a tile's full history can be streamed without
+# loading the whole study area.
+#
+# <path>/index.json            bands, shape, tile size, dtype and time blocks
+# <path>/dates.npy             acquisition dates (datetime64[D])
+# <path>/sensors.npy           sensor id per acquisition, e.g. 'LANDSAT_5'
+# <path>/b{k}_y{i}_x{j}.npy    block k of tile (i, j): (time, band, tileY, tileX)
+import json
+import os
+from dataclasses import dataclass
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from coded_python.utils.tiling import tile_counts, tile_shape, tile_slices
+
+INDEX = 'index.json'
+
+
+@dataclass
+class CubeStore:
+    path: str
+    bands: List[str]
+    shape: Tuple[int, int]
+    tileSize: Tuple[int, int]
+    dtype: str
+    blocks: List[int]
+    dates: np.ndarray
+    sensors: np.ndarray
+
+    # -- creation and writing
+    @classmethod
+    def create(cls, path: str, bands: List[str], shape: Tuple[int, int],
+               tileSize: Tuple[int, int] = (256, 256), dtype: str = 'float32') -> 'CubeStore':
+        '''Create an empty store for a (y, x) grid with the given bands.'''
+        os.makedirs(path, exist_ok=True)
+        if os.path.exists(os.path.join(path, INDEX)):
+            raise FileExistsError(f'A cube store already exists at {path}')
+        store = cls(path=path, bands=list(bands), shape=tuple(shape), tileSize=tuple(tileSize),
+                    dtype=np.dtype(dtype).name, blocks=[],
+                    dates=np.zeros(0, dtype='datetime64[D]'), sensors=np.zeros(0, dtype='<U16'))
+        store._write_index()
+        return store
+
+    @classmethod
+    def open(cls, path: str) -> 'CubeStore':
+        with open(os.path.join(path, INDEX)) as f:
+            index = json.load(f)
+        return cls(path=path, bands=index['bands'], shape=tuple(index['shape']),
+                   tileSize=tuple(index['tileSize']), dtype=index['dtype'], blocks=index['blocks'],
+                   dates=np.load(os.path.join(path, 'dates.npy')),
+                   sensors=np.load(os.path.join(path, 'sensors.npy')))
+
+    def _write_index(self):
+        np.save(os.path.join(self.path, 'dates.npy'), self.dates)
+        np.save(os.path.join(self.path, 'sensors.npy'), self.sensors)
+        index = {'bands': self.bands, 'shape': list(self.shape), 'tileSize': list(self.tileSize),
+                 'dtype': self.dtype, 'blocks': self.blocks}
+        tmp = os.path.join(self.path, INDEX + '.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(index, f)
+        os.replace(tmp, os.path.join(self.path, INDEX))
+
+    def append(self, scenes: np.ndarray, dates, sensors) -> None:
+        '''Append acquisitions (time, band, y, x) as a new time block.
+
+        Args:
+            scenes (np.ndarray): prepared observations for the full grid, NaN where masked
+            dates: acquisition dates (time,)
+            sensors: sensor id per acquisition (time,), e.g. 'LANDSAT_8'
+        '''
+        scenes = np.asarray(scenes)
+        if scenes.shape[1:] != (len(self.bands),) + self.shape:
+            raise ValueError(f'Expected scenes shaped (time, {len(self.bands)}, {self.shape[0]}, {self.shape[1]})')
+        k = len(self.blocks)
+        for i, j, ys, xs in self.tiles():
+            np.save(self._chunk_path(k, i, j), np.ascontiguousarray(scenes[:, :, ys, xs], dtype=self.dtype))
+        self.blocks.append(len(scenes))
+        self.dates = np.concatenate([self.dates, np.asarray(dates, dtype='datetime64[D]')])
+        self.sensors = np.concatenate([self.sensors, np.asarray(sensors, dtype='<U16')])
+        self._write_index()
+
+    # -- layout
+    @property
+    def nTiles(self) -> Tuple[int, int]:
+        return tile_counts(self.shape, self.tileSize)
+
+    def tiles(self) -> Iterator[Tuple[int, int, slice, slice]]:
+        '''Tile indices and the (y, x) slices they cover.'''
+        return tile_slices(self.shape, self.tileSize)
+
+    def _chunk_path(self, block: int, i: int, j: int) -> str:
+        return os.path.join(self.path, f'b{block}_y{i}_x{j}.npy')
+
+    def _time_selection(self, start=None, end=None, where=None) -> np.ndarray:
+        keep = np.ones(len(self.dates), dtype=bool) if where is None else np.array(where, dtype=bool)
+        if start is not None:
+            keep &= self.dates >= np.datetime64(start, 'D')
+        if end is not None:
+            keep &= self.dates < np.datetime64(end, 'D')
+        return keep
+
+    # -- reading
+    def chunk(self, block: int, i: int, j: int) -> np.ndarray:
+        '''Zero-copy memory-mapped view of one time block of tile (i, j).'''
+        return np.load(self._chunk_path(block, i, j), mmap_mode='r')
+
+    def tile_views(self, i: int, j: int) -> Iterator[np.ndarray]:
+        '''Memory-mapped views of every time block of tile (i, j), oldest first.'''
+        for k in range(len(self.blocks)):
+            yield self.chunk(k, i, j)
+
+    def read_tile(self, i: int, j: int, bands: Optional[List[str]] = None,
+                  start=None, end=None, where: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        '''Full history of one tile as a (time, band, tileY, tileX) array.
+
+        Only the pages of this tile (and the requested bands and dates) are read.
+        where is an optional boolean mask over store.dates of acquisitions to keep.
+        Returns the array and its dates.
+        '''
+        keep = self._time_selection(start, end, where)
+        b = slice(None) if bands is None else [self.bands.index(name) for name in bands]
+        parts, offset = [], 0
+        for k, length in enumerate(self.blocks):
+            sel = keep[offset:offset + length]
+            offset += length
+            if sel.any():
+                parts.append(self.chunk(k, i, j)[sel][:, b])
+        if not parts:
+            ty, tx = tile_shape(self.shape, self.tileSize, i, j)
+            nb = len(self.bands) if bands is None else len(bands)
+            return np.zeros((0, nb, ty, tx), dtype=self.dtype), self.dates[keep]
+        return np.concatenate(parts), self.dates[keep]
+
+    def pixel_column(self, y: int, x: int, bands: Optional[List[str]] = None) -> np.ndarray:
+        '''Time series (time, band) of a single pixel.'''
+        i, yy = divmod(y, self.tileSize[0])
+        j, xx = divmod(x, self.tileSize[1])
+        b = slice(None) if bands is None else [self.bands.index(name) for name in bands]
+        return np.concatenate([view[:, b, yy, xx] for view in self.tile_views(i, j)])
+
+    def sensor_mask(self, sensors: List[str]) -> np.ndarray:
+        '''Boolean time mask of acquisitions from the given sensors.'''
+        return np.isin(self.sensors, sensors)
@@ -0,0 +1,120 @@
+# planner.py
+# Plans the Landsat collection of simple_cols.getLandsat before any of it is
+# built: which sensors are read, which scenes pass the date, day of year and
+# bounds filters and which bands are needed downstream. The filters go on the
+# raw sensor collections, ahead of prepareL*/doIndices, so excluded scenes are
+# never masked or unmixed, disabled sensors are never loaded and unmixing is
+# skipped when no NDFI band is requested. The same plan selects the scenes and
+# bands of a local CubeStore.
+from dataclasses import dataclass
+from typing import Tuple
+
+import numpy as np
+
+from coded_python.image_collections.cube_store import CubeStore
+from coded_python.image_collections.simple_cols_local import (NDFI_BANDS, QA_SPECS, REFLECTANCE_BANDS,
+                                                              calc_ndfi_stack)
+
+# getLandsat sensor switches, in merge order: (collection id, SATELLITE property)
+SENSORS = {
+    'l4': ('LANDSAT/LT04/C01/T1_SR', 'LANDSAT_4'),
+    'l5': ('LANDSAT/LT05/C01/T1_SR', 'LANDSAT_5'),
+    'l7': ('LANDSAT/LE07/C01/T1_SR', 'LANDSAT_7'),
+    'l8': ('LANDSAT/LC08/C01/T1_SR', 'LANDSAT_8'),
+}
+DEFAULT_TARGET_BANDS = ['BLUE', 'GREEN', 'RED', 'NIR', 'SWIR1', 'SWIR2', 'TEMP',
+                        'NDFI', 'GV', 'NPV', 'Shade', 'Soil']
+
+
+@dataclass(frozen=True)
+class LandsatPlan:
+    start: str
+    end: str
+    startDoy: int
+    endDoy: int
+    # enabled getLandsat sensor keys, in merge order
+    sensors: Tuple[str, ...]
+    targetBands: Tuple[str, ...]
+    # bands kept from each prepared scene: the reflectance doIndices and
+    # targetBands need plus any other requested band of the source image
+    sceneBands: Tuple[str, ...]
+    # whether doIndices has to run at all
+    indices: bool
+    useMask: bool = True
+    region: object = None
+
+    @property
+    def satellites(self) -> Tuple[str, ...]:
+        return tuple(SENSORS[s][1] for s in self.sensors)
+
+    def raw_bands(self, sensor: str) -> Tuple[list, list]:
+        '''Source bands of a sensor and their names for the unmasked getLandsat.'''
+        bands = QA_SPECS[sensor.upper()].bands
+        names = [b for b in REFLECTANCE_BANDS if b in self.sceneBands]
+        return [bands[REFLECTANCE_BANDS.index(b)] for b in names], names
+
+    def time_mask(self, dates, satellites) -> np.ndarray:
+        '''Acquisitions (e.g. CubeStore.dates and .sensors) this plan keeps.'''
+        dates = np.asarray(dates, dtype='datetime64[D]')
+        keep = (dates >= np.datetime64(self.start, 'D')) & (dates < np.datetime64(self.end, 'D'))
+        doy = (dates - dates.astype('datetime64[Y]')).astype(int) + 1
+        if self.startDoy <= self.endDoy:
+            keep &= (doy >= self.startDoy) & (doy <= self.endDoy)
+        else:
+            # ee.Filter.dayOfYear wraps around the end of the year
+            keep &= (doy >= self.startDoy) | (doy <= self.endDoy)
+        keep &= np.isin(satellites, self.satellites)
+        return keep
+
+
+def plan_landsat(**kwargs) -> LandsatPlan:
+    '''Plan a getLandsat call; takes the same keyword arguments and defaults.'''
+    targetBands = list(kwargs.get('targetBands', DEFAULT_TARGET_BANDS))
+    ndfiParams = kwargs.get('ndfiParams', None)
+    ndfiInputs = getattr(ndfiParams, 'bands', REFLECTANCE_BANDS[:6])
+    sensors = kwargs.get('sensors', {})
+    useMask = kwargs.get('useMask', True)
+    if str(useMask).lower() == 'no':
+        useMask = False
+
+    indices = any(b in NDFI_BANDS for b in targetBands)
+    needed = set(targetBands) | (set(ndfiInputs) if indices else set())
+    sceneBands = [b for b in REFLECTANCE_BANDS if b in needed]
+    sceneBands += [b for b in targetBands if b not in REFLECTANCE_BANDS and b not in NDFI_BANDS]
+    return LandsatPlan(start=kwargs.get('start', '1980-01-01'), end=kwargs.get('end', '2021-01-01'),
+                       startDoy=kwargs.get('startDOY', 1), endDoy=kwargs.get('endDOY', 366),
+                       sensors=tuple(s for s in SENSORS if sensors.get(s, True) is True),
+                       targetBands=tuple(targetBands), sceneBands=tuple(sceneBands), indices=indices,
+                       useMask=bool(useMask), region=kwargs.get('region', None))
+
+
+def read_landsat_local(store: CubeStore, i: int, j: int, plan: LandsatPlan,
+                       ndfiParams=None) -> Tuple[np.ndarray, np.ndarray]:
+    '''Local getLandsat for tile (i, j) of a store of prepared observations.
+
+    Only the acquisitions the plan keeps and the reflectance bands it needs are
+    read, and calc_ndfi_stack only runs if an NDFI band is requested.
+
+    Args:
+        store (CubeStore): prepared observations with REFLECTANCE_BANDS
+        i (int): tile row
+        j (int): tile column
+        plan (LandsatPlan): from plan_landsat
+        ndfiParams (NDFIParams): endmembers, needed when plan.indices
+    Returns:
+        tuple: float32 (time, targetBands, tileY, tileX) and the acquisition dates
+    '''
+    where = plan.time_mask(store.dates, store.sensors)
+    reflectance = [b for b in plan.sceneBands if b in REFLECTANCE_BANDS]
+    scenes, dates = store.read_tile(i, j, bands=reflectance, where=where)
+    layers = dict(zip(reflectance, np.moveaxis(scenes, 1, 0)))
+    if plan.indices:
+        if ndfiParams is None:
+            raise ValueError('ndfiParams are needed for the NDFI bands of the plan')
+        ndfi = calc_ndfi_stack(scenes, ndfiParams, bands=reflectance)
+        layers.update(zip(NDFI_BANDS, np.moveaxis(ndfi, 1, 0)))
+    missing = [b for b in plan.targetBands if b not in layers]
+    if missing:
+        raise ValueError(f'Bands {missing} are not available locally')
+    out = np.stack([layers[b] for b in plan.targetBands], axis=1).astype(np.float32, copy=False)
+    return out, dates
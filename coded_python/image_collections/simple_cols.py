@@ -2,7 +2,8 @@
 from typing import List, Optional, Union
 import ee
 from dataclasses import dataclass, field
-ee.Initialize()
+from coded_python.image_collections.planner import SENSORS, LandsatPlan, plan_landsat
+from coded_python.utils.session import requires_session
 
 
 @dataclass
@@ -14,6 +15,7 @@ class NDFIParams:
     soil :List[float] =  field(default_factory= lambda:[.2000, .3000, .3400, .5800, .6000, .5800])
     cloud :List[float] =  field(default_factory= lambda:[.9000, .9600, .8000, .7800, .7200, .6500])
 
+@requires_session
 def calcNDFI(image, ndfiParams:NDFIParams):
 
     # /* Do spectral unmixing */
@@ -43,6 +45,7 @@ def calcNDFI(image, ndfiParams:NDFIParams):
     return out
 
 
+@requires_session
 def doIndices(collection, ndfiParams: NDFIParams):
     def indices_image(image, ndfiParams:NDFIParams):
         # // NDFI function requires surface reflectance bands only
@@ -115,81 +118,40 @@ def prepareL8(image):
     return ee.Image(image).addBands(scaled).updateMask(mask1.And(mask2).And(mask3).And(mask4))
 
 
+PREPARE = {'l4': prepareL4L5, 'l5': prepareL4L5, 'l7': prepareL7, 'l8': prepareL8}
+
+
+def _prepare(sensor: str, plan: LandsatPlan):
+    if plan.useMask:
+        prepare, bands = PREPARE[sensor], list(plan.sceneBands)
+        return lambda i: ee.Image(prepare(i)).select(bands)
+    bands, names = plan.raw_bands(sensor)
+    return lambda i: i.select(bands).rename(names)
+
+
+@requires_session
 def getLandsat(**kwargs):
-    start = kwargs.get('start', '1980-01-01')
-    end = kwargs.get('end', '2021-01-01')
-    startDoy = kwargs.get('startDOY', 1)
-    endDoy = kwargs.get('endDOY', 366)
-    region = kwargs.get('region', None)
-    targetBands = kwargs.get('targetBands', ['BLUE', 'GREEN', 'RED', 'NIR', 'SWIR1', 'SWIR2', 'TEMP',
-                                             'NDFI', 'GV', 'NPV', 'Shade', 'Soil', ])
+    # Date, day of year, bounds and sensor filters run on the raw collections,
+    # ahead of every map, see planner.plan_landsat
+    plan = plan_landsat(**kwargs)
     ndfiParams = kwargs.get('ndfiParams', NDFIParams())
-    useMask = kwargs.get('useMask', True)
-    sensors = kwargs.get(
-        'sensors', {'l4': True, 'l5': True, 'l7': True, 'l8': True})
-    
-    # // Filter using new filtering  lambda
-    collection4 = ee.ImageCollection('LANDSAT/LT04/C01/T1_SR') \
-        .filterDate(start, end)
-    collection5 = ee.ImageCollection('LANDSAT/LT05/C01/T1_SR') \
-        .filterDate(start, end)
-    collection7 = ee.ImageCollection('LANDSAT/LE07/C01/T1_SR') \
-        .filterDate(start, end)
-    collection8 = ee.ImageCollection('LANDSAT/LC08/C01/T1_SR') \
-        .filterDate(start, end)
-
-    if str(useMask).lower() == 'no':
-        useMask = False
-
-    if useMask:
-        collection8 = collection8.map(prepareL8)
-        collection7 = collection7.map(prepareL7)
-        collection5 = collection5.map(prepareL4L5)
-        collection4 = collection4.map(prepareL4L5)
-    else:
-
-        bandListL8 = ['B2', 'B3', 'B4', 'B5', 'B6', 'B7', 'B10']
-        nameListL8 = ['BLUE', 'GREEN', 'RED', 'NIR', 'SWIR1', 'SWIR2', 'TEMP']
-
-        bandListL457 = ['B1', 'B2', 'B3', 'B4', 'B5', 'B7', 'B6']
-        nameListL457 = ['BLUE', 'GREEN', 'RED',
-                        'NIR', 'SWIR1', 'SWIR2', 'TEMP']
-        collection8 = collection8.map(
-            lambda i: i.select(bandListL8).rename(nameListL8))
-        collection4 = collection4.map(
-            lambda i: i.select(bandListL457).rename(nameListL457))
-        collection5 = collection5.map(lambda i: i.select(
-            bandListL457).rename(nameListL457))
-        collection7 = collection7.map(lambda i: i.select(
-            bandListL457).rename(nameListL457))
-
-    col = collection4.merge(collection5) \
-        .merge(collection7) \
-        .merge(collection8)
-    if region:
-        col = col.filterBounds(region)
-
-    indices = doIndices(col, ndfiParams=ndfiParams).select(targetBands)
-
-    if sensors['l5'] is not True:
-        indices = indices.filterMetadata(
-            'SATELLITE', 'not_equals', 'LANDSAT_5')
-
-    if sensors['l4'] is not True:
-        indices = indices.filterMetadata(
-            'SATELLITE', 'not_equals', 'LANDSAT_4')
-
-    if sensors['l7'] is not True:
-        indices = indices.filterMetadata(
-            'SATELLITE', 'not_equals', 'LANDSAT_7')
-
-    if sensors['l8'] is not True:
-        indices = indices.filterMetadata(
-            'SATELLITE', 'not_equals', 'LANDSAT_8')
-
-    indices = indices.filter(ee.Filter.dayOfYear(startDoy, endDoy))
-
-    return ee.ImageCollection(indices)
+
+    collections = []
+    for sensor in plan.sensors:
+        collection = ee.ImageCollection(SENSORS[sensor][0]) \
+            .filterDate(plan.start, plan.end) \
+            .filter(ee.Filter.dayOfYear(plan.startDoy, plan.endDoy))
+        if plan.region:
+            collection = collection.filterBounds(plan.region)
+        collections.append(collection.map(_prepare(sensor, plan)))
+
+    col = collections[0] if collections else ee.ImageCollection([])
+    for collection in collections[1:]:
+        col = col.merge(collection)
+
+    if plan.indices and collections:
+        col = doIndices(col, ndfiParams=ndfiParams)
+    return ee.ImageCollection(col.select(list(plan.targetBands)))
 
 # /**
 #  * Mask Sentinel-2 imagery using QA band
@@ -223,6 +185,7 @@ def maskS2clouds(image):
 #  * 
 #  * @returns (ee.ImageCollection) Sentinel-2 SR and spectral indices
 #  */
+@requires_session
 def getS2(roi, ndfiParams : Optional[NDFIParams]=None):
     if ndfiParams is None:
         ndfiParams = NDFIParams()
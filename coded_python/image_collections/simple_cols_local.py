@@ -0,0 +1,296 @@
+# simple_cols_local.py
+# Local NumPy counterparts of the simple_cols preprocessing steps, applied to
+# whole (time, band, pixel) stacks instead of one ee.Image at a time.
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+ENDMEMBERS = ['gv', 'shade', 'npv', 'soil', 'cloud']
+NDFI_BANDS = ['GV', 'Shade', 'NPV', 'Soil', 'NDFI']
+# output bands of prepareL4L5/prepareL7/prepareL8 and their scaling
+REFLECTANCE_BANDS = ['BLUE', 'GREEN', 'RED', 'NIR', 'SWIR1', 'SWIR2', 'TEMP']
+SCALING = [10000, 10000, 10000, 10000, 10000, 10000, 1000]
+# maskS2clouds: source bands of REFLECTANCE_BANDS[:6] and the QA60 cloud and cirrus bits
+S2_BANDS = ('B2', 'B3', 'B4', 'B8', 'B11', 'B12')
+S2_CLOUD_BITS = (1 << 10) | (1 << 11)
+
+
+@dataclass(frozen=True)
+class QASpec:
+    '''Mask conditions of one simple_cols.prepare* function.'''
+    bands: Tuple[str, ...]
+    validQA: Tuple[int, ...]
+    validAerosol: Tuple[int, ...] = ()
+    maxValue: Optional[int] = 10000
+    maxOpacity: Optional[int] = 300
+    erode: int = 0
+
+
+_L4L5 = QASpec(bands=('B1', 'B2', 'B3', 'B4', 'B5', 'B7', 'B6'), validQA=(66, 130, 68, 132))
+QA_SPECS = {
+    'L4': _L4L5,
+    'L5': _L4L5,
+    # focal_min(2.5) removes scan line artifacts
+    'L7': QASpec(bands=_L4L5.bands, validQA=_L4L5.validQA, erode=2),
+    'L8': QASpec(bands=('B2', 'B3', 'B4', 'B5', 'B6', 'B7', 'B10'), validQA=(322, 386, 324, 388, 836, 900),
+                 validAerosol=(66, 68, 72, 80, 96, 100, 130, 132, 136, 144, 160, 164),
+                 maxValue=None, maxOpacity=None),
+}
+
+
+def _endmember_key(ndfiParams) -> Tuple[Tuple[float, ...], ...]:
+    return tuple(tuple(float(v) for v in getattr(ndfiParams, e)) for e in ENDMEMBERS)
+
+
+@lru_cache(maxsize=64)
+def _kkt_operator(key) -> Tuple[np.ndarray, np.ndarray]:
+    # Sum-to-one constrained least squares has a closed form: solving the KKT system
+    # [[E'E, 1], [1', 0]] [f, mu] = [E'y, 1] gives fractions f = W y + w0.
+    E = np.array(key, dtype=np.float64).T
+    n = E.shape[1]
+    kkt = np.zeros((n + 1, n + 1))
+    kkt[:n, :n] = E.T @ E
+    kkt[:n, n] = 1
+    kkt[n, :n] = 1
+    inv = np.linalg.pinv(kkt)
+    return inv[:n, :n] @ E.T, inv[:n, n]
+
+
+@lru_cache(maxsize=32)
+def _unmix_operator(key) -> Tuple[np.ndarray, np.ndarray]:
+    W, w0 = _kkt_operator(key)
+    return W.astype(np.float32), w0.astype(np.float32)
+
+
+def unmix_operator(ndfiParams) -> Tuple[np.ndarray, np.ndarray]:
+    '''Cached affine unmixing operator (W, w0) for a set of endmembers.
+
+    Args:
+        ndfiParams (NDFIParams): endmember spectra (gv, shade, npv, soil, cloud)
+    Returns:
+        tuple: W (5, bands) and w0 (5,) so that fractions = W @ reflectance + w0
+    '''
+    return _unmix_operator(_endmember_key(ndfiParams))
+
+
+def _subset_fractions(pixels: np.ndarray, key, free: np.ndarray) -> np.ndarray:
+    # sum-to-one fractions of every pixel over its own set of free endmembers,
+    # one matrix multiply per distinct set (the other rows of W and w0 are 0)
+    n = free.shape[1]
+    codes = free @ (1 << np.arange(n))
+    order = np.argsort(codes, kind='stable')
+    starts = np.flatnonzero(np.diff(codes[order], prepend=-1))
+    out = np.empty(free.shape)
+    for lo, hi in zip(starts, list(starts[1:]) + [len(order)]):
+        rows = order[lo:hi]
+        members = np.flatnonzero(free[rows[0]])
+        W, w0 = np.zeros((n, pixels.shape[1])), np.zeros(n)
+        W[members], w0[members] = _kkt_operator(tuple(key[i] for i in members))
+        out[rows] = pixels[rows] @ W.T + w0
+    return out
+
+
+def constrained_fractions(pixels: np.ndarray, ndfiParams, tol: float = 1e-7,
+                          maxIterations: int = 100) -> np.ndarray:
+    '''Fully constrained (sum-to-one, non-negative) least squares fractions.
+
+    Primal active set, all pixels stepping together: starting from the clipped
+    sum-to-one fractions, each pixel moves towards the sum-to-one solution over
+    its free endmembers. If that solution has a negative fraction the pixel stops where
+    the first fraction reaches 0 and drops that endmember. Once it is feasible,
+    the dropped endmember with the most negative Lagrange multiplier is freed
+    again, until none is left and the pixel is at the constrained optimum.
+
+    Args:
+        pixels (np.ndarray): (pixel, band) reflectance in ndfiParams.bands order
+        ndfiParams (NDFIParams): endmember spectra
+        tol (float): tolerance of the sign tests
+        maxIterations (int): bound on the active set steps
+    Returns:
+        np.ndarray: float64 (pixel, 5) fractions of ENDMEMBERS
+    '''
+    key = _endmember_key(ndfiParams)
+    E = np.array(key, dtype=np.float64).T
+    y = np.asarray(pixels, dtype=np.float64)
+    n = E.shape[1]
+    # feasible start: the sum-to-one solution, clipped and rescaled
+    W, w0 = _kkt_operator(key)
+    x = np.maximum(y @ W.T + w0, 0)
+    x /= x.sum(axis=1, keepdims=True)
+    # the pixels still moving, packed
+    todo, ys, xs, fs = np.arange(len(y)), y, x.copy(), x > 0
+    for _ in range(maxIterations):
+        if not len(todo):
+            break
+        z = _subset_fractions(ys, key, fs)
+        blocked = fs & (z < -tol)
+        step = blocked.any(axis=1)
+
+        # move towards z until the first blocked fraction reaches 0
+        xb, zb = xs[step], z[step]
+        ratio = np.full(xb.shape, np.inf)
+        np.divide(xb, xb - zb, out=ratio, where=blocked[step])
+        first = ratio.argmin(axis=1)
+        rows = np.arange(len(xb))
+        xb += ratio[rows, first][:, None] * (zb - xb)
+        xb[rows, first] = 0
+        fb = fs[step]
+        fb[rows, first] = False
+
+        # the others are at the optimum of their free set: release the most
+        # violated dropped endmember, or they are done
+        fo = fs[~step]
+        xo = np.where(fo, z[~step], 0)
+        gradient = (xo @ E.T - ys[~step]) @ E
+        level = (gradient * fo).sum(axis=1) / fo.sum(axis=1)
+        multiplier = np.where(fo, np.inf, gradient - level[:, None])
+        release = multiplier.argmin(axis=1)
+        violated = multiplier[np.arange(len(fo)), release] < -tol
+        fo[np.flatnonzero(violated), release[violated]] = True
+        x[todo[~step]] = xo
+
+        keep = step.copy()
+        keep[~step] = violated
+        xs[step], xs[~step], fs[step], fs[~step] = xb, xo, fb, fo
+        todo, ys, xs, fs = todo[keep], ys[keep], xs[keep], fs[keep]
+    x[todo] = xs
+    return np.maximum(x, 0)
+
+
+def calc_ndfi_stack(stack: np.ndarray, ndfiParams, bands: Optional[List[str]] = None,
+                    cloudThreshold: float = .1) -> np.ndarray:
+    '''Batch spectral unmixing and NDFI for a whole stack, like simple_cols.calcNDFI.
+
+    The sum-to-one unmixing operator is computed once per set of endmembers and
+    applied to every scene and pixel in a single float32 matrix multiply. The
+    pixels that come out with a negative fraction are solved again exactly under
+    the sum-to-one and non-negative constraints of ee.Image.unmix (see
+    constrained_fractions). NDFI and the cloud-fraction mask are computed in the
+    same pass over the output.
+
+    Args:
+        stack (np.ndarray): surface reflectance (time, band, ...) scaled to 0-1
+        ndfiParams (NDFIParams): endmembers and the reflectance bands they use
+        bands (list): names of the stack bands, defaults to ndfiParams.bands
+        cloudThreshold (float): cloud fraction at or above which pixels are masked
+    Returns:
+        np.ndarray: float32 (time, 5, ...) with NDFI_BANDS, NaN where masked
+    '''
+    W, w0 = unmix_operator(ndfiParams)
+    if bands is not None:
+        stack = stack[:, [bands.index(b) for b in ndfiParams.bands]]
+    nt, nb = stack.shape[:2]
+    rest = stack.shape[2:]
+    flat = np.asarray(stack, dtype=np.float32).reshape(nt, nb, -1)
+
+    fractions = np.matmul(W, flat)
+    fractions += w0[None, :, None]
+    t, p = np.nonzero((fractions < 0).any(axis=1))
+    if len(t):
+        fractions[t, :, p] = constrained_fractions(flat[t, :, p], ndfiParams)
+
+    # Reuse the cloud row for NDFI and mask in place:
+    # ((GV / (1 - SHADE)) - (NPV + SOIL)) / ((GV / (1 - SHADE)) + NPV + SOIL)
+    gv, shade, npv, soil, cloud = (fractions[:, i] for i in range(5))
+    cloudy = cloud >= cloudThreshold
+    with np.errstate(divide='ignore', invalid='ignore'):
+        gvs = gv / (1 - shade)
+        other = npv + soil
+        np.subtract(gvs, other, out=cloud)
+        gvs += other
+        cloud /= gvs
+    fractions[np.broadcast_to(cloudy[:, None], fractions.shape)] = np.nan
+    return fractions.reshape((nt, 5) + rest)
+
+
+@lru_cache(maxsize=16)
+def qa_lut(validCodes: Tuple[int, ...]) -> np.ndarray:
+    '''Boolean lookup table over every 16-bit QA code, True for the valid ones.'''
+    lut = np.zeros(1 << 16, dtype=bool)
+    lut[list(validCodes)] = True
+    lut.flags.writeable = False
+    return lut
+
+
+def erode(valid: np.ndarray, radius: int) -> np.ndarray:
+    '''Running minimum of a boolean (..., y, x) mask over a (2 radius + 1) square.
+
+    Done as two separable 1-D passes; ee focal_min(2.5) uses a circle, which
+    keeps the four corners of the 5x5 window this removes.
+    '''
+    out = valid.copy()
+    for axis in (-1, -2):
+        src = out.copy()
+        view, source = np.moveaxis(out, axis, -1), np.moveaxis(src, axis, -1)
+        for shift in range(1, radius + 1):
+            view[..., :-shift] &= source[..., shift:]
+            view[..., shift:] &= source[..., :-shift]
+    return out
+
+
+def prepare_landsat_stack(sensor: str, bands: np.ndarray, pixel_qa: np.ndarray, radsat_qa: np.ndarray,
+                          sr_atmos_opacity: np.ndarray = None, sr_aerosol: np.ndarray = None,
+                          out: np.ndarray = None, chunkSize: int = 16) -> np.ndarray:
+    '''Local simple_cols.prepareL4L5/prepareL7/prepareL8 for a whole stack.
+
+    QA codes are decoded through a precomputed lookup table and every mask
+    condition is combined into one boolean per pixel, scene chunk by scene
+    chunk, before reflectance is scaled straight into the float32 output.
+
+    Args:
+        sensor (str): 'L4', 'L5', 'L7' or 'L8'
+        bands (np.ndarray): raw surface reflectance (time, 7, y, x) in QASpec.bands order
+        pixel_qa (np.ndarray): (time, y, x) QA codes
+        radsat_qa (np.ndarray): (time, y, x) saturation flags
+        sr_atmos_opacity (np.ndarray): (time, y, x) opacity, -1 where unknown (L4-L7)
+        sr_aerosol (np.ndarray): (time, y, x) aerosol QA codes (L8)
+        out (np.ndarray): float32 (time, 7, y, x) to write into, e.g. a memmap
+        chunkSize (int): scenes processed at once
+    Returns:
+        np.ndarray: float32 (time, 7, y, x) REFLECTANCE_BANDS, NaN where masked
+    '''
+    spec = QA_SPECS[sensor]
+    if spec.validAerosol and sr_aerosol is None:
+        raise ValueError(f'{sensor} needs sr_aerosol')
+    if out is None:
+        out = np.empty(bands.shape, dtype=np.float32)
+    scale = (1 / np.array(SCALING, dtype=np.float32))[None, :, None, None]
+    lut = qa_lut(spec.validQA)
+    aerosol = qa_lut(spec.validAerosol) if spec.validAerosol else None
+
+    for lo in range(0, bands.shape[0], chunkSize):
+        t = slice(lo, lo + chunkSize)
+        raw = bands[t]
+        valid = lut[pixel_qa[t]]
+        valid &= radsat_qa[t] == 0
+        for b in range(raw.shape[1]):
+            valid &= raw[:, b] > 0
+            if spec.maxValue is not None:
+                valid &= raw[:, b] < spec.maxValue
+        if spec.maxOpacity is not None and sr_atmos_opacity is not None:
+            valid &= sr_atmos_opacity[t] < spec.maxOpacity
+        if aerosol is not None:
+            valid &= aerosol[sr_aerosol[t]]
+        if spec.erode:
+            valid = erode(valid, spec.erode)
+
+        dst = out[t]
+        np.multiply(raw, scale, out=dst, casting='unsafe')
+        np.copyto(dst, np.nan, where=~valid[:, None])
+    return out
+
+
+def mask_s2_stack(bands: np.ndarray, qa60: np.ndarray, out: np.ndarray = None) -> np.ndarray:
+    '''Local simple_cols.maskS2clouds for a (time, 6, y, x) stack of S2_BANDS.
+
+    Returns float32 (time, 6, y, x) REFLECTANCE_BANDS[:6], NaN where QA60 flags
+    clouds or cirrus.
+    '''
+    if out is None:
+        out = np.empty(bands.shape, dtype=np.float32)
+    np.divide(bands, np.float32(10000), out=out, casting='unsafe')
+    cloudy = (qa60 & S2_CLOUD_BITS) != 0
+    np.copyto(out, np.nan, where=cloudy[:, None])
+    return out
@@ -0,0 +1,227 @@
+# streaming.py
+# Local streaming pipeline from scene ingestion to the CCDC fit. Instead of
+# building the whole collection and then running Ccdc over it, one acquisition
+# tile at a time goes through a chain of generators:
+#
+#   prefetch(scenes) -> mask_scenes -> add_indices -> select_bands -> fit_stream
+#
+# QA masking (prepareL*/maskS2clouds), unmixing (calcNDFI) and band selection
+# (prep_collection_v2) only ever hold one scene, so their memory scales with
+# the tile size. The last stage appends each observation to per-pixel time
+# series; with flushEvery those are handed to the incremental CCDC engine every
+# flushEvery scenes, so not even the series of the whole stack is kept.
+# prefetch decodes the next scenes in a background thread, through a bounded
+# queue, while the current one is being processed.
+import queue
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from coded_python.ccdc.ccdc_local import CcdcFit, run_ccdc_local, update_ccdc_local
+from coded_python.image_collections.simple_cols_local import (NDFI_BANDS, REFLECTANCE_BANDS, calc_ndfi_stack,
+                                                              mask_s2_stack, prepare_landsat_stack)
+
+S2 = 'S2'
+_DONE = object()
+
+
+@dataclass
+class Scene:
+    '''Raw acquisition tile as read from disk.
+
+    bands are (band, y, x) in QA_SPECS[sensor].bands order for Landsat
+    ('L4', 'L5', 'L7', 'L8') or S2_BANDS for 'S2'. qa holds the (y, x) QA
+    layers the sensor's mask needs: pixel_qa, radsat_qa and sr_atmos_opacity
+    or sr_aerosol for Landsat, QA60 for Sentinel-2.
+    '''
+    date: np.datetime64
+    sensor: str
+    bands: np.ndarray
+    qa: Dict[str, np.ndarray] = field(default_factory=dict)
+
+
+@dataclass
+class Observation:
+    '''Prepared acquisition tile: float32 (band, y, x), NaN where masked.'''
+    date: np.datetime64
+    sensor: str
+    values: np.ndarray
+    bandNames: List[str]
+
+    def band(self, name: str) -> np.ndarray:
+        return self.values[self.bandNames.index(name)]
+
+
+def prefetch(items: Iterable, depth: int = 2) -> Iterator:
+    '''Iterate items in a background thread, at most depth of them ahead.
+
+    Work done while producing an item (reading and decoding a scene) overlaps
+    with whatever the consumer does with the previous one. Exceptions of the
+    producer are raised in the consumer.
+    '''
+    buffer = queue.Queue(maxsize=max(depth, 1))
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        # blocks while the queue is full, unless the consumer has gone away
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in items:
+                if not put(item):
+                    return
+            put(_DONE)
+        except BaseException as e:
+            put(e)
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = buffer.get()
+            if item is _DONE:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        # the consumer stopped early (or failed): let the producer finish
+        stop.set()
+        thread.join()
+
+
+def mask_scenes(scenes: Iterable[Scene]) -> Iterator[Observation]:
+    '''QA masking and scaling of every scene, as prepareL4L5/L7/L8 and maskS2clouds.'''
+    for scene in scenes:
+        if scene.sensor == S2:
+            values = mask_s2_stack(scene.bands[None], np.asarray(scene.qa['QA60'])[None])[0]
+            names = REFLECTANCE_BANDS[:6]
+        else:
+            qa = {name: np.asarray(layer)[None] for name, layer in scene.qa.items()}
+            values = prepare_landsat_stack(scene.sensor, scene.bands[None], qa['pixel_qa'], qa['radsat_qa'],
+                                           qa.get('sr_atmos_opacity'), qa.get('sr_aerosol'))[0]
+            names = REFLECTANCE_BANDS
+        yield Observation(date=np.datetime64(scene.date, 'D'), sensor=scene.sensor, values=values,
+                          bandNames=list(names))
+
+
+def add_indices(observations: Iterable[Observation], ndfiParams) -> Iterator[Observation]:
+    '''Append the unmixing fractions and NDFI of every observation, as doIndices.'''
+    for obs in observations:
+        ndfi = calc_ndfi_stack(obs.values[None], ndfiParams, bands=obs.bandNames)[0]
+        yield Observation(date=obs.date, sensor=obs.sensor, values=np.concatenate([obs.values, ndfi]),
+                          bandNames=obs.bandNames + NDFI_BANDS)
+
+
+def select_bands(observations: Iterable[Observation], bands: List[str]) -> Iterator[Observation]:
+    '''Keep only the given bands, in that order, as prep_collection_v2 does with classBands.'''
+    for obs in observations:
+        missing = [b for b in bands if b not in obs.bandNames]
+        if missing:
+            raise ValueError(f'{obs.sensor} observation of {obs.date} has no bands {missing}')
+        index = [obs.bandNames.index(b) for b in bands]
+        yield Observation(date=obs.date, sensor=obs.sensor, values=obs.values[index], bandNames=list(bands))
+
+
+class PixelSeries:
+    '''Per-pixel time series of one tile, grown one observation at a time.'''
+
+    def __init__(self, bandNames: List[str], capacity: int = 32):
+        self.bandNames = list(bandNames)
+        self.capacity = capacity
+        self.values = None
+        self.dates = []
+
+    def __len__(self) -> int:
+        return len(self.dates)
+
+    def add(self, obs: Observation) -> None:
+        if obs.bandNames != self.bandNames:
+            raise ValueError(f'Expected bands {self.bandNames}, got {obs.bandNames}')
+        if self.values is None:
+            self.values = np.empty((self.capacity,) + obs.values.shape, dtype=np.float32)
+        elif len(self) == len(self.values):
+            grown = np.empty((2 * len(self.values),) + self.values.shape[1:], dtype=np.float32)
+            grown[:len(self)] = self.values
+            self.values = grown
+        self.values[len(self)] = obs.values
+        self.dates.append(obs.date)
+
+    def drain(self) -> Tuple[np.ndarray, np.ndarray]:
+        '''The (time, band, y, x) cube and dates collected so far, emptying the series.'''
+        cube = self.values[:len(self)] if self.values is not None else None
+        dates = np.array(self.dates, dtype='datetime64[D]')
+        self.values, self.dates = None, []
+        return cube, dates
+
+
+def fit_stream(observations: Iterable[Observation], bandNames: List[str], change,
+               breakpointBands: Optional[List[str]] = None, flushEvery: int = None,
+               chunkSize: int = 4096) -> CcdcFit:
+    '''Run CCDC over a stream of observations of one tile.
+
+    Without flushEvery the per-pixel series are fitted once the stream ends.
+    With it, the first flushEvery observations start a run_ccdc_local(keepState=True)
+    and every following batch goes to update_ccdc_local, so only about
+    flushEvery observations are held at once. Observations must then arrive in
+    date order. A batch is only flushed when the date changes, so scenes of
+    one date (overlapping rows of a path) always go in the same batch. The
+    result matches the batch fit as far as update_ccdc_local matches a full
+    rerun, i.e. unless the first batch is too short to settle the noise floor.
+    '''
+    series, state = PixelSeries(bandNames), None
+
+    def flush():
+        cube, dates = series.drain()
+        if state is None:
+            return run_ccdc_local(cube, dates, bandNames, change, breakpointBands, chunkSize, keepState=True)
+        return update_ccdc_local(state, cube, dates, chunkSize)
+
+    for obs in observations:
+        if flushEvery and len(series) >= flushEvery and obs.date != series.dates[-1]:
+            state = flush()
+        series.add(obs)
+    if state is None:
+        if not len(series):
+            raise ValueError('No observations to fit')
+        cube, dates = series.drain()
+        return run_ccdc_local(cube, dates, bandNames, change, breakpointBands, chunkSize)
+    if len(series):
+        state = flush()
+    return state.fit
+
+
+def stream_ccdc(scenes: Iterable[Scene], bandNames: List[str], change, ndfiParams=None,
+                breakpointBands: Optional[List[str]] = None, prefetchDepth: int = 2,
+                flushEvery: int = None, chunkSize: int = 4096) -> CcdcFit:
+    '''Local prep_collection_v2 + Ccdc for one tile, streamed scene by scene.
+
+    Args:
+        scenes (iterable): Scene tiles, e.g. a generator that reads them from disk
+        bandNames (list): bands to fit, e.g. general.classBands
+        change (ChangeDetectionParams): CCDC parameters (or the dict passed to ee)
+        ndfiParams (NDFIParams): endmembers, needed if bandNames has NDFI bands
+        breakpointBands (list): bands used for the change test, defaults to all bands
+        prefetchDepth (int): scenes decoded ahead in the background, 0 to read inline
+        flushEvery (int): observations per incremental CCDC update, see fit_stream
+        chunkSize (int): pixels fitted together in one batch
+    Returns:
+        CcdcFit: ragged CCDC results of the tile
+    '''
+    stream = prefetch(scenes, prefetchDepth) if prefetchDepth else iter(scenes)
+    stream = mask_scenes(stream)
+    if any(b in NDFI_BANDS for b in bandNames):
+        if ndfiParams is None:
+            raise ValueError('ndfiParams are needed to compute the NDFI bands')
+        stream = add_indices(stream, ndfiParams)
+    stream = select_bands(stream, bandNames)
+    return fit_stream(stream, bandNames, change, breakpointBands, flushEvery, chunkSize)
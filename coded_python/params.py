@@ -1,15 +1,14 @@
-import os
-container_folder = os.path.abspath(os.path.join(
-    os.path.dirname(__file__), '..'
-))
 from dataclasses import dataclass, field, asdict
-from typing import List, Union, Optional
+from typing import List, Union, Optional, Tuple
 from coded_python.ccdc import ccdc
+from coded_python.utils.batching import Batch
+from coded_python.utils.sample_store import SampleStore, params_key, prep_samples_cached
+from coded_python.utils.session import requires_session
 import ee
-# dev
-from rich import print
 
-ee.Initialize()
+@requires_session
+def default_classifier() -> 'ee.Classifier':
+    return ee.Classifier.smileRandomForest(150)
 
 @dataclass
 class ChangeDetectionParams:
@@ -28,6 +27,7 @@ class ChangeDetectionParams:
         tmp['lambda'] = tmp.pop('_lambda')
         return tmp
         
+    @requires_session
     def get_start_end_from_col(self, start_or_end:str, col:ee.ImageCollection=None)->ee.Number:
         if col is None:
             col = self.collection
@@ -40,6 +40,14 @@ class ChangeDetectionParams:
                 'year')
         return ee.Number(year)
 
+    @requires_session
+    def get_start_end_years(self, col:ee.ImageCollection=None, batch:Batch=None)->Tuple[int, int]:
+        """client-side first and last year of the collection, resolved in one request"""
+        batch = batch or Batch()
+        start = batch.defer(self.get_start_end_from_col('start', col))
+        end = batch.defer(self.get_start_end_from_col('end', col))
+        return start.get(), end.get()
+
 @dataclass
 class GeneralParams:
     studyArea : Union[ee.FeatureCollection, ee.Geometry]
@@ -65,7 +73,7 @@ class ClassParams:
 
     classProperty: str = 'landcover'#TODO: this is the prop used for training classifier, should be parameter
     coefs: List[str] = field(default_factory = lambda:['INTP', 'SIN', 'COS', 'RMSE'])
-    classifier: ee.Classifier = ee.Classifier.smileRandomForest(150)
+    classifier: 'ee.Classifier' = field(default_factory = default_classifier)
 
     trainProp: Optional[Union[float, None]] = None
     seed: Optional[Union[int, None]] = None
@@ -77,11 +85,28 @@ class ClassParams:
     def dict(self):
         return asdict(self)
 
-    def prep_samples(self, general : GeneralParams, samples:ee.FeatureCollection = None)-> ee.FeatureCollection:
-        """ prepares sample collection by adding ccdc coefs from the formatted change output"""
+    @requires_session
+    def prep_samples(self, general : GeneralParams, samples:ee.FeatureCollection = None, bulk: bool = True,
+                     store: SampleStore = None)-> Union[ee.FeatureCollection, List[Optional[dict]]]:
+        """ prepares sample collection by adding ccdc coefs from the formatted change output
+
+        With bulk (default) samples are reduced year by year with ccdc.sampleMultiCoefs,
+        otherwise every sample gets its own coefficient image and reduceRegion.
+        With a store only samples it does not hold yet are prepped and the stored rows
+        are returned (None for dropped samples), see sample_store.to_feature and
+        sample_store.export_samples to train on them.
+        """
         # todo: make image toclassify optional and default to self.? 
         if samples is None:
             samples = self.trainingData
+
+        if store is not None:
+            key = params_key(self.imageToClassify, general.classBands, general.coefs, general.segs)
+            return prep_samples_cached(store, key, samples, lambda fc: self.prep_samples(general, fc, bulk))
+
+        if bulk:
+            return ccdc.sampleMultiCoefs(self.imageToClassify, samples, general.classBands, general.coefs,
+                                         True, general.segs, 'before')
         
         def prep_sample(feat: ee.Feature) -> ee.Feature:
             coefsForTraining = ccdc.getMultiCoefs(
@@ -0,0 +1,106 @@
+# post_process_local.py
+# Local NumPy counterpart of api_v2.post_process. One pass over row chunks
+# computes every PostProcess layer; per chunk it keeps only 2-D masks of the
+# segment being processed and two flags per pixel (a forest / a non-forest
+# break in the study period), so peak memory depends on the chunk size, not
+# the mosaic. Inputs and outputs may be np.memmap arrays.
+import os
+from typing import Dict, Tuple
+
+import numpy as np
+
+# Layers of params.PostProcess and their dtypes, dates are fractional years
+LAYERS = {
+    'Stratification': np.int8,
+    'Degradation': np.int8,
+    'Deforestation': np.int8,
+    'Both': np.int8,
+    'classificationStudyPeriod': np.int8,
+    'dateOfDeforestation': np.float32,
+    'dateOfDegradation': np.float32,
+}
+SEGMENT_LAYERS = ('classificationStudyPeriod', 'dateOfDeforestation', 'dateOfDegradation')
+
+FOREST_BREAK = 1
+OTHER_BREAK = 2
+# stratification by mask code (0 = masked, 1 = mask 1, 2 = mask 0) and break bits,
+# as make_stratification: remap([0, 1], [2, 1]) then where degradation/deforestation/both
+STRATIFICATION = np.array([[0, 3, 4, 5], [1, 3, 4, 5], [2, 3, 4, 5]], dtype=np.int8)
+
+
+def allocate_outputs(shape: Tuple[int, int], nSegments: int, directory: str = None) -> Dict[str, np.ndarray]:
+    '''Output arrays for post_process_local, in memory or as .npy memmaps in directory.'''
+    outputs = {}
+    for name, dtype in LAYERS.items():
+        layerShape = ((nSegments,) if name in SEGMENT_LAYERS else ()) + tuple(shape)
+        if directory is None:
+            outputs[name] = np.zeros(layerShape, dtype=dtype)
+        else:
+            os.makedirs(directory, exist_ok=True)
+            outputs[name] = np.lib.format.open_memmap(os.path.join(directory, f'{name}.npy'), mode='w+',
+                                                      dtype=dtype, shape=layerShape)
+    return outputs
+
+
+def _chunk(classification, tBreak, mask, rows, startYear, endYear, forestValue, out):
+    anyForest = np.zeros(mask[rows].shape, dtype=bool)
+    anyOther = np.zeros_like(anyForest)
+    for s in range(classification.shape[0]):
+        cls = classification[s, rows]
+        t = tBreak[s, rows]
+        # floor(t) in [startYear, endYear] without a floored copy
+        inside = t >= startYear
+        inside &= t < endYear + 1
+        inside &= cls != 0
+        forest = cls == forestValue
+        other = inside & ~forest
+        forest &= inside
+        anyForest |= forest
+        anyOther |= other
+
+        study = out['classificationStudyPeriod'][s, rows]
+        study[...] = 0
+        np.copyto(study, cls, where=inside, casting='unsafe')
+        for name, where in (('dateOfDegradation', forest), ('dateOfDeforestation', other)):
+            dates = out[name][s, rows]
+            dates[...] = 0
+            np.copyto(dates, t, where=where, casting='unsafe')
+
+    flags = anyForest.view(np.uint8) * FOREST_BREAK
+    flags |= anyOther.view(np.uint8) * OTHER_BREAK
+    m = mask[rows]
+    code = (m == 1).view(np.uint8) + 2 * (m == 0).view(np.uint8)
+    out['Stratification'][rows] = STRATIFICATION[code, flags]
+    for name, bits in (('Degradation', FOREST_BREAK), ('Deforestation', OTHER_BREAK),
+                       ('Both', FOREST_BREAK | OTHER_BREAK)):
+        np.equal(flags, bits, out=out[name][rows], casting='unsafe')
+
+
+def post_process_local(classification: np.ndarray, tBreak: np.ndarray, mask: np.ndarray,
+                       startYear: int, endYear: int, forestValue: int = 1,
+                       chunkPixels: int = 1 << 22, out: Dict[str, np.ndarray] = None) -> Dict[str, np.ndarray]:
+    '''Degradation, deforestation and stratification from local arrays.
+
+    Args:
+        classification (np.ndarray): (segment, y, x) classes of the segments after
+            each break (Layers.classification), 0 where masked
+        tBreak (np.ndarray): (segment, y, x) break dates in fractional years, the
+            first len(classification) tBreak bands of formattedChangeOutput
+        mask (np.ndarray): (y, x) forest mask, anything but 0 or 1 is masked
+        startYear (int): first year of the study period
+        endYear (int): last year of the study period
+        forestValue (int): forest class value
+        chunkPixels (int): pixels processed at once, bounds the temporary memory
+        out (dict): arrays from allocate_outputs to write into, e.g. memmaps
+    Returns:
+        dict: {layer: array} for every PostProcess field, (y, x) int8 layers plus
+            (segment, y, x) classificationStudyPeriod (int8) and dates (float32),
+            0 where there is no break in the study period
+    '''
+    mask = mask.reshape(mask.shape[-2:])
+    if out is None:
+        out = allocate_outputs(mask.shape, classification.shape[0])
+    step = max(1, chunkPixels // max(mask.shape[1], 1))
+    for lo in range(0, mask.shape[0], step):
+        _chunk(classification, tBreak, mask, slice(lo, lo + step), startYear, endYear, forestValue, out)
+    return out
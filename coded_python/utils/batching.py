@@ -0,0 +1,154 @@
+# batching.py
+# Coalesce client-side value requests. Values are deferred while a graph is
+# being built and resolved together in one ee.Dictionary computation, so a
+# driver that needs a size, some band names and a year range pays one round-trip
+# instead of one per value.
+#
+#   batch = Batch()
+#   size = batch.defer(col.size())
+#   names = batch.defer(col.first().bandNames())
+#   size.get(), names.get()    # one request for both
+from typing import Any, Callable, Dict, List, Optional
+
+import ee
+
+from coded_python.utils.cache import ResultCache, fingerprint
+
+_PENDING = object()
+
+
+class Deferred:
+    '''Client-side value of an ee object, resolved with the rest of its batch.'''
+
+    def __init__(self, batch: 'Batch', key: str):
+        self.batch = batch
+        self.key = key
+        self.value = _PENDING
+        self.error = None
+
+    @property
+    def resolved(self) -> bool:
+        return self.value is not _PENDING or self.error is not None
+
+    def get(self):
+        if not self.resolved:
+            self.batch.flush()
+        if self.error is not None:
+            raise self.error
+        if self.value is _PENDING:
+            raise RuntimeError(f'No value was returned for {self.key}')
+        return self.value
+
+
+class EarthEngineBackend:
+    '''Resolve pending values with a single ee.Dictionary getInfo.'''
+
+    def __init__(self):
+        self.requests = 0
+
+    def __call__(self, pending: Dict[str, Any]) -> Dict[str, Any]:
+        self.requests += 1
+        return ee.Dictionary(pending).getInfo()
+
+
+class CountingBackend:
+    '''Local stand-in backend for tests.
+
+    Each pending value is evaluated with evaluate (identity by default) and every
+    call counts as one server round-trip.
+    '''
+
+    def __init__(self, evaluate: Callable[[Any], Any] = None):
+        self.evaluate = evaluate or (lambda obj: obj)
+        self.requests = 0
+        self.batches: List[List[str]] = []
+
+    def __call__(self, pending: Dict[str, Any]) -> Dict[str, Any]:
+        self.requests += 1
+        self.batches.append(sorted(pending))
+        return {key: self.evaluate(obj) for key, obj in pending.items()}
+
+
+class Batch:
+    '''Collects deferred values and resolves them together.
+
+    Identical graphs are requested once. With a cache, values evaluated before
+    (by this or an earlier run, or by cache.cached_getinfo) are not requested
+    again. If the combined request fails, values are retried one by one so the
+    error is raised only by the value that caused it.
+
+    Args:
+        backend (callable): maps {key: ee object} to {key: value}, default EarthEngineBackend
+        cache (ResultCache): optional on-disk cache of resolved values
+        maxSize (int): flush automatically once this many values are pending
+    '''
+
+    def __init__(self, backend: Callable = None, cache: Optional[ResultCache] = None, maxSize: int = 256):
+        self.backend = backend or EarthEngineBackend()
+        self.cache = cache
+        self.maxSize = maxSize
+        self._pending: Dict[str, Any] = {}
+        self._deferred: Dict[str, Deferred] = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if exc[0] is None:
+            self.flush()
+
+    def defer(self, obj) -> Deferred:
+        key = fingerprint('getInfo', obj)
+        deferred = self._deferred.get(key)
+        if deferred is not None:
+            return deferred
+        deferred = self._deferred[key] = Deferred(self, key)
+        if self.cache is not None and key in self.cache:
+            value = self.cache.get(key, _PENDING)
+            if value is not _PENDING:
+                deferred.value = value
+                return deferred
+        self._pending[key] = obj
+        if len(self._pending) >= self.maxSize:
+            self.flush()
+        return deferred
+
+    def resolve(self, *objs) -> list:
+        '''Client-side values of objs in one request.'''
+        deferred = [self.defer(obj) for obj in objs]
+        return [d.get() for d in deferred]
+
+    def flush(self) -> None:
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        # ee.Dictionary keys must be valid property names
+        keys = {f'v{i}': key for i, key in enumerate(pending)}
+        try:
+            values = self._request(pending, keys)
+        except BaseException:
+            # connection errors, timeouts, interrupts: keep what is unresolved for the next flush
+            for key, obj in pending.items():
+                if not self._deferred[key].resolved:
+                    self._pending.setdefault(key, obj)
+            raise
+        for name, key in keys.items():
+            if name in values:
+                self._deferred[key].value = values[name]
+                if self.cache is not None:
+                    self.cache.put(key, values[name])
+
+    def _request(self, pending: Dict[str, Any], keys: Dict[str, str]) -> Dict[str, Any]:
+        try:
+            return self.backend({name: pending[key] for name, key in keys.items()})
+        except ee.EEException as e:
+            if len(pending) == 1:
+                self._deferred[next(iter(pending))].error = e
+                return {}
+            values = {}
+            for name, key in keys.items():
+                try:
+                    values.update(self.backend({name: pending[key]}))
+                except ee.EEException as single:
+                    self._deferred[key].error = single
+            return values
@@ -0,0 +1,142 @@
+# cache.py
+# Persistent content-addressed cache for pipeline results and getInfo values.
+# Keys are fingerprints of the parameter dataclasses and the serialized ee
+# graphs of their inputs, so identical runs map to identical keys.
+import dataclasses
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+from typing import Any, Callable, Optional
+
+import ee
+import numpy as np
+
+
+def _canonical(obj):
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        return {'__dataclass__': type(obj).__name__,
+                'fields': {f.name: _canonical(getattr(obj, f.name)) for f in dataclasses.fields(obj)}}
+    if isinstance(obj, ee.ComputedObject):
+        return {'__ee__': ee.serializer.toJSON(obj)}
+    if isinstance(obj, np.ndarray):
+        return {'__ndarray__': hashlib.sha256(np.ascontiguousarray(obj).tobytes()).hexdigest(),
+                'shape': list(obj.shape), 'dtype': obj.dtype.str}
+    if isinstance(obj, dict):
+        return {str(k): _canonical(v) for k, v in sorted(obj.items(), key=lambda kv: str(kv[0]))}
+    if isinstance(obj, (list, tuple)):
+        return [_canonical(v) for v in obj]
+    if isinstance(obj, (str, int, float, bool)) or obj is None:
+        return obj
+    if isinstance(obj, type):
+        return {'__type__': obj.__qualname__}
+    return {'__repr__': repr(obj)}
+
+
+def fingerprint(*objs) -> str:
+    '''Stable hash of parameters, dataclasses, numpy arrays and ee objects.'''
+    text = json.dumps([_canonical(o) for o in objs], sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+class ResultCache:
+    '''Size-bounded on-disk cache with least-recently-used eviction.
+
+    Every entry is one pickle file named after its key; file modification times
+    record the last access, so several processes can share a cache directory.
+    '''
+
+    def __init__(self, path: str, maxBytes: int = 10 * 1024 ** 3):
+        self.path = path
+        self.maxBytes = maxBytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(path, exist_ok=True)
+
+    def _file(self, key: str) -> str:
+        return os.path.join(self.path, f'{key}.pkl')
+
+    def __contains__(self, key: str) -> bool:
+        return os.path.exists(self._file(key))
+
+    def get(self, key: str, default=None):
+        try:
+            with open(self._file(key), 'rb') as f:
+                value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            self.misses += 1
+            return default
+        # mark as recently used, unless another process evicted it since the load
+        try:
+            os.utime(self._file(key))
+        except FileNotFoundError:
+            pass
+        self.hits += 1
+        return value
+
+    def put(self, key: str, value: Any) -> None:
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self._file(key))
+        self.evict()
+
+    def get_or_compute(self, key: str, compute: Callable[[], Any]):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def _entries(self) -> list:
+        # (path, stat) of every entry, skipping those another process removes meanwhile
+        entries = []
+        for entry in os.scandir(self.path):
+            if entry.name.endswith('.pkl'):
+                try:
+                    entries.append((entry.path, entry.stat()))
+                except FileNotFoundError:
+                    pass
+        return entries
+
+    def size(self) -> int:
+        return sum(stat.st_size for _, stat in self._entries())
+
+    def evict(self) -> None:
+        '''Remove least recently used entries until the cache fits in maxBytes.'''
+        entries = self._entries()
+        total = sum(stat.st_size for _, stat in entries)
+        for path, stat in sorted(entries, key=lambda e: e[1].st_mtime):
+            if total <= self.maxBytes:
+                break
+            total -= stat.st_size
+            try:
+                os.remove(path)
+                self.evictions += 1
+            except FileNotFoundError:
+                pass
+
+    def clear(self) -> None:
+        for entry in os.scandir(self.path):
+            if entry.name.endswith('.pkl'):
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'hitRate': self.hits / total if total else 0.0, 'bytes': self.size()}
+
+
+_MISSING = object()
+
+
+def cached_getinfo(obj: ee.ComputedObject, cache: Optional[ResultCache] = None):
+    '''obj.getInfo(), served from cache when the same graph was evaluated before.'''
+    if cache is None:
+        return obj.getInfo()
+    return cache.get_or_compute(fingerprint('getInfo', obj), obj.getInfo)
@@ -1,18 +1,229 @@
+import json
+import os
+import time
+from dataclasses import asdict, dataclass
+from typing import Callable, Dict, List, Optional
+
 import ee
-ee.Initialize()
+from coded_python.utils.session import requires_session
+
+# export task states, as reported by ee.batch.Task.status()
+ACTIVE_STATES = ('READY', 'RUNNING', 'CANCEL_REQUESTED')
+DONE_STATES = ('COMPLETED', 'FAILED', 'CANCELLED')
+
+
+class EarthEngineExportBackend:
+    """Starts ee.batch tasks and polls their status."""
+
+    def start(self, task, description: str) -> str:
+        task.start()
+        return task.id
+
+    def status(self, taskIds: List[str]) -> Dict[str, dict]:
+        return {s['id']: s for s in ee.data.getTaskStatus(taskIds)}
+
+
+class LocalExportBackend:
+    """Local stand-in for ee.batch used in tests.
+
+    Every poll moves a task one step through READY, RUNNING and COMPLETED. The
+    first failures[description] attempts of a task end in FAILED instead.
+    """
+
+    def __init__(self, failures: Dict[str, int] = None, startFailures: Dict[str, int] = None):
+        self.failures = dict(failures or {})
+        self.startFailures = dict(startFailures or {})
+        self.tasks: Dict[str, dict] = {}
+        self.started: List[str] = []
+        self.polls = 0
+
+    def start(self, task, description: str) -> str:
+        if self.startFailures.get(description, 0) > 0:
+            self.startFailures[description] -= 1
+            raise ee.EEException('Too many tasks already in the queue')
+        taskId = f'LOCAL{len(self.started)}'
+        fail = self.failures.get(description, 0) > 0
+        if fail:
+            self.failures[description] -= 1
+        self.tasks[taskId] = {'id': taskId, 'description': description, 'state': 'READY', 'fail': fail}
+        self.started.append(description)
+        return taskId
+
+    def status(self, taskIds: List[str]) -> Dict[str, dict]:
+        self.polls += 1
+        result = {}
+        for taskId in taskIds:
+            task = self.tasks.get(taskId)
+            if task is None:
+                result[taskId] = {'id': taskId, 'state': 'UNKNOWN'}
+                continue
+            if task['state'] == 'READY':
+                task['state'] = 'RUNNING'
+            elif task['state'] == 'RUNNING':
+                task['state'] = 'FAILED' if task['fail'] else 'COMPLETED'
+                if task['fail']:
+                    task['error_message'] = 'Computation timed out.'
+            result[taskId] = {k: v for k, v in task.items() if k != 'fail'}
+        return result
+
+
+@dataclass
+class ExportJob:
+    description: str
+    state: str = 'PENDING'
+    taskId: Optional[str] = None
+    attempts: int = 0
+    error: Optional[str] = None
+    # where the export writes to, jobs with the same description and a different path are distinct
+    path: Optional[str] = None
+
+    @property
+    def key(self) -> str:
+        return self.description if self.path is None else f'{self.path}/{self.description}'
+
+
+class ExportTaskManager:
+    """Submit exports with bounded concurrency and follow them to completion.
+
+    Tasks are created lazily from factories so failed exports can be resubmitted
+    with a fresh task. Job states are written to a JSON manifest after every
+    change; re-running with the same manifest skips completed exports,
+    reattaches to tasks that are still running and gives exports that had
+    failed another maxRetries resubmissions.
+
+    Jobs are keyed by export path and description (see ExportJob.key), so
+    collections exported to different paths with the same descriptions do not
+    overwrite each other's jobs.
+
+    Args:
+        manifestPath (str): JSON file with the state of every job
+        maxConcurrent (int): most tasks submitted and not finished at once
+        maxRetries (int): resubmissions of a failed export before giving up
+        pollInterval (float): first wait between status polls, in seconds
+        maxPollInterval (float): polls back off up to this interval while nothing changes
+        backend: object with start(task, description) and status(taskIds), default EarthEngineExportBackend
+        sleep (callable): replaces time.sleep in tests
+    """
+
+    def __init__(self, manifestPath: str, maxConcurrent: int = 10, maxRetries: int = 2,
+                 pollInterval: float = 10, maxPollInterval: float = 300, backend=None,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.manifestPath = manifestPath
+        self.maxConcurrent = maxConcurrent
+        self.maxRetries = maxRetries
+        self.pollInterval = pollInterval
+        self.maxPollInterval = maxPollInterval
+        self.backend = backend or EarthEngineExportBackend()
+        self.sleep = sleep
+        self.jobs: Dict[str, ExportJob] = {}
+        self._factories: Dict[str, Callable] = {}
+        if os.path.exists(manifestPath):
+            with open(manifestPath) as f:
+                for entry in json.load(f):
+                    job = ExportJob(**entry)
+                    if job.state == 'FAILED':
+                        job.state, job.attempts = 'PENDING', 0
+                    self.jobs[job.key] = job
+
+    def add(self, description: str, makeTask: Callable[[], 'ee.batch.Task'], path: str = None) -> ExportJob:
+        """Queue an export. makeTask builds the (unstarted) ee.batch task, path is where it writes to."""
+        job = ExportJob(description, path=path)
+        self._factories[job.key] = makeTask
+        return self.jobs.setdefault(job.key, job)
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(self.manifestPath)), exist_ok=True)
+        tmp = self.manifestPath + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump([asdict(job) for job in self.jobs.values()], f, indent=1)
+        os.replace(tmp, self.manifestPath)
+
+    def _failed(self, job: ExportJob, error: str) -> None:
+        job.error = error
+        job.state = 'PENDING' if job.attempts <= self.maxRetries else 'FAILED'
+
+    def _submit(self, job: ExportJob) -> None:
+        job.attempts += 1
+        try:
+            job.taskId = self.backend.start(self._factories[job.key](), job.description)
+            job.state, job.error = 'READY', None
+        except ee.EEException as e:
+            job.taskId = None
+            self._failed(job, str(e))
+
+    def summary(self) -> Dict[str, int]:
+        counts = {}
+        for job in self.jobs.values():
+            counts[job.state] = counts.get(job.state, 0) + 1
+        return counts
+
+    def run(self) -> Dict[str, int]:
+        """Submit and poll until every job has finished, returns job counts per state."""
+        interval = self.pollInterval
+        while True:
+            active = [job for job in self.jobs.values() if job.state in ACTIVE_STATES]
+            pending = [job for job in self.jobs.values()
+                       if job.state == 'PENDING' and job.key in self._factories]
+            submit = pending[:max(0, self.maxConcurrent - len(active))]
+            for job in submit:
+                self._submit(job)
+                if job.state == 'READY':
+                    active.append(job)
+            if submit:
+                self.save()
+            if not active:
+                if any(job.state == 'PENDING' and job.key in self._factories
+                       for job in self.jobs.values()):
+                    # every submission failed, wait before trying again
+                    self.sleep(interval)
+                    interval = min(interval * 2, self.maxPollInterval)
+                    continue
+                return self.summary()
+
+            self.sleep(interval)
+            statuses = self.backend.status([job.taskId for job in active])
+            changed = False
+            for job in active:
+                status = statuses.get(job.taskId, {})
+                state = status.get('state', job.state)
+                if state == job.state:
+                    continue
+                changed = True
+                if state == 'FAILED':
+                    self._failed(job, status.get('error_message'))
+                elif state in ACTIVE_STATES or state in DONE_STATES:
+                    job.state = state
+                else:
+                    # the server lost the task, submit it again
+                    self._failed(job, f'task {job.taskId} is {state}')
+            self.save()
+            interval = self.pollInterval if changed else min(interval * 2, self.maxPollInterval)
+
 
 # Export.table.toCloudStorage(collection, description, bucket, fileNamePrefix, fileFormat, selectors, maxVertices)
-def export_table_cloud(collection:ee.FeatureCollection, description:str, bucket:str, fileNamePrefix:str, fileFormat:str, selectors:list, maxVertices:int=None):
-    task = ee.batch.Export.table.toCloudStorage(collection=collection,description=description,bucket=bucket)
-    task.start()
+@requires_session
+def export_table_cloud(collection:ee.FeatureCollection, description:str, bucket:str, fileNamePrefix:str=None, fileFormat:str=None, selectors:list=None, maxVertices:int=None, manager:ExportTaskManager=None):
+    def make_task():
+        return ee.batch.Export.table.toCloudStorage(collection=collection, description=description, bucket=bucket,
+            fileNamePrefix=fileNamePrefix, fileFormat=fileFormat, selectors=selectors, maxVertices=maxVertices)
+    _start(description, make_task, manager, f'gs://{bucket}/{fileNamePrefix or description}')
     return description
     
 # Export.table.toAsset(collection, description, assetId, maxVertices)
-def export_table_asset(collection:ee.FeatureCollection, description:str, assetId:str, maxVertices: int=None):
-    task = ee.batch.Export.table.toAsset(collection, description, assetId, maxVertices)
-    task.start()
+@requires_session
+def export_table_asset(collection:ee.FeatureCollection, description:str, assetId:str, maxVertices: int=None, manager:ExportTaskManager=None):
+    _start(description, lambda: ee.batch.Export.table.toAsset(collection, description, assetId, maxVertices), manager,
+           assetId)
     return description
+
+def _start(description: str, makeTask: Callable, manager: ExportTaskManager = None, path: str = None):
+    # start now, or leave it to the manager
+    if manager is None:
+        makeTask().start()
+    else:
+        manager.add(description, makeTask, path)
     
+@requires_session
 def export_img(image,
                geometry,
                name,
@@ -20,7 +231,8 @@ def export_img(image,
                export_scale=30,
                crs=None,
                dry_run=False,
-               test=False):
+               test=False,
+               manager=None):
 
     export_path = export_path.strip('/')
 
@@ -34,35 +246,35 @@ def export_img(image,
         if test:
             name = f"test_{name}"
 
-        task = ee.batch.Export.image.toAsset(
-            image=image, description=name,
-            assetId=f'{export_path}/{name}',
-            region=geometry.geometry(),
-            scale=export_scale,
-            crs=crs,
-            maxPixels=1e13,
-            pyramidingPolicy={'.default': 'sample'}
-        )
+        def make_task():
+            return ee.batch.Export.image.toAsset(
+                image=image, description=name,
+                assetId=f'{export_path}/{name}',
+                region=geometry.geometry(),
+                scale=export_scale,
+                crs=crs,
+                maxPixels=1e13,
+                pyramidingPolicy={'.default': 'sample'}
+            )
 
-        task.start()
-        print(f'task started {name}')
+        _start(name, make_task, manager, export_path)
+        print(f'task {"queued" if manager else "started"} {name}')
     return name
 
 
-def export_image_collection(collection, export_func, geometry=None, export_path=None, export_scale=None, crs=None, test=False):
-    if geometry is None:
-        geometry = geometry
+@requires_session
+def export_image_collection(collection, export_func, geometry=None, export_path=None, export_scale=None, crs=None, test=False, manager=None):
     collection = collection.sort('system:time_start')
     col_size = collection.size()
     col_list = collection.toList(col_size)
-    col_size_local = 12
+    col_size_local = 1 if test else col_size.getInfo()
     export_descriptions = []
-    if test:
-        col_size_local = 1
+    # with a manager the exports are queued and run concurrently by manager.run()
+    extra = {} if manager is None else {'manager': manager}
     for i in range(0, col_size_local):
         img_in = ee.Image(col_list.get(i))
         desc = export_func(img_in, geometry, i,
-                           export_path, export_scale, crs, test)
+                           export_path, export_scale, crs, test=test, **extra)
         export_descriptions.append(desc)
 
     return export_descriptions
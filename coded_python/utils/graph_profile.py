@@ -0,0 +1,112 @@
+# graph_profile.py
+# Size of the ee expression graph after each CODED stage. Graphs are only
+# serialized, never sent, so profiling works offline (see session.initialize_offline).
+#
+#   profiler = GraphProfiler()
+#   outputs = coded_v2(gen, change, cls, profiler=profiler)
+#   post_process(outputs, profiler=profiler)
+#   print(profiler.table())
+import json
+from dataclasses import asdict, dataclass
+from typing import Dict, List
+
+import ee
+
+
+@dataclass
+class GraphStats:
+    stage: str
+    nodes: int  # distinct function invocations
+    depth: int  # longest chain of nested invocations
+    bytes: int  # serialized request size
+    repeated: int  # subexpressions referenced more than once
+
+
+def _walk(node, values: dict, depths: dict) -> int:
+    # depth of the deepest function invocation below node
+    if isinstance(node, list):
+        return max((_walk(v, values, depths) for v in node), default=0)
+    if not isinstance(node, dict):
+        return 0
+    if 'valueReference' in node:
+        return _walk_ref(node['valueReference'], values, depths)
+    if 'functionDefinitionValue' in node:
+        # function bodies (e.g. of map) are stored by reference
+        return _walk_ref(node['functionDefinitionValue']['body'], values, depths)
+    below = max((_walk(v, values, depths) for v in node.values()), default=0)
+    return below + 1 if 'functionInvocationValue' in node else below
+
+
+def _walk_ref(ref: str, values: dict, depths: dict) -> int:
+    if ref not in depths:
+        depths[ref] = 0  # guards against cycles
+        depths[ref] = _walk(values[ref], values, depths)
+    return depths[ref]
+
+
+def _bodies(node) -> set:
+    if isinstance(node, dict):
+        found = {node['functionDefinitionValue']['body']} if 'functionDefinitionValue' in node else set()
+        return found.union(*(_bodies(v) for v in node.values()))
+    if isinstance(node, list):
+        return set().union(*(_bodies(v) for v in node))
+    return set()
+
+
+def _count(node, key: str) -> int:
+    if isinstance(node, dict):
+        return (key in node) + sum(_count(v, key) for v in node.values())
+    if isinstance(node, list):
+        return sum(_count(v, key) for v in node)
+    return 0
+
+
+def graph_stats(obj, stage: str = '') -> GraphStats:
+    '''Serialize obj (an ee object or a list of them) and measure its graph.
+
+    The serializer stores every subexpression once; those used more than once
+    are moved to the shared value table next to the result and function
+    bodies, which is what `repeated` counts.
+    '''
+    text = ee.serializer.toJSON(obj)
+    graph = json.loads(text)
+    values = graph['values']
+    depth = _walk_ref(graph['result'], values, {})
+    shared = set(values) - {graph['result']} - _bodies(values)
+    return GraphStats(stage=stage, nodes=_count(values, 'functionInvocationValue'), depth=depth,
+                      bytes=len(text), repeated=len(shared))
+
+
+class GraphProfiler:
+    '''Collects GraphStats for every stage a pipeline records.'''
+
+    def __init__(self):
+        self.stages: List[GraphStats] = []
+
+    def record(self, stage: str, obj) -> GraphStats:
+        stats = graph_stats(obj, stage)
+        self.stages.append(stats)
+        return stats
+
+    def __getitem__(self, stage: str) -> GraphStats:
+        for stats in self.stages:
+            if stats.stage == stage:
+                return stats
+        raise KeyError(stage)
+
+    def dict(self) -> Dict[str, dict]:
+        return {s.stage: {k: v for k, v in asdict(s).items() if k != 'stage'} for s in self.stages}
+
+    def to_json(self, path: str = None) -> str:
+        text = json.dumps([asdict(s) for s in self.stages], indent=1)
+        if path:
+            with open(path, 'w') as f:
+                f.write(text)
+        return text
+
+    def table(self) -> str:
+        width = max([len(s.stage) for s in self.stages] + [5]) + 2
+        lines = [f'{"stage":<{width}}{"nodes":>8}{"depth":>7}{"bytes":>10}{"repeated":>10}']
+        for s in self.stages:
+            lines.append(f'{s.stage:<{width}}{s.nodes:>8}{s.depth:>7}{s.bytes:>10}{s.repeated:>10}')
+        return '\n'.join(lines)
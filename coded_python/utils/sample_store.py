@@ -0,0 +1,204 @@
+# sample_store.py
+# Persistent store of prepped training samples. The coefficients of a sample
+# only depend on where and when it is (id, year) and on the CCDC run they are
+# read from (paramsKey), so a growing sample set only computes its new rows.
+# Unless a stable id property is given, the id is a hash of the sample geometry:
+# system:index changes whenever a sample set is re-uploaded or merged. Stored
+# rows keep the sample geometry as GeoJSON, so they can be turned back into
+# features that filterBounds (subsetTraining) still sees.
+#
+#   store = SampleStore('samples.sqlite')
+#   rows = class_params.prep_samples(general, store=store)
+#   export_samples(rows, 'users/me/prepped_samples')  # train on the asset afterwards
+import json
+import sqlite3
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import ee
+import numpy as np
+
+from coded_python.utils.cache import fingerprint
+from coded_python.utils.exporting import ExportTaskManager, export_table_asset
+from coded_python.utils.session import requires_session
+
+# (sample id, year)
+Key = Tuple[str, float]
+# property holding the sample id while its coefficients are computed
+ID_PROPERTY = 'sampleId'
+# property holding the GeoJSON of a sample's geometry, kept in the stored rows
+GEOMETRY_PROPERTY = 'sampleGeometry'
+
+
+def geometry_key(geometry) -> str:
+    '''Sample id of a GeoJSON geometry (dict or string).'''
+    if isinstance(geometry, str):
+        geometry = json.loads(geometry)
+    return fingerprint('geometry', geometry)
+
+
+def to_feature(row: dict) -> ee.Feature:
+    '''ee.Feature of a stored row, located at the sample geometry it was prepped at.'''
+    properties = dict(row)
+    geometry = json.loads(properties.pop(GEOMETRY_PROPERTY))
+    return ee.Feature(ee.Geometry(geometry), properties)
+
+
+@requires_session
+def export_samples(rows: Iterable[Optional[dict]], assetId: str, description: str = 'prepped_samples',
+                   manager: ExportTaskManager = None) -> str:
+    '''Upload stored rows (skipping dropped samples) as a table asset.
+
+    Training then reads ee.FeatureCollection(assetId) instead of carrying
+    every row as a literal in each request.
+    '''
+    features = ee.FeatureCollection([to_feature(row) for row in rows if row is not None])
+    return export_table_asset(features, description, assetId, manager=manager)
+
+
+def params_key(imageToClassify, classBands: Sequence[str], coefs: Sequence[str], segs: Sequence[str]) -> str:
+    '''Key of the CCDC run samples are read from: its ee graph, bands, coefs and segments.'''
+    return fingerprint('samples', imageToClassify, list(classBands), list(coefs), list(segs))
+
+
+class SampleStore:
+    '''SQLite table of sample properties keyed by (sample, year, paramsKey).'''
+
+    def __init__(self, path: str):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.execute('CREATE TABLE IF NOT EXISTS samples (sample TEXT, year REAL, params TEXT, '
+                        'properties TEXT, PRIMARY KEY (sample, year, params))')
+        self.db.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self) -> None:
+        self.db.close()
+
+    def _lookup(self, paramsKey: str, keys: Sequence[Key]) -> Dict[Key, str]:
+        # one join against a temporary table instead of a query per key
+        self.db.execute('CREATE TEMP TABLE IF NOT EXISTS wanted (sample TEXT, year REAL)')
+        self.db.execute('DELETE FROM wanted')
+        self.db.executemany('INSERT INTO wanted VALUES (?, ?)', [(str(s), float(y)) for s, y in keys])
+        rows = self.db.execute('SELECT s.sample, s.year, s.properties FROM wanted w JOIN samples s '
+                               'ON s.sample = w.sample AND s.year = w.year AND s.params = ?', (paramsKey,))
+        return {(sample, year): properties for sample, year, properties in rows}
+
+    def get_many(self, paramsKey: str, keys: Sequence[Key]) -> List[Optional[dict]]:
+        '''Properties of every key, None where the sample has not been stored or was dropped.'''
+        found = self._lookup(paramsKey, keys)
+        values = [found.get((str(s), float(y))) for s, y in keys]
+        return [None if v is None else json.loads(v) for v in values]
+
+    def missing(self, paramsKey: str, keys: Sequence[Key]) -> List[Key]:
+        found = self._lookup(paramsKey, keys)
+        return [(s, y) for s, y in keys if (str(s), float(y)) not in found]
+
+    def put_many(self, paramsKey: str, rows: Iterable[Tuple[str, float, Optional[dict]]],
+                 batchSize: int = 1000) -> int:
+        '''Insert or replace (sample, year, properties) rows, one transaction per batch.
+
+        None properties record a sample prep dropped, so it is not prepped again.
+        '''
+        count, batch = 0, []
+        for sample, year, properties in rows:
+            batch.append((str(sample), float(year), paramsKey, json.dumps(properties)))
+            if len(batch) >= batchSize:
+                count += self._write(batch)
+                batch = []
+        return count + self._write(batch)
+
+    def _write(self, batch: list) -> int:
+        with self.db:
+            self.db.executemany('INSERT OR REPLACE INTO samples VALUES (?, ?, ?, ?)', batch)
+        return len(batch)
+
+    def count(self, paramsKey: str = None) -> int:
+        if paramsKey is None:
+            return self.db.execute('SELECT COUNT(*) FROM samples').fetchone()[0]
+        return self.db.execute('SELECT COUNT(*) FROM samples WHERE params = ?', (paramsKey,)).fetchone()[0]
+
+
+def cached_rows(store: SampleStore, paramsKey: str, keys: Sequence[Key],
+                compute: Callable[[List[Key]], Iterable[Tuple[str, float, dict]]],
+                batchSize: int = 5000) -> List[Optional[dict]]:
+    '''Properties of every key, computing only the ones the store does not have.
+
+    compute gets batches of at most batchSize missing keys and yields their
+    (sample, year, properties) rows, which are stored as they arrive; properties
+    are None for samples that cannot be prepped.
+    '''
+    missing = store.missing(paramsKey, keys)
+    for lo in range(0, len(missing), batchSize):
+        store.put_many(paramsKey, compute(missing[lo:lo + batchSize]))
+    return store.get_many(paramsKey, keys)
+
+
+def table(rows: Iterable[Optional[dict]]) -> Dict[str, np.ndarray]:
+    '''Columns of stored sample properties, e.g. for classification_local.training_matrix.'''
+    rows = [r for r in rows if r is not None]
+    names = sorted({name for r in rows for name in r})
+    return {name: np.array([np.nan if r.get(name) is None else r[name] for r in rows]) for name in names}
+
+
+@requires_session
+def prep_samples_cached(store: SampleStore, paramsKey: str, samples: ee.FeatureCollection,
+                        prep: Callable[[ee.FeatureCollection], ee.FeatureCollection],
+                        idProperty: str = None, yearProperty: str = 'year',
+                        batchSize: int = 5000) -> List[Optional[dict]]:
+    '''Prepped properties of every sample, running prep only on samples the store lacks.
+
+    Sample ids and years are fetched in one request, missing samples are
+    prepped and downloaded batchSize at a time. Samples prep drops are stored
+    as None, so they are not prepped again either.
+
+    Args:
+        store (SampleStore): where prepped samples are kept
+        paramsKey (str): key of the CCDC run, see params_key
+        samples (ee.FeatureCollection): training samples
+        prep (callable): adds coefficients to a collection of samples, e.g. ClassParams.prep_samples
+        idProperty (str): property that identifies a sample across runs, must stay the same
+            when the sample set is re-uploaded; default is the geometry (see geometry_key)
+        yearProperty (str): sample year property
+    Returns:
+        list: properties of every sample in collection order, including its geometry
+            (GEOMETRY_PROPERTY, see to_feature), None if prep dropped it
+    '''
+    samples = ee.FeatureCollection(samples) \
+        .map(lambda feat: feat.set(GEOMETRY_PROPERTY, ee.String.encodeJSON(feat.geometry())))
+    key = str
+    if idProperty is None:
+        idProperty, key = GEOMETRY_PROPERTY, geometry_key
+    info = ee.Dictionary({'ids': samples.aggregate_array(idProperty),
+                          'years': samples.aggregate_array(yearProperty),
+                          'size': samples.size()}).getInfo()
+    # aggregate_array skips features without the property, which would pair ids with the wrong years
+    if not len(info['ids']) == len(info['years']) == info['size']:
+        raise ValueError(f'{info["size"]} samples but {len(info["ids"])} {idProperty} and '
+                         f'{len(info["years"])} {yearProperty} values, every sample needs both')
+    ids = {key(sample): sample for sample in info['ids']}
+    keys = [(key(sample), year) for sample, year in zip(info['ids'], info['years'])]
+
+    def compute(missing: List[Key]):
+        wanted = {(sample, float(year)) for sample, year in missing}
+        subset = samples.filter(ee.Filter.And(
+            ee.Filter.inList(idProperty, ee.List(sorted({ids[sample] for sample, _ in missing}, key=str))),
+            ee.Filter.inList(yearProperty, ee.List(sorted({year for _, year in missing}))))) \
+            .map(lambda feat: feat.set(ID_PROPERTY, feat.get(idProperty)))
+        found = set()
+        for feature in prep(subset).getInfo()['features']:
+            properties = feature['properties']
+            sample = (key(properties.pop(ID_PROPERTY)), float(properties[yearProperty]))
+            # the filter also matches stored years of other missing samples
+            if sample in wanted and sample not in found:
+                found.add(sample)
+                yield sample[0], sample[1], properties
+        for sample, year in missing:
+            if (sample, float(year)) not in found:
+                yield sample, year, None
+
+    return cached_rows(store, paramsKey, keys, compute, batchSize)
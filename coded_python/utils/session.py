@@ -0,0 +1,167 @@
+# session.py
+# Lazily initialized Earth Engine session. Importing coded_python no longer
+# needs network or credentials; the session connects the first time a function
+# that builds or evaluates an ee graph is called.
+#
+# Offline mode initializes the ee client from a cached copy of the algorithm
+# signatures, so graphs can be built and serialized with no network (e.g. for
+# tests or graph-size benchmarks). The cache is written on every online
+# initialization, or point CODED_EE_ALGORITHMS at a saved catalogue.
+#
+# CODED_EE_OFFLINE=1        use offline mode on first use
+# CODED_EE_ALGORITHMS=path  algorithm catalogue to read/write
+#
+# Worker processes (e.g. the spawned pool of tiled mode) start without any ee
+# set-up; pass restore_session and session.settings() as the pool initializer
+# so they connect the same way as the caller.
+import functools
+import json
+import os
+import threading
+from typing import Optional
+
+import ee
+
+
+def default_algorithms_path() -> str:
+    cache = os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache'))
+    return os.environ.get('CODED_EE_ALGORITHMS', os.path.join(cache, 'coded_python', 'ee_algorithms.json'))
+
+
+class _Swap:
+    # Temporarily replace a module attribute
+    def __init__(self, owner, name, value):
+        self.owner, self.name, self.value = owner, name, value
+
+    def __enter__(self):
+        self.original = getattr(self.owner, self.name)
+        setattr(self.owner, self.name, self.value)
+
+    def __exit__(self, *exc):
+        setattr(self.owner, self.name, self.original)
+
+
+def _client_kwargs() -> dict:
+    # ee.Initialize arguments that reproduce a client the caller initialized itself
+    state = ee.data._get_state()
+    kwargs = {'credentials': state.credentials, 'project': state.cloud_api_user_project,
+              'url': state.cloud_api_base_url, 'cloud_api_key': state.cloud_api_key}
+    return {key: value for key, value in kwargs.items() if value is not None}
+
+
+class Session:
+    def __init__(self):
+        self.initialized = False
+        self.offline = False
+        # how the session was set up, see settings()
+        self._settings = None
+        # set up is serialized; _initializing is the thread running it, whose own
+        # ee calls during ee.Initialize must not wait for it
+        self._lock = threading.RLock()
+        self._initializing = None
+
+    def initialize(self, algorithmsPath: str = None, **kwargs):
+        '''Connect to Earth Engine (kwargs go to ee.Initialize) and cache the algorithm catalogue.'''
+        path = algorithmsPath or default_algorithms_path()
+        fetch = ee.data.getAlgorithms
+
+        def fetch_and_cache():
+            algorithms = fetch()
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp = f'{path}.{os.getpid()}.tmp'
+                with open(tmp, 'w') as f:
+                    json.dump(algorithms, f)
+                os.replace(tmp, path)
+            except OSError:
+                pass
+            return algorithms
+
+        with self._lock:
+            self._initializing = threading.get_ident()
+            try:
+                with _Swap(ee.data, 'getAlgorithms', fetch_and_cache):
+                    ee.Initialize(**kwargs)
+            finally:
+                self._initializing = None
+            self.initialized, self.offline = True, False
+            self._settings = {'offline': False, 'algorithmsPath': path, 'kwargs': dict(kwargs)}
+
+    def initialize_offline(self, algorithmsPath: str = None):
+        '''Initialize from a cached algorithm catalogue without any network access.
+
+        Graphs can be built and serialized; anything that talks to the server fails.
+        '''
+        path = algorithmsPath or default_algorithms_path()
+        if not os.path.exists(path):
+            raise FileNotFoundError(
+                f'No cached ee algorithm catalogue at {path}. Run online once or set CODED_EE_ALGORITHMS.')
+        with open(path) as f:
+            algorithms = json.load(f)
+
+        with self._lock:
+            self._initializing = threading.get_ident()
+            try:
+                ee.Reset()
+                # skip the REST client set-up (it downloads the API discovery document)
+                with _Swap(ee.data, 'initialize', lambda **kwargs: None), \
+                        _Swap(ee.data, 'getAlgorithms', lambda: algorithms), \
+                        _Swap(ee.deprecation, 'InitializeDeprecatedAssets', lambda: None):
+                    ee.Initialize(credentials=None, project='coded-offline')
+            finally:
+                self._initializing = None
+            self.initialized, self.offline = True, True
+            self._settings = {'offline': True, 'algorithmsPath': path, 'kwargs': {}}
+
+    def ensure(self):
+        '''Initialize on first use, offline if CODED_EE_OFFLINE is set.
+
+        An ee client the caller already initialized (e.g. ee.Initialize(project=...))
+        is used as it is. Threads calling this while another one initializes wait
+        for it to finish.
+        '''
+        if self.initialized or self._initializing == threading.get_ident():
+            return
+        with self._lock:
+            # another thread may have finished while this one waited
+            if self.initialized:
+                return
+            if ee.data.is_initialized():
+                self.initialized = True
+                self._settings = {'offline': False, 'algorithmsPath': None, 'kwargs': _client_kwargs()}
+                return
+            if os.environ.get('CODED_EE_OFFLINE', '').lower() in ('1', 'true', 'yes'):
+                self.initialize_offline()
+            else:
+                self.initialize()
+
+    def settings(self) -> Optional[dict]:
+        '''How this session was set up (offline, algorithmsPath, ee.Initialize kwargs), None before set-up.'''
+        return self._settings
+
+    def restore(self, settings: Optional[dict]) -> None:
+        '''Set up the same way as the session settings() came from, e.g. in a worker process.'''
+        if settings is None:
+            return
+        if settings['offline']:
+            self.initialize_offline(settings['algorithmsPath'])
+        else:
+            self.initialize(settings['algorithmsPath'], **settings['kwargs'])
+
+
+session = Session()
+
+
+def restore_session(settings: Optional[dict]) -> None:
+    '''Process pool initializer: session.restore(settings) in the worker.'''
+    session.restore(settings)
+
+
+def requires_session(func):
+    '''Decorator for functions that build or evaluate ee graphs.'''
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not session.initialized:
+            session.ensure()
+        return func(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,148 @@
+# tiling.py
+# Grid helpers for running CODED tile by tile on a process pool and stitching
+# the tiles back into full-extent arrays.
+import math
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+
+def tile_counts(shape: Tuple[int, int], tileSize: Tuple[int, int]) -> Tuple[int, int]:
+    '''Rows and columns of (ty, tx) tiles needed to cover a (y, x) shape.'''
+    return (-(-shape[0] // tileSize[0]), -(-shape[1] // tileSize[1]))
+
+
+def tile_shape(shape: Tuple[int, int], tileSize: Tuple[int, int], i: int, j: int) -> Tuple[int, int]:
+    '''(y, x) size of tile i, j, edge tiles are cut to the shape.'''
+    return (min(tileSize[0], shape[0] - i * tileSize[0]), min(tileSize[1], shape[1] - j * tileSize[1]))
+
+
+def tile_slices(shape: Tuple[int, int], tileSize: Tuple[int, int]) -> Iterator[Tuple[int, int, slice, slice]]:
+    '''Indices of the tiles covering a (y, x) shape and the (y, x) slices they cover, row by row.'''
+    ty, tx = tileSize
+    rows, cols = tile_counts(shape, tileSize)
+    for i in range(rows):
+        for j in range(cols):
+            yield (i, j, slice(i * ty, min((i + 1) * ty, shape[0])),
+                   slice(j * tx, min((j + 1) * tx, shape[1])))
+
+
+@dataclass(frozen=True)
+class Tile:
+    row: int
+    col: int
+    y0: int
+    x0: int
+    height: int
+    width: int
+
+
+@dataclass
+class Grid:
+    '''North-up pixel grid covering a study area, cut into square tiles.'''
+    crs: str
+    scale: float
+    originX: float
+    originY: float
+    height: int
+    width: int
+    tileSize: int = 512
+
+    @classmethod
+    def from_bounds(cls, bounds: Tuple[float, float, float, float], crs: str, scale: float,
+                    tileSize: int = 512) -> 'Grid':
+        '''Grid snapped to multiples of scale that covers (xmin, ymin, xmax, ymax).'''
+        xmin, ymin, xmax, ymax = bounds
+        originX = math.floor(xmin / scale) * scale
+        originY = math.ceil(ymax / scale) * scale
+        width = max(1, math.ceil((xmax - originX) / scale))
+        height = max(1, math.ceil((originY - ymin) / scale))
+        return cls(crs=crs, scale=scale, originX=originX, originY=originY,
+                   height=height, width=width, tileSize=tileSize)
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return (self.height, self.width)
+
+    def pixel_index(self, x, y) -> Tuple[np.ndarray, np.ndarray]:
+        '''Rows and columns of the pixels containing points in grid crs units, may be out of range.'''
+        rows = np.floor((self.originY - np.asarray(y, dtype=np.float64)) / self.scale).astype(np.int64)
+        cols = np.floor((np.asarray(x, dtype=np.float64) - self.originX) / self.scale).astype(np.int64)
+        return rows, cols
+
+    def tiles(self) -> List[Tile]:
+        return [Tile(row=i, col=j, y0=ys.start, x0=xs.start, height=ys.stop - ys.start, width=xs.stop - xs.start)
+                for i, j, ys, xs in tile_slices(self.shape, (self.tileSize, self.tileSize))]
+
+    def tile_bounds(self, tile: Tile) -> List[float]:
+        '''[xmin, ymin, xmax, ymax] of a tile in grid crs units.'''
+        xmin = self.originX + tile.x0 * self.scale
+        ymax = self.originY - tile.y0 * self.scale
+        return [xmin, ymax - tile.height * self.scale, xmin + tile.width * self.scale, ymax]
+
+    def pixel_grid(self, tile: Tile) -> dict:
+        '''Grid of a tile in the form ee.data.computePixels expects.'''
+        xmin, _, _, ymax = self.tile_bounds(tile)
+        return {
+            'dimensions': {'width': tile.width, 'height': tile.height},
+            'affineTransform': {'scaleX': self.scale, 'shearX': 0, 'translateX': xmin,
+                                'shearY': 0, 'scaleY': -self.scale, 'translateY': ymax},
+            'crsCode': self.crs,
+        }
+
+
+@dataclass
+class TiledOutput:
+    '''Full-extent layers stitched from tile results.
+
+    Each layer is a float32 (band, y, x) array on grid.'''
+    grid: Grid
+    layers: Dict[str, np.ndarray] = field(default_factory=dict)
+    bandNames: Dict[str, List[str]] = field(default_factory=dict)
+
+
+def stitch(grid: Grid, results: Iterable[Tuple[Tile, Dict[str, Tuple[List[str], np.ndarray]]]],
+           fill: float = 0) -> TiledOutput:
+    '''Write tile arrays into full-extent layers.
+
+    Args:
+        grid (Grid): the grid the tiles were cut from
+        results: (tile, {layer: (bandNames, (band, height, width) array)}) pairs
+        fill (float): value for pixels no tile covered
+    '''
+    out = TiledOutput(grid=grid)
+    for tile, layers in results:
+        for name, (bands, values) in layers.items():
+            if name not in out.layers:
+                out.layers[name] = np.full((len(bands),) + grid.shape, fill, dtype=np.float32)
+                out.bandNames[name] = list(bands)
+            out.layers[name][:, tile.y0:tile.y0 + tile.height, tile.x0:tile.x0 + tile.width] = values
+    return out
+
+
+def default_workers() -> int:
+    return os.cpu_count() or 1
+
+
+def run_tiles(func: Callable, jobs: List, workers: Optional[int] = None, initializer: Callable = None,
+              initargs: tuple = ()):
+    '''Run func over jobs on a process pool, yielding results as tiles finish.
+
+    Workers are started with 'spawn' so no client connection state is shared
+    between processes; initializer(*initargs) runs first in each of them (e.g.
+    session.restore_session). With workers=1 everything runs in this process.
+    '''
+    workers = workers or default_workers()
+    if workers == 1 or len(jobs) <= 1:
+        for job in jobs:
+            yield func(job)
+        return
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=min(workers, len(jobs)), mp_context=context,
+                             initializer=initializer, initargs=initargs) as pool:
+        for result in pool.map(func, jobs):
+            yield result
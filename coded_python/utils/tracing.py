@@ -0,0 +1,154 @@
+# tracing.py
+# Runtime spans for the CODED stages: wall time, CPU time, peak RSS and bytes
+# moved, exported as Chrome trace events (chrome://tracing or ui.perfetto.dev)
+# and as a summary table. Unlike graph_profile, which measures the graph each
+# stage builds, this measures what running the stage costs on this machine;
+# for the ee stages that is graph construction plus any getInfo they make, the
+# computation itself shows up in the per-tile computePixels spans of tiled mode.
+#
+#   tracer = Tracer()
+#   outputs = coded_v2(gen, change, cls, tracer=tracer)
+#   post_process(outputs, tracer=tracer)
+#   tracer.to_chrome_trace('coded.json')
+#   print(tracer.table())
+#
+# Without a tracer, span(None, name) hands back a shared no-op context, so
+# leaving tracing off costs one None check per stage.
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, List
+
+try:
+    import resource
+except ImportError:  # windows
+    resource = None
+
+_IO = '/proc/self/io'
+
+
+def peak_rss() -> int:
+    '''High-water mark of the resident set of this process in bytes, 0 if unknown.'''
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def io_counters() -> Dict[str, int]:
+    '''Bytes this process read and wrote through system calls (files and sockets alike).'''
+    try:
+        with open(_IO) as f:
+            counters = dict(line.split(':') for line in f)
+    except OSError:
+        return {'read': 0, 'written': 0}
+    return {'read': int(counters['rchar']), 'written': int(counters['wchar'])}
+
+
+class Span:
+    '''A running span, add the bytes a stage moves that the io counters cannot see.'''
+    __slots__ = ('name', 'args', 'bytes')
+
+    def __init__(self, name: str, args: dict):
+        self.name = name
+        self.args = args
+        self.bytes = 0
+
+    def add_bytes(self, n: int) -> None:
+        self.bytes += int(n)
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def add_bytes(self, n: int) -> None:
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Tracer:
+    '''Collects Chrome trace 'complete' events for every span that ends.'''
+
+    def __init__(self):
+        self.events: List[dict] = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name: str, **args):
+        current = Span(name, args)
+        io = io_counters()
+        rss = peak_rss()
+        ts = time.time_ns() // 1000
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield current
+        finally:
+            wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+            after, peak = io_counters(), peak_rss()
+            event = {
+                'name': name, 'cat': 'coded', 'ph': 'X', 'ts': ts, 'dur': round(wall * 1e6),
+                'pid': os.getpid(), 'tid': threading.get_ident(),
+                'args': dict(args, cpuSeconds=cpu, peakRss=peak, rssGrowth=peak - rss,
+                             readBytes=after['read'] - io['read'],
+                             writtenBytes=after['written'] - io['written'], bytes=current.bytes),
+            }
+            with self._lock:
+                self.events.append(event)
+
+    def merge(self, events: Iterable[dict]) -> None:
+        '''Add events recorded by another tracer, e.g. in a worker process.'''
+        with self._lock:
+            self.events.extend(events)
+
+    def to_chrome_trace(self, path: str = None) -> str:
+        text = json.dumps({'traceEvents': sorted(self.events, key=lambda e: e['ts']),
+                           'displayTimeUnit': 'ms'})
+        if path:
+            with open(path, 'w') as f:
+                f.write(text)
+        return text
+
+    def summary(self) -> Dict[str, dict]:
+        '''Totals per span name, in the order the names first finished.'''
+        stages = {}
+        for event in self.events:
+            args = event['args']
+            stage = stages.setdefault(event['name'], {'calls': 0, 'seconds': 0., 'cpuSeconds': 0.,
+                                                      'peakRss': 0, 'readBytes': 0, 'writtenBytes': 0,
+                                                      'bytes': 0})
+            stage['calls'] += 1
+            stage['seconds'] += event['dur'] / 1e6
+            stage['peakRss'] = max(stage['peakRss'], args['peakRss'])
+            for key in ('cpuSeconds', 'readBytes', 'writtenBytes', 'bytes'):
+                stage[key] += args[key]
+        return stages
+
+    def table(self) -> str:
+        stages = self.summary()
+        width = max([len(name) for name in stages] + [5]) + 2
+        lines = [f'{"stage":<{width}}{"calls":>6}{"wall s":>10}{"cpu s":>10}{"peak MB":>9}'
+                 f'{"read":>12}{"written":>12}{"bytes":>12}']
+        for name, s in stages.items():
+            lines.append(f'{name:<{width}}{s["calls"]:>6}{s["seconds"]:>10.3f}{s["cpuSeconds"]:>10.3f}'
+                         f'{s["peakRss"] / 2 ** 20:>9.1f}{s["readBytes"]:>12}{s["writtenBytes"]:>12}'
+                         f'{s["bytes"]:>12}')
+        return '\n'.join(lines)
+
+
+def span(tracer: Tracer, name: str, **args):
+    '''tracer.span(name, **args), or a no-op context when tracer is None.'''
+    if tracer is None:
+        return NULL_SPAN
+    return tracer.span(name, **args)
@@ -0,0 +1,101 @@
+# test_api_async.py
+import unittest
+import asyncio
+import time
+import sys
+import os
+
+import ee
+import numpy as np
+
+container_folder = os.path.abspath(os.path.join(
+    os.path.dirname(__file__), '..'
+))
+sys.path.insert(0, container_folder)
+from coded_python.api_async import AsyncRunner, LocalServer
+from coded_python.api_v2 import split_pixels
+from coded_python.utils.exporting import LocalExportBackend
+
+FIELDS = ['classification__s1', 'classification__s2', 'mask__constant']
+
+
+def evaluate(obj):
+    if obj == 'bad':
+        raise ee.EEException('bad value')
+    return obj * 2
+
+
+def pixels(request):
+    # one (2, 3) tile with a field per band, filled with the request's value
+    out = np.zeros((2, 3), dtype=[(name, np.float32) for name in FIELDS])
+    for k, name in enumerate(FIELDS):
+        out[name] = request['value'] + k
+    return out
+
+
+class AsyncRunnerTestCase(unittest.TestCase):
+    def run_async(self, main, **kwargs):
+        async def wrapped():
+            async with AsyncRunner(client=self.server, pollInterval=.01, maxPollInterval=.04,
+                                   **kwargs) as runner:
+                return await main(runner)
+        start = time.perf_counter()
+        result = asyncio.run(wrapped())
+        return result, time.perf_counter() - start
+
+    def testConcurrencyCap(self):
+        self.server = LocalServer(latency=.05, evaluate=evaluate)
+
+        async def main(runner):
+            return await asyncio.gather(*(runner.get_info(i) for i in range(24)))
+
+        values, seconds = self.run_async(main, maxConcurrent=4)
+        self.assertEqual(values, [2 * i for i in range(24)])
+        self.assertEqual(self.server.maxInFlight, 4)
+        # 6 rounds of 4 calls instead of 24 sequential ones
+        self.assertLess(seconds, 24 * .05 / 2)
+
+    def testManyRuns(self):
+        self.server = LocalServer(latency=.02, evaluate=evaluate, pixels=pixels,
+                                  exports=LocalExportBackend(failures={'aoi_3': 1}))
+
+        async def run(i, runner):
+            # one AOI: a year range, a tile download and an export
+            year = await runner.get_info(1000 + i)
+            layers = split_pixels(await runner.compute_pixels({'value': i}))
+            status = await runner.export(f'aoi_{i}', object)
+            return year, layers, status
+
+        async def main(runner):
+            return await asyncio.gather(*(run(i, runner) for i in range(40)))
+
+        results, seconds = self.run_async(main, maxConcurrent=10)
+        self.assertLessEqual(self.server.maxInFlight, 10)
+        self.assertGreater(self.server.maxInFlight, 1)
+        # at least five calls per run (getInfo, computePixels, start, two polls)
+        self.assertGreaterEqual(self.server.requests, 40 * 5)
+        self.assertLess(seconds, self.server.requests * .02 / 4)
+
+        year, layers, status = results[7]
+        self.assertEqual(year, 2014)
+        self.assertEqual(layers['classification'][0], ['s1', 's2'])
+        np.testing.assert_array_equal(layers['classification'][1], np.stack([np.full((2, 3), 7.),
+                                                                             np.full((2, 3), 8.)]))
+        self.assertEqual(layers['mask'][1].shape, (1, 2, 3))
+        self.assertEqual(status['state'], 'COMPLETED')
+        failed = results[3][2]
+        self.assertEqual((failed['state'], failed['error_message']), ('FAILED', 'Computation timed out.'))
+
+    def testErrors(self):
+        self.server = LocalServer(latency=.01, evaluate=evaluate)
+
+        async def main(runner):
+            return await asyncio.gather(runner.get_info(1), runner.get_info('bad'), return_exceptions=True)
+
+        (good, bad), _ = self.run_async(main, maxConcurrent=2)
+        self.assertEqual(good, 2)
+        self.assertIsInstance(bad, ee.EEException)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+# test_batching.py
+import unittest
+import sys
+import os
+import tempfile
+
+import ee
+
+container_folder = os.path.abspath(os.path.join(
+    os.path.dirname(__file__), '..'
+))
+sys.path.insert(0, container_folder)
+from coded_python.utils.batching import Batch, CountingBackend
+from coded_python.utils.cache import ResultCache
+
+
+def evaluate(obj):
+    if obj == 'bad':
+        raise ee.EEException('bad value')
+    return obj * 2
+
+
+class BatchTestCase(unittest.TestCase):
+    def testCoalesce(self):
+        backend = CountingBackend(evaluate)
+        batch = Batch(backend)
+        size, names, again = batch.defer(21), batch.defer('ab'), batch.defer(21)
+        self.assertIs(size, again)
+        self.assertEqual((size.get(), names.get()), (42, 'abab'))
+        self.assertEqual(backend.requests, 1)
+        self.assertEqual(batch.resolve(1, 2, 3), [2, 4, 6])
+        self.assertEqual(backend.requests, 2)
+
+    def testFailingValue(self):
+        backend = CountingBackend(evaluate)
+        batch = Batch(backend)
+        good, bad = batch.defer(1), batch.defer('bad')
+        self.assertEqual(good.get(), 2)
+        with self.assertRaises(ee.EEException):
+            bad.get()
+        # one combined request, then one per value
+        self.assertEqual(backend.requests, 3)
+
+    def testConnectionError(self):
+        calls = []
+
+        def flaky(pending):
+            calls.append(sorted(pending))
+            if len(calls) == 1:
+                raise ConnectionError('connection reset')
+            return {key: evaluate(obj) for key, obj in pending.items()}
+
+        batch = Batch(flaky)
+        first, second = batch.defer(1), batch.defer(2)
+        with self.assertRaises(ConnectionError):
+            first.get()
+        self.assertFalse(second.resolved)
+        # the batch is kept and sent again
+        self.assertEqual((second.get(), first.get()), (4, 2))
+        self.assertEqual(len(calls), 2)
+
+    def testMissingValue(self):
+        batch = Batch(lambda pending: {})
+        with self.assertRaises(RuntimeError):
+            batch.defer(1).get()
+
+    def testMaxSize(self):
+        backend = CountingBackend(evaluate)
+        batch = Batch(backend, maxSize=2)
+        deferred = [batch.defer(i) for i in range(5)]
+        self.assertEqual(backend.requests, 2)
+        with batch:
+            pass
+        self.assertTrue(all(d.resolved for d in deferred))
+        self.assertEqual(backend.requests, 3)
+
+    def testCache(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            backend = CountingBackend(evaluate)
+            Batch(backend, cache=ResultCache(tmp)).resolve(1, 2)
+            self.assertEqual(Batch(backend, cache=ResultCache(tmp)).resolve(2, 3), [4, 6])
+            self.assertEqual(backend.batches[-1], ['v0'])
+            self.assertEqual(backend.requests, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+# test_cache.py
+import unittest
+import sys
+import os
+import tempfile
+from unittest import mock
+from dataclasses import dataclass, field
+
+import numpy as np
+
+container_folder = os.path.abspath(os.path.join(
+    os.path.dirname(__file__), '..'
+))
+sys.path.insert(0, container_folder)
+from coded_python.utils.cache import ResultCache, fingerprint
+
+
+@dataclass
+class Params:
+    startYear: int = None
+    segs: list = field(default_factory=lambda: ['S1', 'S2'])
+
+
+class FingerprintTestCase(unittest.TestCase):
+    def testStable(self):
+        self.assertEqual(fingerprint(Params(), {'b': 1, 'a': 2}), fingerprint(Params(), {'a': 2, 'b': 1}))
+        self.assertNotEqual(fingerprint(Params()), fingerprint(Params(startYear=2015)))
+        self.assertNotEqual(fingerprint(np.zeros(3)), fingerprint(np.ones(3)))
+        self.assertEqual(fingerprint(np.arange(4)), fingerprint(np.arange(4)))
+
+
+class ResultCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def testHitMiss(self):
+        cache = ResultCache(self.tmp.name)
+        calls = []
+        compute = lambda: calls.append(1) or {'layer': np.arange(5)}
+        first = cache.get_or_compute('k', compute)
+        second = ResultCache(self.tmp.name).get_or_compute('k', compute)
+        np.testing.assert_array_equal(first['layer'], second['layer'])
+        self.assertEqual(len(calls), 1)
+        self.assertEqual((cache.hits, cache.misses), (0, 1))
+        self.assertIn('k', cache)
+        self.assertIsNone(cache.get('other'))
+        self.assertEqual(cache.stats()['misses'], 2)
+
+    def testEviction(self):
+        cache = ResultCache(self.tmp.name, maxBytes=3000)
+        for i, key in enumerate(['a', 'b', 'c']):
+            cache.put(key, np.zeros(100))
+            os.utime(cache._file(key), (i, i))
+        cache.get('a')
+        cache.put('d', np.zeros(100))
+        self.assertEqual(cache.evictions, 1)
+        self.assertNotIn('b', cache)
+        self.assertIn('a', cache)
+        self.assertLessEqual(cache.size(), 3000)
+
+    def testEvictionRace(self):
+        cache = ResultCache(self.tmp.name)
+        for key in ['a', 'b', 'c']:
+            cache.put(key, np.zeros(100))
+        cache.maxBytes = 2000
+        scandir = os.scandir
+
+        def racing(path):
+            # another process evicts 'a' between the listing and the stat
+            entries = list(scandir(path))
+            os.remove(cache._file('a'))
+            return entries
+
+        with mock.patch('os.scandir', racing):
+            cache.evict()
+        self.assertNotIn('a', cache)
+
+    def testGetRace(self):
+        cache = ResultCache(self.tmp.name)
+        cache.put('a', np.arange(3))
+        utime = os.utime
+
+        def evicted(path, *args, **kwargs):
+            # another process evicts 'a' between the load and the touch
+            os.remove(path)
+            return utime(path, *args, **kwargs)
+
+        with mock.patch('os.utime', evicted):
+            np.testing.assert_array_equal(cache.get('a'), np.arange(3))
+        self.assertEqual((cache.hits, cache.misses), (1, 0))
+
+    def testClearRace(self):
+        cache = ResultCache(self.tmp.name)
+        for key in ['a', 'b']:
+            cache.put(key, 1)
+        scandir = os.scandir
+
+        def racing(path):
+            entries = list(scandir(path))
+            os.remove(cache._file('a'))
+            return entries
+
+        with mock.patch('os.scandir', racing):
+            cache.clear()
+        self.assertNotIn('b', cache)
+        self.assertLessEqual(cache.size(), 2000)
+
+
+if __name__ == '__main__':
+    unittest.main()
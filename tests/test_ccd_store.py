@@ -0,0 +1,95 @@
+# test_ccd_store.py
+import unittest
+import tempfile
+import sys
+import os
+
+import numpy as np
+
+container_folder = os.path.abspath(os.path.join(
+    os.path.dirname(__file__), '..'
+))
+sys.path.insert(0, container_folder)
+from coded_python.ccdc.ccd_image_local import build_ccd_image
+from coded_python.ccdc.ccd_store import CcdStore
+from coded_python.ccdc.ccdc_local import CcdcFit
+
+
+def make_fit(ny=5, nx=7, bandNames=('NDFI', 'GV'), seed=0):
+    # one or two segments per pixel, most pixels never break
+    rng = np.random.default_rng(seed)
+    counts = np.where(rng.random(ny * nx) < 0.3, 2, 1)
+    counts[3] = 0
+    offsets = np.zeros(ny * nx + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    n = offsets[-1]
+    second = np.zeros(n, dtype=bool)
+    second[offsets[1:][counts == 2] - 1] = True
+    tStart = np.where(second, 2012.3, 2000.1) + rng.uniform(0, 0.5, n)
+    tEnd = np.where(second, 2021.0, 2012.2)
+    lastOfTwo = np.zeros(n, dtype=bool)
+    lastOfTwo[offsets[:-1][counts == 2]] = True
+    bands = {'tStart': tStart, 'tEnd': tEnd, 'tBreak': np.where(lastOfTwo, tEnd + 0.01, 0),
+             'changeProb': np.where(lastOfTwo, 1.0, 0), 'numObs': rng.integers(10, 300, n).astype(float)}
+    for band in bandNames:
+        coefs = rng.normal(0, 0.05, (n, 8))
+        coefs[:, 1] = rng.normal(0, 0.01, n)
+        coefs[:, 0] = rng.uniform(0.2, 0.9, n) - coefs[:, 1] * (tStart + tEnd) / 2
+        bands[f'{band}_coefs'] = coefs
+        bands[f'{band}_rmse'] = rng.uniform(0, 0.05, n)
+        bands[f'{band}_magnitude'] = np.where(lastOfTwo, rng.normal(-0.3, 0.05, n), 0)
+    return CcdcFit(shape=(ny, nx), offsets=offsets, bands=bands, bandNames=list(bandNames))
+
+
+class CcdStoreTestCase(unittest.TestCase):
+    def testRoundTrip(self):
+        fit = make_fit()
+        with tempfile.TemporaryDirectory() as tmp:
+            store = CcdStore.create(tmp, fit.bandNames, fit.shape, tileSize=(3, 4))
+            store.write(fit)
+            store = CcdStore.open(tmp)
+            tile = store.read_tile(1, 1)
+            self.assertEqual(tile.shape, (2, 3))
+            expected = fit.pixel(4, 6)
+            restored = tile.pixel(1, 2)
+            self.assertEqual(len(restored['tStart']), len(expected['tStart']))
+            np.testing.assert_allclose(restored['tStart'], expected['tStart'], atol=0.5 / 365)
+            np.testing.assert_array_equal(restored['numObs'], expected['numObs'])
+            np.testing.assert_allclose(restored['NDFI_rmse'], expected['NDFI_rmse'], atol=1e-5)
+
+            with self.assertRaises(FileExistsError):
+                CcdStore.create(tmp, fit.bandNames, fit.shape)
+
+    def testDenseImage(self):
+        fit = make_fit(ny=16, nx=16)
+        with tempfile.TemporaryDirectory() as tmp:
+            store = CcdStore.create(tmp, fit.bandNames, fit.shape, tileSize=(16, 16))
+            store.write(fit)
+            image = store.read_ccd_image(0, 0, 3)
+            dense = build_ccd_image(fit, 3, fit.bandNames)
+            self.assertLess(store.nbytes(), dense.nbytes / 2)
+
+        self.assertEqual(image.bandNames(), dense.bandNames())
+        # padding and tBreak without a break stay exactly zero
+        np.testing.assert_array_equal(image.segment == 0, dense.segment == 0)
+        np.testing.assert_allclose(image.segment, dense.segment, atol=0.5 / 365)
+        for name in ('S1_NDFI_coef_SIN', 'S2_GV_MAG', 'S1_changeProb'):
+            np.testing.assert_allclose(image[name], dense[name], atol=1e-4)
+        # normalized intercepts survive the slope rounding
+        for seg in ('S1', 'S2'):
+            middle = (dense[f'{seg}_tStart'] + dense[f'{seg}_tEnd']) / 2
+            normalized = image[f'{seg}_NDFI_coef_INTP'] + image[f'{seg}_NDFI_coef_SLP'] * middle
+            expected = dense[f'{seg}_NDFI_coef_INTP'] + dense[f'{seg}_NDFI_coef_SLP'] * middle
+            np.testing.assert_allclose(normalized, expected, atol=1e-3)
+
+    def testMissingTile(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            store = CcdStore.create(tmp, ['NDFI'], (5, 5), tileSize=(4, 4))
+            tile = store.read_tile(1, 0)
+            self.assertEqual(tile.shape, (1, 4))
+            self.assertTrue((tile.nSegments() == 0).all())
+            self.assertEqual(store.read_ccd_image(1, 0, 2).tensor.shape, (4, 2, 1, 10))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,184 @@
+# test_ccdc_local.py
+import unittest
+import tempfile
+import sys
+import os
+
+import numpy as np
+
+container_folder = os.path.abspath(os.path.join(
+    os.path.dirname(__file__), '..'
+))
+sys.path.insert(0, container_folder)
+from coded_python.ccdc.ccdc_local import CcdcState, run_ccdc_local, update_ccdc_local, to_ccdc_dates, chi_square_ppf
+from coded_python.ccdc.ccd_image_local import build_ccd_image, find_segments, get_multi_coefs, sample_multi_coefs
+
+
+def make_cube(ny=4, nx=5, nt=300, breakYear=2010, seed=0):
+    rng = np.random.default_rng(seed)
+    days = np.sort(rng.choice(np.arange(7300), nt, replace=False))
+    dates = np.datetime64('2000-01-01') + days.astype('timedelta64[D]')
+    t = to_ccdc_dates(dates)
+    seasonal = 0.5 + 0.1 * np.cos(2 * np.pi * t)
+    cube = np.broadcast_to(seasonal[:, None, None, None], (nt, 2, ny, nx)).copy()
+    cube += rng.normal(0, 0.01, cube.shape)
+    # first row of pixels loses 0.3 in both bands after the break
+    cube[t > breakYear, :, 0] -= 0.3
+    cloudy = rng.random((nt, 1, ny, nx)) < 0.2
+    cube[np.broadcast_to(cloudy, cube.shape)] = np.nan
+    return cube, dates
+
+
+class LocalCcdcTestCase(unittest.TestCase):
+    def testChiSquare(self):
+        self.assertAlmostEqual(chi_square_ppf(.9, 1), 2.7055, places=3)
+        self.assertAlmostEqual(chi_square_ppf(.99, 5), 15.0863, places=3)
+
+    def testDates(self):
+        dates = np.array(['2001-01-01', '2001-07-02'], dtype='datetime64[D]')
+        np.testing.assert_allclose(to_ccdc_dates(dates, 1), [2001, 2001 + 182 / 365])
+        self.assertEqual(to_ccdc_dates(dates, 2)[0], 978307200000)
+
+    def testBreakDetection(self):
+        cube, dates = make_cube()
+        change = {'lambda': 20 / 10000, 'minObservations': 3, 'chiSquareProbability': .9}
+        fit = run_ccdc_local(cube, dates, ['NDFI', 'GV'], change, chunkSize=7)
+
+        nSegments = fit.nSegments()
+        self.assertTrue((nSegments[0] == 2).all())
+        self.assertTrue((nSegments[1:] == 1).all())
+
+        broken = fit.pixel(0, 0)
+        self.assertAlmostEqual(broken['tBreak'][0], 2010, delta=0.3)
+        self.assertEqual(broken['tBreak'][1], 0)
+        self.assertLess(broken['NDFI_magnitude'][0], -0.25)
+        self.assertEqual(broken['NDFI_coefs'].shape, (2, 8))
+
+        stable = fit.pixel(2, 2)
+        self.assertAlmostEqual(stable['NDFI_coefs'][0][2], 0.1, delta=0.01)
+        self.assertLess(stable['NDFI_rmse'][0], 0.02)
+        self.assertGreater(fit.stats['pixelsPerSecondPerCore'], 0)
+
+    def testBandLayout(self):
+        cube, dates = make_cube(ny=1, nx=2)
+        fit = run_ccdc_local(cube, dates, ['NDFI', 'GV'], {})
+        expected = {'tStart', 'tEnd', 'tBreak', 'changeProb', 'numObs',
+                    'NDFI_coefs', 'GV_coefs', 'NDFI_rmse', 'GV_rmse', 'NDFI_magnitude', 'GV_magnitude'}
+        self.assertSetEqual(set(fit.keys()), expected)
+        self.assertEqual(fit.offsets[-1], len(fit['tStart']))
+
+
+class IncrementalCcdcTestCase(unittest.TestCase):
+    def setUp(self):
+        self.cube, self.dates = make_cube()
+        self.change = {'lambda': 20 / 10000, 'minObservations': 3, 'chiSquareProbability': .9}
+        self.full = run_ccdc_local(self.cube, self.dates, ['NDFI', 'GV'], self.change, chunkSize=7)
+
+    def update(self, split, steps=1):
+        old = self.dates < np.datetime64(split)
+        state = run_ccdc_local(self.cube[old], self.dates[old], ['NDFI', 'GV'], self.change,
+                               chunkSize=7, keepState=True)
+        rest = np.flatnonzero(~old)
+        for part in np.array_split(rest, steps):
+            state = update_ccdc_local(state, self.cube[part], self.dates[part], chunkSize=5)
+        return state
+
+    def assertSameFit(self, fit):
+        np.testing.assert_array_equal(fit.offsets, self.full.offsets)
+        for name in ('tStart', 'tEnd', 'tBreak', 'numObs'):
+            np.testing.assert_allclose(fit[name], self.full[name], err_msg=name)
+        np.testing.assert_allclose(fit['NDFI_coefs'], self.full['NDFI_coefs'], atol=1e-3)
+
+    def testUpdateAfterBreak(self):
+        self.assertSameFit(self.update('2015-01-01').fit)
+
+    def testBreakFoundByUpdate(self):
+        # the break in 2010 is only seen by the monthly updates
+        self.assertSameFit(self.update('2008-06-01', steps=12).fit)
+
+    def testShortHistory(self):
+        # the noise floor of a few months of data is far off, the update recomputes it
+        for split in ('2000-06-01', '2002-01-01'):
+            state = self.update(split)
+            self.assertSameFit(state.fit)
+            full = run_ccdc_local(self.cube, self.dates, ['NDFI', 'GV'], self.change, keepState=True)
+            np.testing.assert_allclose(state.pixels['floor'], full.pixels['floor'])
+
+    def testSaveLoad(self):
+        state = self.update('2015-01-01')
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'state.npz')
+            state.save(path)
+            loaded = CcdcState.load(path)
+        np.testing.assert_array_equal(loaded.open_rows(), state.open_rows())
+        np.testing.assert_array_equal(loaded.pendingT, state.pendingT)
+        np.testing.assert_array_equal(loaded.diffs, state.diffs)
+        self.assertEqual(loaded.params, state.params)
+        with self.assertRaises(ValueError):
+            update_ccdc_local(loaded, self.cube[:1], self.dates[:1])
+
+
+class CcdImageTestCase(unittest.TestCase):
+    def setUp(self):
+        cube, dates = make_cube()
+        self.fit = run_ccdc_local(cube, dates, ['NDFI', 'GV'], {})
+        self.image = build_ccd_image(self.fit, 3, ['NDFI', 'GV'])
+
+    def testBandNames(self):
+        names = self.image.bandNames()
+        self.assertEqual(len(names), 3 * 2 * 10 + 3 * 5)
+        self.assertEqual(names[:2], ['S1_NDFI_coef_INTP', 'S1_NDFI_coef_SLP'])
+        self.assertIn('S3_GV_MAG', names)
+        self.assertEqual(names[-1], 'S3_numObs')
+
+    def testViews(self):
+        image = self.image
+        self.assertEqual(image.tensor.dtype, np.float32)
+        intp = image['S2_NDFI_coef_INTP']
+        self.assertEqual(intp.shape, self.fit.shape)
+        self.assertTrue(np.shares_memory(intp, image.tensor))
+        self.assertTrue(np.shares_memory(image['S1_tBreak'], image.segment))
+        # pixels in the first row have a second segment, the rest are zero padded
+        self.assertTrue((image['S2_tStart'][0] > 2009).all())
+        self.assertTrue((image['S2_tStart'][1:] == 0).all())
+        self.assertTrue((image['S3_tStart'] == 0).all())
+        np.testing.assert_allclose(image['S1_GV_RMSE'][1, 1], self.fit.pixel(1, 1)['GV_rmse'][0], rtol=1e-6)
+        self.assertEqual(len(image.select('.*_tEnd')), 3)
+
+    def testFindSegments(self):
+        image = self.image
+        pixels = (np.array([0, 0, 0, 1, 1]), np.array([0, 0, 0, 1, 1]))
+        dates = np.array([2005., 2015., 1990., 2005., 2030.])
+        np.testing.assert_array_equal(find_segments(image, pixels, dates, 'normal'), [0, 1, -1, 0, -1])
+        np.testing.assert_array_equal(find_segments(image, pixels, dates, 'after'), [0, 1, 0, 0, -1])
+        np.testing.assert_array_equal(find_segments(image, pixels, dates, 'before'), [0, 1, -1, 0, 0])
+        np.testing.assert_array_equal(find_segments(image, pixels, dates, 'auto'), [0, 1, 0, 0, 0])
+
+    def testGetMultiCoefs(self):
+        image = self.image
+        pixels = np.arange(20).repeat(50)
+        dates = np.tile(np.linspace(2001, 2019, 50), 20)
+        values, names = get_multi_coefs(image, pixels, dates, ['NDFI', 'GV'], ['INTP', 'COS', 'RMSE'], True, 'before')
+        self.assertEqual(values.shape, (1000, 6))
+        self.assertEqual(names[:3], ['NDFI_INTP', 'GV_INTP', 'NDFI_COS'])
+        # normalized intercept of the stable first segment is the series mean
+        self.assertAlmostEqual(float(values[50, 0]), 0.5, delta=0.01)
+        # after the break the first row reads from the second segment
+        self.assertAlmostEqual(float(values[49, 0]), 0.2, delta=0.02)
+        raw, _ = get_multi_coefs(image, pixels[:1], dates[:1], ['NDFI'], ['INTP'], False, 'normal')
+        self.assertAlmostEqual(float(raw[0, 0]), float(image['S1_NDFI_coef_INTP'][0, 0]))
+
+    def testSampleMultiCoefs(self):
+        rows, cols = np.array([0, 0, 2, -1]), np.array([1, 1, 3, 0])
+        years = np.array([2005, 2018, 2018, 2005])
+        samples = sample_multi_coefs(self.image, rows, cols, years, ['NDFI'], ['INTP', 'RMSE'])
+        self.assertEqual(list(samples), ['NDFI_INTP', 'NDFI_RMSE'])
+        expected, _ = get_multi_coefs(self.image, (rows[:3], cols[:3]), years[:3], ['NDFI'], ['INTP', 'RMSE'],
+                                      True, 'before')
+        np.testing.assert_array_equal(samples['NDFI_INTP'][:3], expected[:, 0])
+        self.assertTrue(np.isnan(samples['NDFI_RMSE'][3]))
+        self.assertAlmostEqual(float(samples['NDFI_INTP'][1]), 0.2, delta=0.02)
+
+
+if __name__ == '__main__':
+    unittest.main()
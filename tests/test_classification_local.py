@@ -0,0 +1,69 @@
+# test_classification_local.py
+import unittest
+import sys
+import os
+
+import numpy as np
+
+container_folder = os.path.abspath(os.path.join(
+    os.path.dirname(__file__), '..'
+))
+sys.path.insert(0, container_folder)
+from coded_python.ccdc import schema
+from coded_python.ccdc.ccd_image_local import LAYER_TAGS, CcdImage, get_multi_coefs
+from coded_python.ccdc.ccdc_local import SEGMENT_TAGS
+from coded_python.ccdc.classification_local import (NODATA, NearestCentroidClassifier,
+                                                    classify_segments_local, segment_features)
+
+
+def make_image(ny=3, nx=4, seed=0):
+    # every pixel has a forest segment (NDFI ~0.8) in 2000-2010, the first row
+    # then a cleared one (NDFI ~0.2) in 2010-2020
+    rng = np.random.default_rng(seed)
+    npix, bands = ny * nx, ['NDFI', 'GV']
+    tensor = np.zeros((npix, 2, len(bands), len(LAYER_TAGS)), dtype=np.float32)
+    segment = np.zeros((npix, 2, len(SEGMENT_TAGS)), dtype=np.float32)
+    segment[:, 0, :2] = [2000, 2010]
+    tensor[:, 0, :, LAYER_TAGS.index('INTP')] = 0.8 + rng.normal(0, 0.01, (npix, len(bands)))
+    broken = np.arange(nx)
+    segment[broken, 1, :2] = [2010, 2020]
+    tensor[broken, 1, :, LAYER_TAGS.index('INTP')] = 0.2
+    tensor[:, :, :, LAYER_TAGS.index('SIN')] = 0.1
+    tensor[:, :, :, LAYER_TAGS.index('COS')] = 0.1
+    return CcdImage(shape=(ny, nx), segs=schema.segment_tags(2), bandList=bands, tensor=tensor, segment=segment)
+
+
+class LocalClassificationTestCase(unittest.TestCase):
+    def testFeaturesMatchGetMultiCoefs(self):
+        image = make_image()
+        image.tensor[:, :, :, LAYER_TAGS.index('SLP')] = 0.001
+        predictors = schema.predictor_bands(['NDFI'], ['INTP', 'SIN', 'RMSE', 'MAG'])
+        features, valid, inputs = segment_features(image, predictors)
+        self.assertEqual(inputs, ['NDFI_INTP', 'NDFI_SIN', 'NDFI_RMSE'])
+        self.assertEqual(features.dtype, np.float32)
+        self.assertEqual(features.shape, (12 + 4, 3))
+        self.assertEqual(valid.shape, (2, 12))
+
+        expected, _ = get_multi_coefs(image, np.arange(12), 2005, ['NDFI'], ['INTP', 'SIN', 'RMSE'],
+                                      behavior='normal')
+        np.testing.assert_allclose(features[:12], expected, rtol=1e-6)
+
+    def testPhaseAmplitude(self):
+        features, _, _ = segment_features(make_image(), ['GV_PHASE', 'GV_AMPLITUDE'])
+        np.testing.assert_allclose(features[0], [365 * 5 / 8, np.hypot(0.1, 0.1)], rtol=1e-5)
+
+    def testClassifySegments(self):
+        image = make_image()
+        samples = {'NDFI_INTP': [0.8, 0.79, 0.2, 0.21, np.nan], 'GV_INTP': [0.8, 0.8, 0.2, 0.2, 0.5],
+                   'NDFI_SIN': [0.1] * 5, 'GV_SIN': [0.1] * 5, 'landcover': [1, 1, 3, 3, 1]}
+        classified = classify_segments_local(image, samples, ['NDFI', 'GV'], coefs=['INTP', 'SIN'],
+                                             classifier=NearestCentroidClassifier(), chunkSize=5)
+        self.assertEqual(classified.dtype, np.int8)
+        self.assertEqual(classified.shape, (2, 3, 4))
+        self.assertTrue((classified[0] == 1).all())
+        self.assertTrue((classified[1, 0] == 3).all())
+        self.assertTrue((classified[1, 1:] == NODATA).all())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+# test_cube_store.py
+import unittest
+import tempfile
+import sys
+import os
+
+import numpy as np
+
+container_folder = os.path.abspath(os.path.join(
+    os.path.dirname(__file__), '..'
+))
+sys.path.insert(0, container_folder)
+from coded_python.image_collections.cube_store import CubeStore
+
+
+class CubeStoreTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'cube')
+        rng = np.random.default_rng(1)
+        self.cube = rng.random((7, 3, 10, 9)).astype(np.float32)
+        self.dates = np.arange('2000-01-01', '2000-01-08', dtype='datetime64[D]')
+        store = CubeStore.create(self.path, ['NDFI', 'GV', 'Shade'], (10, 9), tileSize=(4, 4))
+        store.append(self.cube[:4], self.dates[:4], ['LANDSAT_5'] * 4)
+        store.append(self.cube[4:], self.dates[4:], ['LANDSAT_7'] * 3)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def testRoundTrip(self):
+        store = CubeStore.open(self.path)
+        self.assertEqual(store.nTiles, (3, 3))
+        self.assertEqual(store.blocks, [4, 3])
+        tile, dates = store.read_tile(2, 1)
+        np.testing.assert_array_equal(tile, self.cube[:, :, 8:10, 4:8])
+        np.testing.assert_array_equal(dates, self.dates)
+        np.testing.assert_array_equal(store.pixel_column(9, 8), self.cube[:, :, 9, 8])
+        np.testing.assert_array_equal(store.sensor_mask(['LANDSAT_7']), [0, 0, 0, 0, 1, 1, 1])
+
+    def testViewsAreMemoryMapped(self):
+        store = CubeStore.open(self.path)
+        views = list(store.tile_views(0, 0))
+        self.assertEqual([v.shape for v in views], [(4, 3, 4, 4), (3, 3, 4, 4)])
+        self.assertIsInstance(views[0], np.memmap)
+
+    def testSubset(self):
+        store = CubeStore.open(self.path)
+        tile, dates = store.read_tile(0, 0, bands=['GV'], start='2000-01-03', end='2000-01-06')
+        np.testing.assert_array_equal(tile, self.cube[2:5, 1:2, :4, :4])
+        self.assertEqual(len(dates), 3)
+
+    def testCreateTwice(self):
+        with self.assertRaises(FileExistsError):
+            CubeStore.create(self.path, ['NDFI'], (10, 9))
+
+
+if __name__ == '__main__':
+    unittest.main()
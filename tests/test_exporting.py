@@ -0,0 +1,102 @@
+# test_exporting.py
+import unittest
+import sys
+import os
+import json
+import tempfile
+
+container_folder = os.path.abspath(os.path.join(
+    os.path.dirname(__file__), '..'
+))
+sys.path.insert(0, container_folder)
+from coded_python.utils.exporting import ExportTaskManager, LocalExportBackend
+
+
+class ExportTaskManagerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.manifest = os.path.join(self.tmp.name, 'exports.json')
+        self.sleeps = []
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def manager(self, backend, **kwargs):
+        return ExportTaskManager(self.manifest, backend=backend, sleep=self.sleeps.append,
+                                 pollInterval=1, maxPollInterval=4, **kwargs)
+
+    def testConcurrencyAndRetries(self):
+        backend = LocalExportBackend(failures={'aoi_1': 1, 'aoi_2': 5}, startFailures={'aoi_3': 1})
+        manager = self.manager(backend, maxConcurrent=2, maxRetries=2)
+        for i in range(5):
+            manager.add(f'aoi_{i}', object)
+        running = []
+        status = backend.status
+        def tracked(ids):
+            running.append(len(ids))
+            return status(ids)
+        backend.status = tracked
+
+        summary = manager.run()
+        self.assertEqual(summary, {'COMPLETED': 4, 'FAILED': 1})
+        self.assertLessEqual(max(running), 2)
+        self.assertEqual(manager.jobs['aoi_1'].attempts, 2)
+        self.assertEqual(manager.jobs['aoi_2'].attempts, 3)
+        self.assertEqual(manager.jobs['aoi_2'].error, 'Computation timed out.')
+        self.assertEqual(manager.jobs['aoi_3'].attempts, 2)
+        with open(self.manifest) as f:
+            states = {job['description']: job['state'] for job in json.load(f)}
+        self.assertEqual(states['aoi_0'], 'COMPLETED')
+
+    def testResume(self):
+        backend = LocalExportBackend()
+        manager = self.manager(backend)
+        manager.add('done', object)
+        manager.run()
+        # a new run with the same manifest skips finished exports
+        manager = self.manager(backend)
+        manager.add('done', object)
+        manager.add('new', object)
+        self.assertEqual(manager.run(), {'COMPLETED': 2})
+        self.assertEqual(backend.started, ['done', 'new'])
+
+    def testResumeRetriesFailed(self):
+        backend = LocalExportBackend(failures={'flaky': 3})
+        manager = self.manager(backend, maxRetries=2)
+        manager.add('flaky', object)
+        self.assertEqual(manager.run(), {'FAILED': 1})
+        # the next run gives it another maxRetries resubmissions
+        manager = self.manager(backend, maxRetries=2)
+        manager.add('flaky', object)
+        self.assertEqual(manager.run(), {'COMPLETED': 1})
+        self.assertEqual(manager.jobs['flaky'].attempts, 1)
+
+    def testSameDescriptionDifferentPath(self):
+        # export_image_collection names the images of every collection by their index
+        backend = LocalExportBackend()
+        manager = self.manager(backend)
+        manager.add('0', object, 'users/coded/change')
+        manager.run()
+        manager = self.manager(backend)
+        manager.add('0', object, 'users/coded/change')
+        manager.add('0', object, 'users/coded/stratification')
+        self.assertEqual(manager.run(), {'COMPLETED': 2})
+        self.assertEqual(backend.started, ['0', '0'])
+        self.assertEqual(sorted(manager.jobs), ['users/coded/change/0', 'users/coded/stratification/0'])
+
+    def testBackoff(self):
+        class SlowBackend(LocalExportBackend):
+            # nothing changes for the first four polls
+            def status(self, taskIds):
+                self.polls += 1
+                if self.polls <= 4:
+                    return {}
+                return super().status(taskIds)
+
+        manager = self.manager(SlowBackend())
+        manager.add('slow', object)
+        self.assertEqual(manager.run(), {'COMPLETED': 1})
+        self.assertEqual(self.sleeps, [1, 2, 4, 4, 4, 1])
+
+if __name__ == '__main__':
+    unittest.main()
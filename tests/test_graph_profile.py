@@ -0,0 +1,79 @@
+# test_graph_profile.py
+import unittest
+import json
+import tempfile
+import sys
+import os
+
+container_folder = os.path.abspath(os.path.join(
+    os.path.dirname(__file__), '..'
+))
+sys.path.insert(0, container_folder)
+import ee
+from coded_python.utils.graph_profile import GraphProfiler, graph_stats
+from coded_python.utils.session import Session
+
+
+def signature(returns, args):
+    return {'returns': returns, 'description': '',
+            'args': [{'name': n, 'type': t, 'optional': False} for n, t in args]}
+
+
+ALGORITHMS = {
+    'Image.constant': signature('Image', [('value', 'Object')]),
+    'Image.add': signature('Image', [('image1', 'Image'), ('image2', 'Image')]),
+    'Image.multiply': signature('Image', [('image1', 'Image'), ('image2', 'Image')]),
+}
+
+
+class GraphProfileTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        path = os.path.join(cls.tmp.name, 'algorithms.json')
+        with open(path, 'w') as f:
+            json.dump(ALGORITHMS, f)
+        Session().initialize_offline(path)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def testChain(self):
+        stats = graph_stats(ee.Image.constant(1).add(2).add(3), 'chain')
+        self.assertEqual(stats.stage, 'chain')
+        self.assertEqual(stats.nodes, 5)
+        self.assertEqual(stats.depth, 3)
+        self.assertEqual(stats.repeated, 0)
+        self.assertEqual(stats.bytes, len(ee.serializer.toJSON(ee.Image.constant(1).add(2).add(3))))
+
+    def testRepeatedSubexpression(self):
+        a = ee.Image.constant(1).add(2)
+        stats = graph_stats(a.multiply(a))
+        self.assertEqual(stats.repeated, 1)
+        self.assertEqual(stats.depth, 3)
+
+    def testProfiler(self):
+        profiler = GraphProfiler()
+        a = ee.Image.constant(1)
+        profiler.record('first', a)
+        profiler.record('second', [a, a.add(2)])
+        self.assertEqual(profiler['first'].nodes, 1)
+        self.assertGreater(profiler['second'].bytes, profiler['first'].bytes)
+        with self.assertRaises(KeyError):
+            profiler['missing']
+
+        lines = profiler.table().splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[1].startswith('first'))
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'profile.json')
+            profiler.to_json(path)
+            with open(path) as f:
+                saved = json.load(f)
+        self.assertEqual([s['stage'] for s in saved], ['first', 'second'])
+        self.assertEqual(profiler.dict()['first'], {k: v for k, v in saved[0].items() if k != 'stage'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+# test_planner.py
+import unittest
+import tempfile
+import sys
+import os
+from types import SimpleNamespace
+
+import numpy as np
+
+container_folder = os.path.abspath(os.path.join(
+    os.path.dirname(__file__), '..'
+))
+sys.path.insert(0, container_folder)
+from coded_python.image_collections.cube_store import CubeStore
+from coded_python.image_collections.planner import plan_landsat, read_landsat_local
+from coded_python.image_collections.simple_cols_local import REFLECTANCE_BANDS, calc_ndfi_stack
+
+NDFI_PARAMS = SimpleNamespace(
+    bands=['BLUE', 'GREEN', 'RED', 'NIR', 'SWIR1', 'SWIR2'],
+    gv=[.0500, .0900, .0400, .6100, .3000, .1000],
+    shade=[0, 0, 0, 0, 0, 0],
+    npv=[.1400, .1700, .2200, .3000, .5500, .3000],
+    soil=[.2000, .3000, .3400, .5800, .6000, .5800],
+    cloud=[.9000, .9600, .8000, .7800, .7200, .6500],
+)
+
+
+class LandsatPlanTestCase(unittest.TestCase):
+    def testDefaults(self):
+        plan = plan_landsat()
+        self.assertEqual(plan.sensors, ('l4', 'l5', 'l7', 'l8'))
+        self.assertTrue(plan.indices)
+        self.assertEqual(plan.sceneBands, tuple(REFLECTANCE_BANDS))
+
+    def testDropsSensorsAndBands(self):
+        plan = plan_landsat(sensors={'l4': False, 'l5': True, 'l7': False, 'l8': True},
+                            targetBands=['SWIR1', 'NIR'], useMask='no')
+        self.assertEqual(plan.sensors, ('l5', 'l8'))
+        self.assertEqual(plan.satellites, ('LANDSAT_5', 'LANDSAT_8'))
+        self.assertFalse(plan.indices)
+        self.assertFalse(plan.useMask)
+        self.assertEqual(plan.sceneBands, ('NIR', 'SWIR1'))
+        self.assertEqual(plan.raw_bands('l5'), (['B4', 'B5'], ['NIR', 'SWIR1']))
+        self.assertEqual(plan.raw_bands('l8'), (['B5', 'B6'], ['NIR', 'SWIR1']))
+
+    def testIndicesNeedUnmixingBands(self):
+        plan = plan_landsat(targetBands=['NDFI', 'TEMP', 'pixel_qa'])
+        self.assertTrue(plan.indices)
+        self.assertEqual(plan.sceneBands, tuple(REFLECTANCE_BANDS) + ('pixel_qa',))
+
+    def testTimeMask(self):
+        dates = np.array(['1999-12-31', '2000-01-10', '2000-06-01', '2000-12-20', '2001-01-01'],
+                         dtype='datetime64[D]')
+        sensors = ['LANDSAT_5', 'LANDSAT_5', 'LANDSAT_5', 'LANDSAT_7', 'LANDSAT_5']
+        plan = plan_landsat(start='2000-01-01', end='2001-01-01', startDOY=300, endDOY=20,
+                            sensors={'l7': False})
+        np.testing.assert_array_equal(plan.time_mask(dates, sensors), [0, 1, 0, 0, 0])
+        plan = plan_landsat(startDOY=100, endDOY=200)
+        np.testing.assert_array_equal(plan.time_mask(dates, sensors), [0, 0, 1, 0, 0])
+
+
+class LocalLandsatTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        rng = np.random.default_rng(2)
+        self.cube = rng.uniform(.01, .5, (6, 7, 4, 5)).astype(np.float32)
+        self.dates = np.array(['2000-01-05', '2000-03-01', '2000-07-01', '2001-01-05', '2001-07-01',
+                               '2002-01-01'], dtype='datetime64[D]')
+        self.store = CubeStore.create(os.path.join(self.tmp.name, 'cube'), REFLECTANCE_BANDS, (4, 5),
+                                      tileSize=(4, 5))
+        self.store.append(self.cube, self.dates, ['LANDSAT_5', 'LANDSAT_7', 'LANDSAT_5', 'LANDSAT_8',
+                                                  'LANDSAT_7', 'LANDSAT_8'])
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def testSelectsScenesAndBands(self):
+        plan = plan_landsat(start='2000-01-01', end='2002-01-01', startDOY=1, endDOY=100,
+                            sensors={'l7': False}, targetBands=['NIR', 'RED'])
+        out, dates = read_landsat_local(self.store, 0, 0, plan)
+        np.testing.assert_array_equal(dates, self.dates[[0, 3]])
+        np.testing.assert_array_equal(out, self.cube[[0, 3]][:, [3, 2]])
+
+    def testIndices(self):
+        plan = plan_landsat(targetBands=['NDFI', 'SWIR2'])
+        out, dates = read_landsat_local(self.store, 0, 0, plan, NDFI_PARAMS)
+        self.assertEqual(out.shape, (6, 2, 4, 5))
+        expected = calc_ndfi_stack(self.cube[:, :6], NDFI_PARAMS)
+        np.testing.assert_array_equal(out[:, 0], expected[:, 4])
+        np.testing.assert_array_equal(out[:, 1], self.cube[:, 5])
+        with self.assertRaises(ValueError):
+            read_landsat_local(self.store, 0, 0, plan)
+
+
+if __name__ == '__main__':
+    unittest.main()
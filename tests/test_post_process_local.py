@@ -0,0 +1,68 @@
+# test_post_process_local.py
+import unittest
+import tempfile
+import sys
+import os
+
+import numpy as np
+
+container_folder = os.path.abspath(os.path.join(
+    os.path.dirname(__file__), '..'
+))
+sys.path.insert(0, container_folder)
+from coded_python.post_process_local import allocate_outputs, post_process_local
+
+
+def make_stage(ny=7, nx=9, nSegments=3, seed=0):
+    rng = np.random.default_rng(seed)
+    classification = rng.integers(0, 4, (nSegments, ny, nx)).astype(np.int8)
+    tBreak = np.where(rng.random((nSegments, ny, nx)) < 0.7,
+                      rng.uniform(2005, 2020, (nSegments, ny, nx)), 0).astype(np.float32)
+    mask = rng.integers(-1, 2, (ny, nx)).astype(np.int8)
+    return classification, tBreak, mask
+
+
+def reference(classification, tBreak, mask, startYear, endYear, forestValue):
+    # direct translation of api_v2.make_degradation_and_deforestation and make_stratification
+    years = np.floor(tBreak)
+    valid = (years >= startYear) & (years <= endYear) & (classification != 0)
+    forest = valid & (classification == forestValue)
+    other = valid & (classification != forestValue)
+    deg, defor = forest.any(axis=0), other.any(axis=0)
+    both = deg & defor
+    stratification = np.select([mask == 1, mask == 0], [1, 2], 0)
+    stratification[deg & ~both] = 3
+    stratification[defor & ~both] = 4
+    stratification[both] = 5
+    return {'Stratification': stratification, 'Degradation': deg & ~both, 'Deforestation': defor & ~both,
+            'Both': both, 'classificationStudyPeriod': np.where(valid, classification, 0),
+            'dateOfDeforestation': np.where(other, tBreak, 0), 'dateOfDegradation': np.where(forest, tBreak, 0)}
+
+
+class PostProcessLocalTestCase(unittest.TestCase):
+    def testMatchesReference(self):
+        stage = make_stage()
+        expected = reference(*stage, 2010, 2016, 1)
+        for chunkPixels in (1, 20, 1 << 22):
+            post = post_process_local(*stage, 2010, 2016, forestValue=1, chunkPixels=chunkPixels)
+            self.assertEqual(set(post), set(expected))
+            for name, values in expected.items():
+                np.testing.assert_array_equal(post[name], values, err_msg=name)
+        self.assertEqual(post['Stratification'].dtype, np.int8)
+        self.assertEqual(post['dateOfDegradation'].dtype, np.float32)
+
+    def testMemmapOutputs(self):
+        stage = make_stage(seed=1)
+        expected = reference(*stage, 2008, 2012, 2)
+        with tempfile.TemporaryDirectory() as tmp:
+            out = allocate_outputs(stage[2].shape, stage[0].shape[0], tmp)
+            post_process_local(*stage, 2008, 2012, forestValue=2, chunkPixels=10, out=out)
+            del out
+            saved = np.load(os.path.join(tmp, 'Stratification.npy'))
+            np.testing.assert_array_equal(saved, expected['Stratification'])
+            dates = np.load(os.path.join(tmp, 'dateOfDeforestation.npy'))
+            np.testing.assert_array_equal(dates, expected['dateOfDeforestation'])
+
+
+if __name__ == '__main__':
+    unittest.main()
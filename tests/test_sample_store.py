@@ -0,0 +1,183 @@
+# test_sample_store.py
+import unittest
+import json
+import tempfile
+import sys
+import os
+from unittest import mock
+
+import ee
+import numpy as np
+
+container_folder = os.path.abspath(os.path.join(
+    os.path.dirname(__file__), '..'
+))
+sys.path.insert(0, container_folder)
+from coded_python.utils.sample_store import (GEOMETRY_PROPERTY, ID_PROPERTY, SampleStore, cached_rows, geometry_key,
+                                             prep_samples_cached, table, to_feature)
+from coded_python.utils.session import session
+
+
+def signature(returns, args):
+    return {'returns': returns, 'description': '',
+            'args': [{'name': n, 'type': t, 'optional': o} for n, t, o in args]}
+
+
+ALGORITHMS = {
+    'Collection': signature('FeatureCollection', [('features', 'List', False)]),
+    'Collection.loadTable': signature('FeatureCollection', [('tableId', 'String', False)]),
+    'Collection.map': signature('FeatureCollection', [('collection', 'FeatureCollection', False),
+                                                      ('baseAlgorithm', 'Algorithm', False),
+                                                      ('dropNulls', 'Boolean', True)]),
+    'Collection.filter': signature('FeatureCollection', [('collection', 'FeatureCollection', False),
+                                                         ('filter', 'Filter', False)]),
+    'Collection.size': signature('Integer', [('collection', 'FeatureCollection', False)]),
+    'AggregateFeatureCollection.array': signature('List', [('collection', 'FeatureCollection', False),
+                                                           ('property', 'String', False)]),
+    'Element.set': signature('Element', [('object', 'Element', False), ('key', 'String', False),
+                                         ('value', 'Object', False)]),
+    'Element.get': signature('Object', [('object', 'Element', False), ('property', 'String', False)]),
+    'Feature': signature('Feature', [('geometry', 'Geometry', False), ('metadata', 'Dictionary', True)]),
+    'Feature.geometry': signature('Geometry', [('feature', 'Element', False), ('maxError', 'ErrorMargin', True),
+                                              ('proj', 'Projection', True), ('geodesics', 'Boolean', True)]),
+    'String.encodeJSON': signature('String', [('object', 'Object', False)]),
+    'Filter.and': signature('Filter', [('filters', 'List', False)]),
+    'Filter.listContains': signature('Filter', [('leftField', 'String', True), ('rightValue', 'Object', True),
+                                                ('rightField', 'String', True), ('leftValue', 'Object', True)]),
+    'Filter.intersects': signature('Filter', [('leftField', 'String', True), ('rightValue', 'Object', True),
+                                              ('maxError', 'ErrorMargin', True)]),
+    'GeometryConstructors.Point': signature('Geometry', [('coordinates', 'List', False)]),
+    'GeometryConstructors.Polygon': signature('Geometry', [('coordinates', 'List', False),
+                                                           ('evenOdd', 'Boolean', True)]),
+}
+
+
+def point(x, y):
+    return json.dumps({'type': 'Point', 'coordinates': [x, y]})
+
+
+class SampleStoreTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'samples.sqlite')
+        self.computed = []
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def compute(self, missing):
+        self.computed.append(len(missing))
+        for sample, year in missing:
+            yield sample, year, {'year': year, 'landcover': 1, 'NDFI_INTP': int(sample[1:]) / 10}
+
+    def testOnlyNewSamplesAreComputed(self):
+        keys = [(f's{i}', 2010 + i % 5) for i in range(2500)]
+        with SampleStore(self.path) as store:
+            rows = cached_rows(store, 'run1', keys, self.compute, batchSize=1000)
+            self.assertEqual(self.computed, [1000, 1000, 500])
+            self.assertEqual(rows[7], {'year': 2012, 'landcover': 1, 'NDFI_INTP': 0.7})
+
+        # a later run with a grown sample set
+        grown = keys + [('s9999', 2020), ('s1', 2015)]
+        with SampleStore(self.path) as store:
+            rows = cached_rows(store, 'run1', grown, self.compute)
+            self.assertEqual(self.computed[3:], [2])
+            self.assertEqual(rows[-2]['NDFI_INTP'], 999.9)
+            # other CCDC parameters do not share rows
+            self.assertEqual(len(store.missing('run2', grown)), len(grown))
+            self.assertEqual(store.count('run1'), 2502)
+
+    def testDroppedSamplesAreStored(self):
+        def compute(missing):
+            self.computed.append(len(missing))
+            for sample, year in missing:
+                # prep drops samples outside the CCDC image
+                yield sample, year, None if sample == 's2' else {'year': year}
+
+        keys = [(f's{i}', 2010) for i in range(4)]
+        with SampleStore(self.path) as store:
+            self.assertIsNone(cached_rows(store, 'run1', keys, compute)[2])
+            self.assertEqual(cached_rows(store, 'run1', keys, compute), [{'year': 2010}] * 2 + [None, {'year': 2010}])
+        self.assertEqual(self.computed, [4])
+
+    def testGeometryKey(self):
+        point = {'type': 'Point', 'coordinates': [-62.5, -9.25]}
+        self.assertEqual(geometry_key(point), geometry_key('{"coordinates": [-62.5, -9.25], "type": "Point"}'))
+        self.assertNotEqual(geometry_key(point), geometry_key({'type': 'Point', 'coordinates': [-62.5, -9.26]}))
+
+    def testTable(self):
+        columns = table([{'a': 1, 'b': 2.5}, None, {'a': 3, 'b': None}])
+        np.testing.assert_array_equal(columns['a'], [1, 3])
+        self.assertTrue(np.isnan(columns['b'][1]))
+
+
+class PrepSamplesCachedTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        path = os.path.join(cls.tmp.name, 'algorithms.json')
+        with open(path, 'w') as f:
+            json.dump(ALGORITHMS, f)
+        session.initialize_offline(path)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def setUp(self):
+        self.store = SampleStore(os.path.join(self.tmp.name, 'samples.sqlite'))
+        self.requests = []
+
+    def tearDown(self):
+        self.store.close()
+        os.remove(self.store.path)
+
+    def run_cached(self, responses):
+        # stand-in server: answers getInfo calls in order
+        def get_info(obj):
+            self.requests.append(ee.serializer.toJSON(obj))
+            return responses.pop(0)
+        with mock.patch.object(ee.ComputedObject, 'getInfo', get_info):
+            return prep_samples_cached(self.store, 'run1', ee.FeatureCollection('users/coded/samples'), lambda fc: fc)
+
+    def feature(self, geometry, year, ndfi):
+        return {'type': 'Feature', 'geometry': json.loads(geometry),
+                'properties': {ID_PROPERTY: geometry, GEOMETRY_PROPERTY: geometry, 'year': year, 'NDFI': ndfi}}
+
+    def testOnlyMissingPairs(self):
+        a, b = point(-62.5, -9.25), point(-62.4, -9.2)
+        self.store.put_many('run1', [(geometry_key(a), 2010, {'year': 2010, 'NDFI': 1, GEOMETRY_PROPERTY: a})])
+        info = {'ids': [a, a, b], 'years': [2010, 2011, 2010], 'size': 3}
+        # the (id, year) filter also matches the stored (a, 2010), prep drops (b, 2010)
+        prepped = {'features': [self.feature(a, 2010, 99), self.feature(a, 2011, 2)]}
+        rows = self.run_cached([info, prepped])
+
+        self.assertEqual([row and row['NDFI'] for row in rows], [1, 2, None])
+        self.assertEqual(rows[1][GEOMETRY_PROPERTY], a)
+        self.assertIn('Filter.and', self.requests[1])
+        self.assertIn('2011', self.requests[1])
+        # a second run has nothing left to prep
+        self.assertEqual(self.run_cached([info]), rows)
+        self.assertEqual(len(self.requests), 3)
+
+    def testMissingYear(self):
+        info = {'ids': [point(0, 0), point(1, 1)], 'years': [2010], 'size': 2}
+        with self.assertRaises(ValueError):
+            self.run_cached([info])
+
+    def testFilterBounds(self):
+        # subsetTraining filters store prepped samples by their geometry
+        a = point(-62.5, -9.25)
+        feature = to_feature({'year': 2010, 'NDFI': 1, GEOMETRY_PROPERTY: a})
+        self.assertEqual(feature.args['geometry'].toGeoJSON(), json.loads(a))
+        self.assertNotIn(GEOMETRY_PROPERTY, feature.args['metadata'])
+        area = ee.Geometry.Polygon([[[-63, -10], [-62, -10], [-62, -9], [-63, -9]]])
+        graph = json.loads(ee.serializer.toJSON(ee.FeatureCollection([feature]).filterBounds(area)))
+        text = json.dumps(graph)
+        self.assertIn('Filter.intersects', text)
+        self.assertIn('GeometryConstructors.Point', text)
+        self.assertNotIn('"geometry": {"constantValue": null}', text)
+
+
+if __name__ == '__main__':
+    unittest.main()
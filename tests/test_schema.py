@@ -0,0 +1,59 @@
+# test_schema.py
+import unittest
+import sys
+import os
+
+container_folder = os.path.abspath(os.path.join(
+    os.path.dirname(__file__), '..'
+))
+sys.path.insert(0, container_folder)
+from coded_python.ccdc import schema
+
+BANDS = ['GV', 'Shade', 'NPV', 'Soil', 'NDFI']
+
+
+class SchemaTestCase(unittest.TestCase):
+    # expected names are the server-side results checked in ccdc.py
+    def testBuildBands(self):
+        mag = schema.magnitude_bands(5, BANDS)
+        self.assertEqual(mag[:6], ['S1_GV_MAG', 'S2_GV_MAG', 'S3_GV_MAG', 'S4_GV_MAG', 'S5_GV_MAG', 'S1_Shade_MAG'])
+        self.assertEqual(len(mag), 25)
+        self.assertEqual(schema.rmse_bands(5, BANDS)[-1], 'S5_NDFI_RMSE')
+        coefs = schema.coef_bands(5, BANDS)
+        self.assertEqual(coefs[7:10], ['S1_GV_coef_SIN3', 'S2_GV_coef_INTP', 'S2_GV_coef_SLP'])
+        self.assertEqual(len(coefs), 5 * 5 * 8)
+        self.assertEqual(schema.segment_bands(5, 'tBreak'),
+                         ['S1_tBreak', 'S2_tBreak', 'S3_tBreak', 'S4_tBreak', 'S5_tBreak'])
+        image = schema.ccd_image_bands(5, BANDS)
+        self.assertEqual(len(image), 200 + 25 + 25 + 25)
+        self.assertEqual(image[250], 'S1_tStart')
+
+    def testInputFeatures(self):
+        image = schema.ccd_image_bands(3, ['GV', 'NDFI'])
+        selected, renamed = schema.segment_input_bands(2, image)
+        self.assertEqual(selected[0], 'S2_GV_coef_INTP')
+        self.assertEqual(renamed[:8], ['GV_INTP', 'GV_SLP', 'GV_COS', 'GV_SIN', 'GV_COS2', 'GV_SIN2', 'GV_COS3', 'GV_SIN3'])
+        self.assertEqual(renamed[16:18], ['GV_RMSE', 'NDFI_RMSE'])
+        self.assertEqual(renamed[-5:], ['tStart', 'tEnd', 'tBreak', 'changeProb', 'numObs'])
+        self.assertNotIn('S1_GV_coef_INTP', selected)
+
+        # only what the predictors need
+        selected, renamed = schema.segment_input_bands(2, image, ['NDFI_INTP', 'NDFI_COS', 'NDFI_RMSE'])
+        self.assertEqual(renamed, ['GV_INTP', 'GV_SLP', 'NDFI_INTP', 'NDFI_SLP', 'NDFI_COS', 'NDFI_RMSE',
+                                   'tStart', 'tEnd'])
+        self.assertEqual(selected[4], 'S2_NDFI_coef_COS')
+        _, renamed = schema.segment_input_bands(2, image, ['NDFI_PHASE'])
+        self.assertIn('GV_SIN3', renamed)
+
+        phase, amplitude = schema.phase_amplitude_bands(renamed)
+        self.assertEqual(phase[:3], ['GV_PHASE', 'GV_PHASE2', 'GV_PHASE3'])
+        self.assertEqual(amplitude[-1], 'NDFI_AMPLITUDE3')
+
+        predictors = schema.predictor_bands(['NDFI'], ['INTP', 'RMSE', 'MAG'], ['elevation'])
+        self.assertEqual(predictors, ['NDFI_INTP', 'NDFI_RMSE', 'NDFI_MAG', 'elevation'])
+        self.assertEqual(schema.input_features(predictors), ['NDFI_INTP', 'NDFI_RMSE', 'elevation'])
+        self.assertEqual(schema.classification_bands(2), ['S1_classification', 'S2_classification'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+# test_session.py
+import unittest
+import json
+import subprocess
+import tempfile
+import threading
+import time
+import sys
+import os
+
+container_folder = os.path.abspath(os.path.join(
+    os.path.dirname(__file__), '..'
+))
+sys.path.insert(0, container_folder)
+import ee
+from coded_python.utils.session import Session, restore_session
+from coded_python.utils.tiling import run_tiles
+
+
+def signature(returns, args):
+    return {'returns': returns, 'description': '',
+            'args': [{'name': n, 'type': t, 'optional': False} for n, t in args]}
+
+
+ALGORITHMS = {
+    'Image.constant': signature('Image', [('value', 'Object')]),
+    'Image.add': signature('Image', [('image1', 'Image'), ('image2', 'Image')]),
+}
+
+
+def worker_session(job):
+    # runs in a spawned worker process
+    from coded_python.utils.session import session
+    graph = json.loads(ee.serializer.toJSON(ee.Image.constant(job).add(2)))
+    return session.initialized, session.offline, graph['values']['0']['functionInvocationValue']['functionName']
+
+
+class SessionTestCase(unittest.TestCase):
+    def testImportDoesNotInitialize(self):
+        probe = ('import ee\n'
+                 'ee.Initialize = None\n'
+                 'import coded_python.api, coded_python.api_v2, coded_python.utils.exporting\n'
+                 'print(ee.data.is_initialized())\n')
+        out = subprocess.run([sys.executable, '-c', probe], cwd=container_folder,
+                             capture_output=True, text=True)
+        self.assertEqual(out.returncode, 0, out.stderr)
+        self.assertEqual(out.stdout.strip(), 'False')
+
+    def testOffline(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'algorithms.json')
+            with open(path, 'w') as f:
+                json.dump(ALGORITHMS, f)
+            session = Session()
+            session.initialize_offline(path)
+            self.assertTrue(session.initialized and session.offline)
+            graph = json.loads(ee.serializer.toJSON(ee.Image.constant(1).add(2)))
+            self.assertEqual(graph['values']['0']['functionInvocationValue']['functionName'], 'Image.add')
+
+    def testUsesInitializedClient(self):
+        # the caller ran ee.Initialize(project=...) itself, as main.py does
+        calls = []
+        initialize, ee.Initialize = ee.Initialize, lambda *args, **kwargs: calls.append(kwargs)
+        initialized, ee.data.is_initialized = ee.data.is_initialized, lambda: True
+        try:
+            session = Session()
+            session.ensure()
+        finally:
+            ee.Initialize, ee.data.is_initialized = initialize, initialized
+        self.assertTrue(session.initialized)
+        self.assertEqual(calls, [])
+        # workers get the project and credentials of the caller's client
+        self.assertEqual(session.settings()['kwargs']['project'], ee.data._get_state().cloud_api_user_project)
+
+    def testRestore(self):
+        calls = []
+        initialize, ee.Initialize = ee.Initialize, lambda *args, **kwargs: calls.append(kwargs)
+        try:
+            session = Session()
+            session.initialize(project='coded-project', credentials='token')
+            worker = Session()
+            worker.restore(session.settings())
+        finally:
+            ee.Initialize = initialize
+        self.assertEqual(calls, [{'project': 'coded-project', 'credentials': 'token'}] * 2)
+        self.assertTrue(worker.initialized and not worker.offline)
+
+    def testWorkerProcesses(self):
+        # spawned tile workers start without ee set-up and restore the caller's
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'algorithms.json')
+            with open(path, 'w') as f:
+                json.dump(ALGORITHMS, f)
+            session = Session()
+            session.initialize_offline(path)
+            states = list(run_tiles(worker_session, [0, 1], workers=2, initializer=restore_session,
+                                    initargs=(session.settings(),)))
+        self.assertEqual(states, [(True, True, 'Image.add')] * 2)
+
+    def testConcurrentFirstCalls(self):
+        session = Session()
+        calls, seen = [], []
+
+        def slow_initialize(**kwargs):
+            calls.append(threading.get_ident())
+            time.sleep(.1)
+            session.initialized = True
+
+        session.initialize = slow_initialize
+
+        def first_call():
+            session.ensure()
+            seen.append(session.initialized)
+
+        threads = [threading.Thread(target=first_call) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(seen, [True] * 4)
+
+    def testOfflineNeedsCatalogue(self):
+        with self.assertRaises(FileNotFoundError):
+            Session().initialize_offline('/nonexistent/algorithms.json')
+
+
+if __name__ == '__main__':
+    unittest.main()
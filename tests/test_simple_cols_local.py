@@ -0,0 +1,144 @@
+# test_simple_cols_local.py
+import unittest
+import sys
+import os
+from types import SimpleNamespace
+
+import numpy as np
+
+container_folder = os.path.abspath(os.path.join(
+    os.path.dirname(__file__), '..'
+))
+sys.path.insert(0, container_folder)
+from coded_python.image_collections.simple_cols_local import (QA_SPECS, calc_ndfi_stack, erode,
+                                                              prepare_landsat_stack, unmix_operator)
+
+# same values as simple_cols.NDFIParams defaults
+NDFI_PARAMS = SimpleNamespace(
+    bands=['BLUE', 'GREEN', 'RED', 'NIR', 'SWIR1', 'SWIR2'],
+    gv=[.0500, .0900, .0400, .6100, .3000, .1000],
+    shade=[0, 0, 0, 0, 0, 0],
+    npv=[.1400, .1700, .2200, .3000, .5500, .3000],
+    soil=[.2000, .3000, .3400, .5800, .6000, .5800],
+    cloud=[.9000, .9600, .8000, .7800, .7200, .6500],
+)
+ENDMEMBERS = np.array([NDFI_PARAMS.gv, NDFI_PARAMS.shade, NDFI_PARAMS.npv,
+                       NDFI_PARAMS.soil, NDFI_PARAMS.cloud]).T
+
+
+class UnmixTestCase(unittest.TestCase):
+    def testOperatorIsCached(self):
+        self.assertIs(unmix_operator(NDFI_PARAMS)[0], unmix_operator(NDFI_PARAMS)[0])
+
+    def testRecoversFractions(self):
+        fractions = np.array([[.5, .2, .2, .1, 0], [.3, 0, .3, .4, 0], [.1, 0, 0, 0, .9]])
+        # (time, band, y, x) stack with one pixel per fraction mix
+        stack = (ENDMEMBERS @ fractions.T)[None, :, None, :].repeat(4, axis=0)
+        out = calc_ndfi_stack(stack, NDFI_PARAMS)
+        self.assertEqual(out.shape, (4, 5, 1, 3))
+        self.assertEqual(out.dtype, np.float32)
+        np.testing.assert_allclose(out[0, :4, 0, 0], fractions[0, :4], atol=1e-5)
+        gvs = .5 / (1 - .2)
+        self.assertAlmostEqual(float(out[0, 4, 0, 0]), (gvs - .3) / (gvs + .3), places=5)
+        np.testing.assert_allclose(out[0, 4, 0, 1], -.4 / 1., atol=1e-5)
+        # cloudy pixels are masked
+        self.assertTrue(np.isnan(out[:, :, 0, 2]).all())
+
+    def testSelectsBands(self):
+        stack = (ENDMEMBERS @ np.array([.5, .2, .2, .1, 0]))[None, :, None]
+        thermal = np.full((1, 1, 1), 300.)
+        stack = np.concatenate([thermal, stack], axis=1)
+        out = calc_ndfi_stack(stack, NDFI_PARAMS, bands=['TEMP'] + NDFI_PARAMS.bands)
+        self.assertAlmostEqual(float(out[0, 0, 0]), .5, places=5)
+
+    def testConstrained(self):
+        rng = np.random.default_rng(1)
+        # a pure forest pixel plus mixes with noise, most of which need the constraints
+        pixels = np.vstack([ENDMEMBERS[:, 0],
+                            rng.dirichlet(np.ones(5) * .5, 400) @ ENDMEMBERS.T + rng.normal(0, .03, (400, 6))])
+        out = calc_ndfi_stack(pixels.T[None], NDFI_PARAMS, cloudThreshold=2)[0]
+        expected = np.array([reference_unmix(p) for p in pixels])
+        np.testing.assert_allclose(out[:4].T, expected[:, :4], atol=1e-4)
+        self.assertAlmostEqual(float(out[4, 0]), 1, places=5)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            gvs = expected[:, 0] / (1 - expected[:, 1])
+            ndfi = (gvs - expected[:, 2] - expected[:, 3]) / (gvs + expected[:, 2] + expected[:, 3])
+        np.testing.assert_allclose(out[4], ndfi, atol=1e-3)
+        self.assertTrue((out[:4] >= 0).all())
+
+
+def reference_unmix(pixel):
+    # exact sum-to-one, non-negative least squares: best feasible solution over
+    # every subset of endmembers
+    best, error = None, np.inf
+    for code in range(1, 32):
+        members = [i for i in range(5) if code >> i & 1]
+        E = ENDMEMBERS[:, members]
+        n = len(members)
+        kkt = np.block([[E.T @ E, np.ones((n, 1))], [np.ones((1, n)), np.zeros((1, 1))]])
+        solved = np.linalg.lstsq(kkt, np.append(E.T @ pixel, 1), rcond=None)[0][:n]
+        if (solved < -1e-9).any():
+            continue
+        residual = ((E @ solved - pixel) ** 2).sum()
+        if residual < error:
+            best, error = np.zeros(5), residual
+            best[members] = solved
+    return best
+
+
+
+def reference_mask(spec, bands, pixel_qa, radsat_qa, opacity=None, aerosol=None):
+    # pixel by pixel, as the ee prepare functions read
+    valid = np.isin(pixel_qa, spec.validQA) & (radsat_qa == 0) & (bands > 0).all(axis=1)
+    if spec.maxValue is not None:
+        valid &= (bands < spec.maxValue).all(axis=1)
+    if spec.maxOpacity is not None:
+        valid &= opacity < spec.maxOpacity
+    if spec.validAerosol:
+        valid &= np.isin(aerosol, spec.validAerosol)
+    return valid
+
+
+class QAMaskTestCase(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        shape = (5, 6, 7)
+        self.bands = rng.integers(-100, 10500, (shape[0], 7) + shape[1:]).astype(np.int16)
+        self.bands[:, :6] = rng.integers(1, 9000, self.bands[:, :6].shape)
+        self.pixel_qa = rng.choice([66, 130, 68, 132, 72, 322, 386, 900, 4000], shape).astype(np.uint16)
+        self.radsat_qa = (rng.random(shape) < .1).astype(np.uint16)
+        self.opacity = rng.integers(-1, 400, shape).astype(np.int16)
+        self.aerosol = rng.choice([66, 68, 96, 164, 194, 228], shape).astype(np.uint8)
+
+    def testMatchesReference(self):
+        for sensor in ('L5', 'L8'):
+            spec = QA_SPECS[sensor]
+            out = prepare_landsat_stack(sensor, self.bands, self.pixel_qa, self.radsat_qa, self.opacity,
+                                        self.aerosol, chunkSize=2)
+            valid = reference_mask(spec, self.bands, self.pixel_qa, self.radsat_qa, self.opacity, self.aerosol)
+            self.assertEqual(out.dtype, np.float32)
+            np.testing.assert_array_equal(~np.isnan(out[:, 0]), valid)
+            self.assertTrue(np.isnan(out.transpose(1, 0, 2, 3)[:, ~valid]).all())
+            scaled = self.bands / np.array([1e4] * 6 + [1e3])[None, :, None, None]
+            np.testing.assert_allclose(out.transpose(1, 0, 2, 3)[:, valid],
+                                       scaled.transpose(1, 0, 2, 3)[:, valid], rtol=1e-6)
+
+    def testL8NeedsAerosol(self):
+        with self.assertRaises(ValueError):
+            prepare_landsat_stack('L8', self.bands, self.pixel_qa, self.radsat_qa)
+
+    def testL7Erodes(self):
+        valid = np.ones((1, 9, 9), dtype=bool)
+        valid[0, 4, 4] = False
+        eroded = erode(valid, 2)
+        self.assertEqual(int((~eroded).sum()), 25)
+        self.assertTrue((~eroded[0, 2:7, 2:7]).all())
+
+        qa = np.where(valid, 66, 0).astype(np.uint16)
+        bands = np.full((1, 7, 9, 9), 500, dtype=np.int16)
+        out = prepare_landsat_stack('L7', bands, qa, np.zeros_like(qa), np.zeros_like(qa))
+        np.testing.assert_array_equal(np.isnan(out[0, 0]), ~eroded[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
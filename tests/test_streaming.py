@@ -0,0 +1,136 @@
+# test_streaming.py
+import unittest
+import threading
+import time
+import sys
+import os
+from types import SimpleNamespace
+
+import numpy as np
+
+container_folder = os.path.abspath(os.path.join(
+    os.path.dirname(__file__), '..'
+))
+sys.path.insert(0, container_folder)
+from coded_python.ccdc.ccdc_local import run_ccdc_local, to_ccdc_dates, update_ccdc_local
+from coded_python.image_collections.simple_cols_local import calc_ndfi_stack, prepare_landsat_stack
+from coded_python.image_collections.streaming import (Scene, add_indices, mask_scenes, prefetch, select_bands,
+                                                      stream_ccdc)
+
+NDFI_PARAMS = SimpleNamespace(
+    bands=['BLUE', 'GREEN', 'RED', 'NIR', 'SWIR1', 'SWIR2'],
+    gv=[.0500, .0900, .0400, .6100, .3000, .1000],
+    shade=[0, 0, 0, 0, 0, 0],
+    npv=[.1400, .1700, .2200, .3000, .5500, .3000],
+    soil=[.2000, .3000, .3400, .5800, .6000, .5800],
+    cloud=[.9000, .9600, .8000, .7800, .7200, .6500],
+)
+CHANGE = {'lambda': 20 / 10000, 'minObservations': 3, 'chiSquareProbability': .9}
+
+
+def make_scenes(nt=200, ny=4, nx=5, seed=0):
+    # raw Landsat 5 tiles with a seasonal NIR and SWIR1, the first row of pixels
+    # drops after 2010, clouds are flagged in pixel_qa
+    rng = np.random.default_rng(seed)
+    days = np.sort(rng.choice(np.arange(7300), nt, replace=False))
+    dates = np.datetime64('2000-01-01') + days.astype('timedelta64[D]')
+    t = to_ccdc_dates(dates)
+    reflectance = 0.5 + 0.1 * np.cos(2 * np.pi * t)[:, None, None, None] + rng.normal(0, 0.01, (nt, 2, ny, nx))
+    reflectance[t > 2010, :, 0] -= 0.3
+    cloudy = rng.random((nt, ny, nx)) < 0.2
+    raw = np.full((nt, 7, ny, nx), 500, dtype=np.int16)
+    raw[:, 3:5] = np.rint(reflectance * 10000)
+    pixel_qa = np.where(cloudy, 72, 66).astype(np.uint16)
+    radsat_qa = np.zeros_like(pixel_qa)
+    opacity = np.full(pixel_qa.shape, -1, dtype=np.int16)
+    scenes = [Scene(date=d, sensor='L5', bands=raw[k],
+                    qa={'pixel_qa': pixel_qa[k], 'radsat_qa': radsat_qa[k], 'sr_atmos_opacity': opacity[k]})
+              for k, d in enumerate(dates)]
+    prepared = prepare_landsat_stack('L5', raw, pixel_qa, radsat_qa, opacity)
+    return scenes, prepared, dates
+
+
+class PrefetchTestCase(unittest.TestCase):
+    def testOrderAndBound(self):
+        produced = []
+
+        def produce():
+            for k in range(20):
+                produced.append(k)
+                yield k
+
+        stream = prefetch(produce(), depth=3)
+        self.assertEqual(next(stream), 0)
+        time.sleep(.3)
+        # one item handed out, depth queued and at most one waiting to be queued
+        self.assertLessEqual(len(produced), 1 + 3 + 1)
+        self.assertEqual(list(stream), list(range(1, 20)))
+
+    def testErrorsReachTheConsumer(self):
+        def produce():
+            yield 1
+            raise OSError('unreadable scene')
+
+        with self.assertRaises(OSError):
+            list(prefetch(produce()))
+
+    def testEarlyStopReleasesProducer(self):
+        before = threading.active_count()
+        stream = prefetch(iter(range(1000)), depth=1)
+        next(stream)
+        stream.close()
+        self.assertEqual(threading.active_count(), before)
+
+
+class StreamingTestCase(unittest.TestCase):
+    def testMatchesBatchFit(self):
+        scenes, prepared, dates = make_scenes()
+        bands = ['NIR', 'SWIR1']
+        expected = run_ccdc_local(prepared[:, 3:5], dates, bands, CHANGE, chunkSize=7)
+        fit = stream_ccdc(iter(scenes), bands, CHANGE, prefetchDepth=4, chunkSize=7)
+        np.testing.assert_array_equal(fit.offsets, expected.offsets)
+        for name in expected.keys():
+            np.testing.assert_array_equal(fit[name], expected[name])
+        self.assertTrue((fit.nSegments()[0] == 2).all())
+
+    def testFlushesIncrementally(self):
+        scenes, prepared, dates = make_scenes()
+        bands = ['NIR', 'SWIR1']
+        state = run_ccdc_local(prepared[:120, 3:5], dates[:120], bands, CHANGE, keepState=True)
+        state = update_ccdc_local(state, prepared[120:, 3:5], dates[120:])
+        fit = stream_ccdc(scenes, bands, CHANGE, prefetchDepth=0, flushEvery=120)
+        for name in state.fit.keys():
+            np.testing.assert_array_equal(fit[name], state.fit[name])
+
+    def testSameDateScenes(self):
+        # two overlapping rows of one path give two scenes of the same date
+        scenes, _, _ = make_scenes()
+        scenes.insert(120, scenes[119])
+        bands = ['NIR', 'SWIR1']
+        expected = stream_ccdc(scenes, bands, CHANGE, prefetchDepth=0)
+        fit = stream_ccdc(scenes, bands, CHANGE, prefetchDepth=0, flushEvery=120)
+        for name in expected.keys():
+            np.testing.assert_array_equal(fit[name], expected[name])
+
+    def testStages(self):
+        scenes, prepared, _ = make_scenes(nt=5)
+        rng = np.random.default_rng(3)
+        qa60 = np.where(rng.random((4, 5)) < .3, 1 << 10, 0)
+        s2 = Scene(date='2020-05-01', sensor='S2', bands=rng.integers(100, 5000, (6, 4, 5)), qa={'QA60': qa60})
+
+        observations = list(mask_scenes(scenes + [s2]))
+        np.testing.assert_array_equal(observations[2].values, prepared[2])
+        self.assertTrue(np.isnan(observations[-1].values[:, qa60 > 0]).all())
+        np.testing.assert_allclose(observations[-1].values[:, qa60 == 0], s2.bands[:, qa60 == 0] / 10000,
+                                   rtol=1e-6)
+
+        indexed = list(select_bands(add_indices(observations, NDFI_PARAMS), ['NDFI', 'NIR']))
+        self.assertEqual(indexed[0].bandNames, ['NDFI', 'NIR'])
+        expected = calc_ndfi_stack(prepared[:1], NDFI_PARAMS, bands=observations[0].bandNames)
+        np.testing.assert_array_equal(indexed[0].band('NDFI'), expected[0, 4])
+        with self.assertRaises(ValueError):
+            list(select_bands(observations[-1:], ['TEMP']))
+
+
+if __name__ == '__main__':
+    unittest.main()
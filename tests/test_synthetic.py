@@ -0,0 +1,92 @@
+# test_synthetic.py
+import unittest
+import sys
+import os
+
+import numpy as np
+
+container_folder = os.path.abspath(os.path.join(
+    os.path.dirname(__file__), '..'
+))
+sys.path.insert(0, container_folder)
+from coded_python.ccdc.ccdc_local import run_ccdc_local
+from coded_python.data.synthetic import (BANDS, DEFORESTATION, DEGRADATION, FOREST, NON_FOREST, SLC_OFF,
+                                         SyntheticLandsat, landsat_dates)
+
+
+class LandsatDatesTestCase(unittest.TestCase):
+    def testRevisit(self):
+        dates, sensors = landsat_dates('2000-01-01', '2016-01-01')
+        self.assertTrue((np.diff(dates) >= np.timedelta64(0, 'D')).all())
+        for sensor in ('LANDSAT_5', 'LANDSAT_7', 'LANDSAT_8'):
+            days = dates[sensors == sensor]
+            self.assertTrue((np.diff(days) == np.timedelta64(16, 'D')).all())
+        l7, l8 = dates[sensors == 'LANDSAT_7'], dates[sensors == 'LANDSAT_8']
+        self.assertEqual(int((l8[0] - l7[0]).astype(int) % 16), 8)
+        self.assertFalse((sensors[dates > np.datetime64('2011-11-18')] == 'LANDSAT_5').any())
+        self.assertFalse((sensors[dates < np.datetime64('2013-04-11')] == 'LANDSAT_8').any())
+
+
+class SyntheticLandsatTestCase(unittest.TestCase):
+    def setUp(self):
+        self.synth = SyntheticLandsat(shape=(24, 20), start='2000-01-01', end='2010-01-01', seed=3,
+                                      tileSize=(16, 16), degradation=.3, deforestation=.3)
+
+    def testDeterministic(self):
+        stack, truth = self.synth.tile(1, 0)
+        again, truthAgain = SyntheticLandsat(shape=(24, 20), start='2000-01-01', end='2010-01-01', seed=3,
+                                             tileSize=(16, 16), degradation=.3, deforestation=.3).tile(1, 0)
+        np.testing.assert_array_equal(stack, again)
+        for name in truth:
+            np.testing.assert_array_equal(truth[name], truthAgain[name])
+        self.assertEqual(stack.shape, (len(self.synth.dates), len(BANDS), 8, 16))
+        self.assertEqual(stack.dtype, np.float32)
+
+        other, _ = SyntheticLandsat(shape=(24, 20), seed=4, tileSize=(16, 16)).tile(1, 0)
+        self.assertFalse(np.array_equal(other[:len(stack)], stack, equal_nan=True))
+
+    def testTruthAndMaskIgnoreTiling(self):
+        whole, truth = self.synth.generate()
+        tiled = SyntheticLandsat(shape=(24, 20), start='2000-01-01', end='2010-01-01', seed=3, tileSize=(5, 7),
+                                 degradation=.3, deforestation=.3)
+        for i, j, ys, xs in tiled.tiles():
+            stack, tileTruth = tiled.tile(i, j)
+            for name in truth:
+                np.testing.assert_array_equal(tileTruth[name], truth[name][ys, xs])
+            np.testing.assert_array_equal(np.isnan(stack[:, 0]), np.isnan(whole[:, 0, ys, xs]))
+
+    def testTruth(self):
+        stack, truth = self.synth.generate()
+        kinds = truth['breakType']
+        self.assertTrue({0, DEGRADATION, DEFORESTATION} <= set(np.unique(kinds)))
+        self.assertTrue((truth['classBefore'][kinds != 0] == FOREST).all())
+        self.assertTrue((truth['classAfter'][kinds == DEFORESTATION] == NON_FOREST).all())
+        self.assertTrue((truth['breakDate'][kinds == 0] == 0).all())
+        breaks = truth['breakDate'][kinds != 0]
+        self.assertTrue(((breaks >= 2003) & (breaks <= 2008)).all())
+
+        # masked observations are NaN in every band, around the requested cover
+        masked = np.isnan(stack).all(axis=1)
+        self.assertTrue((np.isnan(stack).any(axis=1) == masked).all())
+        self.assertLess(abs(masked.mean() - .3), .1)
+        slcOff = (self.synth.satellites == 'LANDSAT_7') & (self.synth.dates > SLC_OFF)
+        self.assertGreater(masked[slcOff].mean(), masked[~slcOff].mean() + .1)
+
+        ndfi = stack[:, BANDS.index('NDFI')]
+        years = self.synth.dates.astype('datetime64[Y]').astype(int) + 1970
+        y, x = np.argwhere(kinds == DEFORESTATION)[0]
+        year = int(truth['breakDate'][y, x])
+        self.assertGreater(np.nanmean(ndfi[years < year, y, x]) - np.nanmean(ndfi[years > year + 1, y, x]), .5)
+
+    def testCcdcFindsBreaks(self):
+        stack, truth = self.synth.generate()
+        bands = ['NDFI', 'GV']
+        change = {'lambda': 20 / 10000, 'minObservations': 6, 'chiSquareProbability': .99}
+        fit = run_ccdc_local(stack[:, [BANDS.index(b) for b in bands]], self.synth.dates, bands, change)
+        cleared = np.flatnonzero(truth['breakType'].reshape(-1) == DEFORESTATION)
+        tBreak = fit['tBreak'][fit.offsets[cleared]]
+        np.testing.assert_allclose(tBreak, truth['breakDate'].reshape(-1)[cleared], atol=.25)
+
+
+if __name__ == '__main__':
+    unittest.main()
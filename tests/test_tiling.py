@@ -0,0 +1,80 @@
+# test_tiling.py
+import unittest
+import math
+import sys
+import os
+
+import numpy as np
+
+container_folder = os.path.abspath(os.path.join(
+    os.path.dirname(__file__), '..'
+))
+sys.path.insert(0, container_folder)
+from coded_python.utils.tiling import Grid, run_tiles, stitch, tile_counts, tile_shape, tile_slices
+from coded_python.api_v2 import post_process_arrays
+
+
+class GridTestCase(unittest.TestCase):
+    def testFromBounds(self):
+        grid = Grid.from_bounds((95, 10, 1000, 701), 'EPSG:3857', 30, tileSize=10)
+        self.assertEqual((grid.originX, grid.originY), (90, 720))
+        self.assertEqual(grid.shape, (24, 31))
+        tiles = grid.tiles()
+        self.assertEqual(len(tiles), 3 * 4)
+        self.assertEqual((tiles[-1].height, tiles[-1].width), (4, 1))
+        self.assertEqual(grid.tile_bounds(tiles[0]), [90, 420, 390, 720])
+        transform = grid.pixel_grid(tiles[1])['affineTransform']
+        self.assertEqual((transform['translateX'], transform['translateY']), (390, 720))
+
+    def testPixelIndex(self):
+        grid = Grid.from_bounds((0, 0, 100, 60), 'EPSG:3857', 30)
+        rows, cols = grid.pixel_index([1, 89, -5], [59, 31, 10])
+        np.testing.assert_array_equal(rows, [0, 0, 1])
+        np.testing.assert_array_equal(cols, [0, 2, -1])
+
+    def testStitch(self):
+        grid = Grid.from_bounds((0, 0, 5, 3), 'EPSG:3857', 1, tileSize=2)
+        results = [(tile, {'Stratification': (['stratification'],
+                                              np.full((1, tile.height, tile.width), i + 1))})
+                   for i, tile in enumerate(grid.tiles())]
+        out = stitch(grid, results)
+        expected = np.array([[1, 1, 2, 2, 3], [1, 1, 2, 2, 3], [4, 4, 5, 5, 6]])
+        np.testing.assert_array_equal(out.layers['Stratification'][0], expected)
+        self.assertEqual(out.bandNames['Stratification'], ['stratification'])
+
+    def testTileSlices(self):
+        # rectangular tiles, as the local stores and SyntheticLandsat use them
+        tiles = list(tile_slices((5, 7), (2, 3)))
+        self.assertEqual(tile_counts((5, 7), (2, 3)), (3, 3))
+        self.assertEqual([(i, j) for i, j, _, _ in tiles[:4]], [(0, 0), (0, 1), (0, 2), (1, 0)])
+        self.assertEqual(tiles[-1][2:], (slice(4, 5), slice(6, 7)))
+        self.assertEqual(tile_shape((5, 7), (2, 3), 2, 2), (1, 1))
+        covered = np.zeros((5, 7), dtype=int)
+        for _, _, ys, xs in tiles:
+            covered[ys, xs] += 1
+        self.assertTrue((covered == 1).all())
+
+    def testRunTiles(self):
+        self.assertEqual(list(run_tiles(math.sqrt, [1, 4, 9], workers=2)), [1, 2, 3])
+        self.assertEqual(list(run_tiles(math.sqrt, [16], workers=1)), [4])
+
+
+class PostProcessArraysTestCase(unittest.TestCase):
+    def testPostProcess(self):
+        # pixels: stable forest, degradation, deforestation, both, break outside the period, masked
+        bands = ['S2_classification', 'S3_classification']
+        classification = np.array([[0, 1, 2, 1, 1, 0], [0, 0, 0, 2, 0, 0]], dtype=np.float32)[:, None]
+        tBreak = np.array([[0, 2012.5, 2014.2, 2011, 2020.1, 0], [0, 0, 0, 2015, 0, 0]],
+                          dtype=np.float32)[:, None]
+        mask = np.array([[1, 1, 1, 1, 1, -1]], dtype=np.float32)[:, None]
+        stage = {'classification': (bands, classification), 'tBreak': (['S1_tBreak', 'S2_tBreak'], tBreak),
+                 'mask': (['mask'], mask)}
+        post = post_process_arrays(stage, 2010, 2016, forestValue=1)
+        np.testing.assert_array_equal(post['Stratification'][1][0, 0], [1, 3, 4, 5, 1, 0])
+        np.testing.assert_array_equal(post['Degradation'][1][0, 0], [0, 1, 0, 0, 0, 0])
+        np.testing.assert_array_equal(post['dateOfDeforestation'][1][:, 0, 3], [0, 2015])
+        self.assertEqual(post['dateOfDegradation'][0], bands)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+# test_tracing.py
+import unittest
+import json
+import tempfile
+import time
+import sys
+import os
+
+import numpy as np
+
+container_folder = os.path.abspath(os.path.join(
+    os.path.dirname(__file__), '..'
+))
+sys.path.insert(0, container_folder)
+from coded_python.utils.tracing import NULL_SPAN, Tracer, peak_rss, span
+
+
+class TracerTestCase(unittest.TestCase):
+    def testSpans(self):
+        tracer = Tracer()
+        with span(tracer, 'tile', row=1, col=2):
+            with span(tracer, 'Ccdc') as stage:
+                buffer = np.ones(2 ** 22)
+                stage.add_bytes(buffer.nbytes)
+                time.sleep(.02)
+        inner, outer = tracer.events
+        self.assertEqual((inner['name'], outer['name']), ('Ccdc', 'tile'))
+        self.assertEqual(inner['ph'], 'X')
+        self.assertGreaterEqual(inner['dur'], 20000)
+        self.assertLessEqual(outer['ts'], inner['ts'])
+        self.assertGreaterEqual(outer['ts'] + outer['dur'], inner['ts'] + inner['dur'])
+        self.assertEqual(inner['args']['bytes'], 2 ** 25)
+        self.assertEqual(outer['args']['bytes'], 0)
+        self.assertEqual((outer['args']['row'], outer['args']['col']), (1, 2))
+        self.assertGreaterEqual(inner['args']['cpuSeconds'], 0)
+        if peak_rss():
+            self.assertGreaterEqual(inner['args']['peakRss'], inner['args']['rssGrowth'])
+
+    def testErrorsStillRecorded(self):
+        tracer = Tracer()
+        with self.assertRaises(ValueError):
+            with tracer.span('prep_samples'):
+                raise ValueError('no training data')
+        self.assertEqual([e['name'] for e in tracer.events], ['prep_samples'])
+
+    def testDisabled(self):
+        self.assertIs(span(None, 'Ccdc', row=0), NULL_SPAN)
+        with span(None, 'Ccdc') as stage:
+            stage.add_bytes(10)
+
+    def testExport(self):
+        tracer, worker = Tracer(), Tracer()
+        for _ in range(2):
+            with tracer.span('buildCcdImage'):
+                pass
+        with worker.span('computePixels') as download:
+            download.add_bytes(100)
+        tracer.merge(worker.events)
+
+        summary = tracer.summary()
+        self.assertEqual(list(summary), ['buildCcdImage', 'computePixels'])
+        self.assertEqual(summary['buildCcdImage']['calls'], 2)
+        self.assertEqual(summary['computePixels']['bytes'], 100)
+        lines = tracer.table().splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[2].startswith('computePixels'))
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'trace.json')
+            tracer.to_chrome_trace(path)
+            with open(path) as f:
+                trace = json.load(f)
+        events = trace['traceEvents']
+        self.assertEqual(len(events), 3)
+        self.assertEqual([e['ts'] for e in events], sorted(e['ts'] for e in events))
+        self.assertTrue(all({'name', 'ph', 'ts', 'dur', 'pid', 'tid', 'args'} <= set(e) for e in events))
+
+
+if __name__ == '__main__':
+    unittest.main()